@@ -55,3 +55,44 @@ class LargePanelMixin(object):
         context.update({"panel_width": 8, "panel_offset": 2})
 
         return context
+
+
+class EagerLoadingSerializerMixin(object):
+    """
+    Declare the related objects a serializer reads for each instance.
+
+    Views using EagerLoadingMixin apply these to their queryset so that lists
+    don't issue a query per row.
+    """
+
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        """
+        Return the queryset with this serializer's related objects loaded.
+        """
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*cls.prefetch_related_fields)
+
+        return queryset
+
+
+class EagerLoadingMixin(object):
+    """
+    Load the related objects declared by the view's serializer class.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+
+        serializer_class = self.get_serializer_class()
+
+        if hasattr(serializer_class, "setup_eager_loading"):
+            queryset = serializer_class.setup_eager_loading(queryset)
+
+        return queryset
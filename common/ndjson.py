@@ -0,0 +1,92 @@
+from itertools import islice
+
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+
+def ndjson_lines(rows):
+    """
+    Encode each row as a single line of JSON.
+    """
+    encoder = JSONEncoder(ensure_ascii=False)
+
+    for row in rows:
+        yield encoder.encode(row) + "\n"
+
+
+def ndjson_response(rows):
+    """
+    Return a StreamingHttpResponse that writes rows as newline-delimited JSON
+    as they're generated.
+    """
+    return StreamingHttpResponse(ndjson_lines(rows), content_type=NDJSON_CONTENT_TYPE)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Render a list as newline-delimited JSON, one item per line.
+
+    List views using NDJSONStreamingMixin stream their results instead, so this
+    only renders other responses (e.g. errors) in the requested format.
+    """
+
+    media_type = NDJSON_CONTENT_TYPE
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        rows = data if isinstance(data, list) else [data]
+
+        return "".join(ndjson_lines(rows)).encode(self.charset)
+
+
+class NDJSONStreamingMixin(object):
+    """
+    Stream every result of a list view as newline-delimited JSON when requested
+    with ?format=ndjson.
+
+    The queryset is read from the database and serialized in chunks, so memory
+    use doesn't grow with the number of results. Results aren't paginated.
+    """
+
+    ndjson_chunk_size = 1000
+
+    def get_renderers(self):
+        return super().get_renderers() + [NDJSONRenderer()]
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != NDJSONRenderer.format:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+
+        return ndjson_response(self.get_ndjson_rows(queryset))
+
+    def get_ndjson_rows(self, queryset):
+        # QuerySet.iterator() ignores prefetch_related(), so prefetch for each
+        # chunk instead.
+        lookups = queryset._prefetch_related_lookups
+        results = queryset.prefetch_related(None).iterator(
+            chunk_size=self.ndjson_chunk_size
+        )
+
+        while True:
+            chunk = list(islice(results, self.ndjson_chunk_size))
+
+            if not chunk:
+                return
+
+            prefetch_related_objects(chunk, *lookups)
+
+            for row in self.get_serializer(chunk, many=True).data:
+                # Rows hidden by the serializer come back empty
+                if row:
+                    yield row
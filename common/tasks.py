@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from django.core.mail.message import EmailMultiAlternatives
 from django.template import engines
 from django.template.loader import render_to_string
@@ -6,7 +7,11 @@ from django.urls import reverse
 from celery import shared_task
 from celery.utils.log import get_task_logger
 
+import requests
+
 from common.utils import full_url
+from open_humans.models import BlogPost
+from open_humans.notebooks import refresh_notebooks
 from private_sharing.models import DataRequestProject, DataRequestProjectMember
 
 logger = get_task_logger(__name__)
@@ -56,3 +61,27 @@ def send_emails(project_id, project_members, subject, message, all_members=False
             headers=headers,
         )
         mail.send()
+
+
+@shared_task
+def refresh_blog_posts():
+    """
+    Fetch the blog's feed and cache the recent posts shown on the home page.
+    """
+    try:
+        BlogPost.fetch_recent()
+    except (requests.RequestException, KeyError, TypeError) as error:
+        logger.warning("Unable to refresh blog posts: {0}".format(error))
+    finally:
+        cache.delete(BlogPost.REFRESH_QUEUED_KEY)
+
+
+@shared_task
+def refresh_project_notebooks():
+    """
+    Fetch the notebook listings shown on approved projects' activity pages.
+    """
+    projects = DataRequestProject.objects.filter(approved=True, active=True)
+    refreshed = refresh_notebooks(projects.order_by("id"))
+
+    logger.info("Refreshed notebooks for {0} projects".format(refreshed))
@@ -1,3 +1,4 @@
+import functools
 import random
 import string as string_module  # pylint: disable=deprecated-module
 import urllib.parse
@@ -5,6 +6,7 @@ import urllib.parse
 from django.apps import apps
 from django.conf import settings
 from django.http import QueryDict
+from django.urls import get_script_prefix, get_urlconf, reverse
 
 
 # TODO: Remove legacy apps and this filtering step.
@@ -49,6 +51,34 @@ def full_url(url_fragment):
     )
 
 
+# Reversed in place of the pk and then swapped for the real one; it needs to
+# match the URL patterns' pk regex and never occur in a URL by chance.
+URL_PK_PLACEHOLDER = "8675309867530986753"
+
+
+@functools.lru_cache(maxsize=None)
+def _pk_url_template(name, script_prefix, urlconf):
+    """
+    Reverse a URL name once, returning a template to format with a pk.
+    """
+    url = reverse(name, urlconf=urlconf, kwargs={"pk": URL_PK_PLACEHOLDER})
+
+    return url.replace("{", "{{").replace("}", "}}").replace(URL_PK_PLACEHOLDER, "{0}")
+
+
+def reverse_pk(name, pk, full=False):
+    """
+    Equivalent to reverse(name, kwargs={"pk": pk}), but resolves the URLconf
+    only once per URL name. Used when serializing lists of hyperlinks.
+    """
+    url = _pk_url_template(name, get_script_prefix(), get_urlconf()).format(pk)
+
+    if full:
+        return full_url(url)
+
+    return url
+
+
 def get_source_labels_and_configs():
     """
     Return a list of all current data source app labels and names.
@@ -0,0 +1,127 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import DataFile, NewDataFileAccessLog
+from .serializers import serialize_datafiles_to_dicts
+
+logger = logging.getLogger(__name__)
+
+
+def write_access_logs(records):
+    """
+    Create NewDataFileAccessLogs for a batch of buffered records.
+
+    The datafiles are loaded and serialized together, so the whole batch costs a
+    handful of queries and a single INSERT.
+    """
+    datafiles = (
+        DataFile.objects.select_related(
+            "parent_project_data_file__direct_sharing_project"
+        )
+        .prefetch_related("parent_project_data_file__datatypes")
+        .in_bulk({record["data_file_id"] for record in records})
+    )
+    serialized_datafiles = serialize_datafiles_to_dicts(list(datafiles.values()))
+
+    NewDataFileAccessLog.objects.bulk_create(
+        [
+            NewDataFileAccessLog(
+                date=record["date"],
+                user_id=record["user_id"],
+                ip_address=record["ip_address"],
+                data_file=datafiles.get(record["data_file_id"]),
+                data_file_key=record["data_file_key"],
+                aws_url=record["aws_url"],
+                serialized_data_file=dict(
+                    serialized_datafiles.get(record["data_file_id"], {})
+                ),
+            )
+            for record in records
+        ]
+    )
+
+
+class AccessLogBuffer(object):
+    """
+    Hold access log records in memory and write them in batches.
+
+    A background thread flushes the buffer every `flush_interval` seconds, or
+    sooner once `batch_size` records are waiting. The buffer never holds more
+    than `max_size` records; if the flusher falls that far behind, the caller
+    flushes it. Whatever is left is flushed when the process exits.
+    """
+
+    def __init__(self, batch_size, max_size, flush_interval):
+        self.batch_size = batch_size
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+
+        self._records = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher = None
+        self._pid = None
+
+        atexit.register(self.flush)
+
+    def add(self, record):
+        record.setdefault("date", timezone.now())
+
+        with self._lock:
+            self._records.append(record)
+            size = len(self._records)
+
+        if size >= self.max_size:
+            self.flush()
+            return
+
+        self._start_flusher()
+        if size >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        with self._lock:
+            records, self._records = self._records, []
+
+        for start in range(0, len(records), self.batch_size):
+            batch = records[start : start + self.batch_size]
+            try:
+                write_access_logs(batch)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Failed to write %s access logs", len(batch))
+
+    def _start_flusher(self):
+        # Threads don't survive a fork, so start one per worker process.
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._flusher = threading.Thread(
+                target=self._run, name="access-log-flusher", daemon=True
+            )
+            self._flusher.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+
+            close_old_connections()
+            self.flush()
+            close_old_connections()
+
+
+access_log_buffer = AccessLogBuffer(
+    batch_size=settings.ACCESS_LOG_BATCH_SIZE,
+    max_size=settings.ACCESS_LOG_BUFFER_SIZE,
+    flush_interval=settings.ACCESS_LOG_FLUSH_SECONDS,
+)
@@ -8,3 +8,9 @@ class DataImportConfig(AppConfig):
 
     name = "data_import"
     verbose_name = "Data Import"
+
+    def ready(self):
+        # Make sure our signal handlers get hooked up
+
+        # pylint: disable=unused-variable
+        import data_import.signals  # noqa
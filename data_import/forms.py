@@ -32,7 +32,7 @@ class DataTypeForm(forms.ModelForm):
                 "{} is an uploadable DataType and may not be parents "
                 "for another type.".format(parent.name)
             )
-        elif self.instance in parent.all_parents:
+        elif self.instance.id in parent.ancestor_ids:
             raise forms.ValidationError(
                 "{0} is not an allowed parent, as it is a descendent of {1}.".format(
                     parent.name, self.instance.name
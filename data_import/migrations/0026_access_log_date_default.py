@@ -0,0 +1,21 @@
+# Generated by Django 3.2 on 2026-10-18 19:04
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("data_import", "0025_auto_20201222_1934"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="newdatafileaccesslog",
+            name="date",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+    ]
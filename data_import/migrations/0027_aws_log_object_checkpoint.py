@@ -0,0 +1,29 @@
+# Generated by Django 3.2 on 2026-10-18 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("data_import", "0026_access_log_date_default"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AWSLogObjectCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("key", models.CharField(max_length=1024, unique=True)),
+            ],
+        ),
+    ]
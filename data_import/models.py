@@ -1,5 +1,6 @@
 from collections import OrderedDict
 import datetime
+import hashlib
 import logging
 import os
 import uuid
@@ -9,15 +10,17 @@ from botocore.exceptions import ClientError
 
 from django.conf import settings
 from django.contrib.postgres.fields import JSONField
+from django.core import signing
+from django.core.cache import cache
 from django.core.validators import RegexValidator
-from django.urls import reverse
 from django.db import models
+from django.db.models.expressions import RawSQL
 from django.utils import timezone
 
 from ipware import get_client_ip
 
 from common import fields
-from common.utils import full_url
+from common.utils import reverse_pk
 from open_humans.models import Member
 
 from .utils import get_upload_path
@@ -65,6 +68,105 @@ class DataFileKey(models.Model):
         return True
 
 
+class SignedDataFileKey(object):
+    """
+    Stateless key for accessing private files.
+
+    The key is an HMAC-signed token carrying the datafile id, expiry, project
+    id and a fingerprint of the access token, so it can be verified without a
+    database lookup. It exposes the same attributes as DataFileKey.
+    """
+
+    salt = "data_import.SignedDataFileKey"
+    lifetime = datetime.timedelta(hours=1)
+
+    def __init__(
+        self, datafile_id, expires, project_id=None, access_token=None, key=None
+    ):
+        self.datafile_id = datafile_id
+        self.expires = expires
+        self.project_id = project_id
+        self.access_token = access_token
+        # Not carried in the token, which is readable by anyone holding the link
+        self.ip_address = None
+        self.key = key
+
+    @staticmethod
+    def is_signed(key):
+        """
+        Legacy DataFileKey keys are UUIDs, which never contain the separator.
+        """
+        return ":" in key
+
+    @staticmethod
+    def fingerprint(access_token):
+        if not access_token:
+            return None
+        return hashlib.sha256(access_token.encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def create(cls, datafile_id, access_token=None, project_id=None, **kwargs):
+        """
+        Return a new signed key. Other DataFileKey fields are accepted but not
+        stored in the token.
+        """
+        expires = timezone.now() + cls.lifetime
+        new_key = cls(
+            datafile_id=datafile_id,
+            expires=expires,
+            project_id=project_id,
+            access_token=cls.fingerprint(access_token),
+        )
+        new_key.key = signing.Signer(salt=cls.salt).sign_object(
+            {
+                "d": new_key.datafile_id,
+                "e": int(expires.timestamp()),
+                "p": new_key.project_id,
+                "t": new_key.access_token,
+            }
+        )
+        return new_key
+
+    @classmethod
+    def from_key(cls, key):
+        """
+        Return the key if its signature is valid, otherwise None.
+        """
+        try:
+            payload = signing.Signer(salt=cls.salt).unsign_object(key)
+        except (signing.BadSignature, ValueError):
+            return None
+
+        return cls(
+            datafile_id=payload["d"],
+            expires=datetime.datetime.fromtimestamp(payload["e"], tz=timezone.utc),
+            project_id=payload["p"],
+            access_token=payload["t"],
+            key=key,
+        )
+
+    @property
+    def created(self):
+        return self.expires - self.lifetime
+
+    @property
+    def expired(self):
+        return self.expires <= timezone.now()
+
+
+def get_datafile_key(key, datafile_id):
+    """
+    Return the signed or legacy key for a datafile, or None if there isn't one.
+    """
+    if SignedDataFileKey.is_signed(key):
+        key_object = SignedDataFileKey.from_key(key)
+        if key_object and key_object.datafile_id == datafile_id:
+            return key_object
+        return None
+
+    return DataFileKey.objects.filter(datafile_id=datafile_id, key=key).first()
+
+
 class DataFileManager(models.Manager):
     """
     We use a manager so that subclasses of DataFile also get their
@@ -97,9 +199,13 @@ class DataFile(models.Model):
     def __str__(self):
         return str("{0}:{1}:{2}").format(self.user, self.source, self.file)
 
-    def download_url(self, request):
-        key = self.generate_key(request)
-        url = full_url(reverse("data-management:datafile-download", args=(self.id,)))
+    def download_url(self, request, key=None):
+        """
+        Return a download link; a key is generated unless one is provided.
+        """
+        if not key:
+            key = self.generate_key(request)
+        url = reverse_pk("data-management:datafile-download", self.id, full=True)
         return "{0}?key={1}".format(url, key)
 
     @property
@@ -109,29 +215,67 @@ class DataFile(models.Model):
         """
         return self.file.storage.url(self.file.name)
 
-    def generate_key(self, request):
+    @staticmethod
+    def _key_request_fields(request):
         """
-        Generate new link expiration key
+        Return the fields logged on a DataFileKey about the requesting entity.
         """
-        new_key = DataFileKey(datafile_id=self.id)
+        fields = {}
 
         if request:
-            # Log the entity that is requesting the key be generated
-            new_key.ip_address, _ = get_client_ip(request)
+            fields["ip_address"], _ = get_client_ip(request)
 
             try:
-                new_key.access_token = request.query_params.get("access_token", None)
+                fields["access_token"] = request.query_params.get("access_token", None)
             except (AttributeError, KeyError):
-                new_key.access_token = None
+                fields["access_token"] = None
             try:
-                new_key.project_id = request.auth.id
+                fields["project_id"] = request.auth.id
             except AttributeError:
                 # We do not have an accessing project
-                new_key.project_id = None
+                fields["project_id"] = None
+
+        return fields
+
+    def generate_key(self, request):
+        """
+        Generate new link expiration key
+        """
+        # Log the entity that is requesting the key be generated
+        fields = self._key_request_fields(request)
 
+        if settings.SIGNED_DATAFILE_KEYS:
+            return SignedDataFileKey.create(datafile_id=self.id, **fields).key
+
+        new_key = DataFileKey(datafile_id=self.id, **fields)
         new_key.save()
         return new_key.key
 
+    @classmethod
+    def generate_keys(cls, datafiles, request):
+        """
+        Generate link expiration keys for many DataFiles with a single INSERT,
+        or none at all when signed keys are enabled.
+
+        Returns a dict mapping each DataFile id to its new key.
+        """
+        fields = cls._key_request_fields(request)
+
+        if settings.SIGNED_DATAFILE_KEYS:
+            return {
+                datafile.id: SignedDataFileKey.create(
+                    datafile_id=datafile.id, **fields
+                ).key
+                for datafile in datafiles
+            }
+
+        new_keys = [
+            DataFileKey(datafile_id=datafile.id, **fields) for datafile in datafiles
+        ]
+
+        DataFileKey.objects.bulk_create(new_keys)
+        return {new_key.datafile_id: new_key.key for new_key in new_keys}
+
     @property
     def is_public(self):
         return self.parent_project_data_file.is_public
@@ -175,7 +319,8 @@ class NewDataFileAccessLog(models.Model):
     Represents a download of a datafile.
     """
 
-    date = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add, so that buffered logs keep the time of the access
+    date = models.DateTimeField(default=timezone.now, editable=False)
     ip_address = models.GenericIPAddressField(null=True)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True
@@ -240,6 +385,19 @@ class AWSDataFileAccessLog(models.Model):
         return None
 
 
+class AWSLogObjectCheckpoint(models.Model):
+    """
+    Marks an S3 access log object whose entries have been saved, until the
+    object is deleted from the log bucket.
+    """
+
+    created = models.DateTimeField(auto_now_add=True)
+    key = models.CharField(max_length=1024, unique=True)
+
+    def __str__(self):
+        return self.key
+
+
 class TestUserData(models.Model):
     """
     Used for unit tests in public_data.tests; there's not currently a way to
@@ -254,6 +412,68 @@ class TestUserData(models.Model):
     )
 
 
+DATATYPE_INDEX_CACHE_KEY = "datatype-index"
+
+# A save that races with a rebuild can leave an out of date index in the
+# cache, so it's only trusted for this long
+DATATYPE_INDEX_CACHE_TIMEOUT = 60 * 60
+
+
+def forget_datatype_index():
+    """
+    Drop the cached DataTypeIndex, e.g. because a DataType changed.
+    """
+    cache.delete(DATATYPE_INDEX_CACHE_KEY)
+
+
+class DataTypeIndex(object):
+    """
+    The DataType hierarchy by ID, so that parents, children and ancestors can
+    be looked up without a query per node.
+    """
+
+    def __init__(self, datatypes):
+        """
+        Build the index from (id, name, parent_id) tuples.
+        """
+        self.rows = frozenset(datatypes)
+        self.names = {}
+        self.parents = {}
+        self.children = {}
+
+        for datatype_id, name, parent_id in self.rows:
+            self.names[datatype_id] = name
+            self.parents[datatype_id] = parent_id
+            self.children[datatype_id] = []
+
+        roots = []
+        for datatype_id, parent_id in self.parents.items():
+            if parent_id is None:
+                roots.append(datatype_id)
+            else:
+                self.children[parent_id].append(datatype_id)
+
+        self.roots = sorted(roots, key=self.names.get)
+        for children in self.children.values():
+            children.sort(key=self.names.get)
+
+        # Depth first, siblings by name; ancestors run from parent to root
+        self.order = []
+        self.ancestors = {}
+
+        stack = [(datatype_id, ()) for datatype_id in reversed(self.roots)]
+        while stack:
+            datatype_id, ancestors = stack.pop()
+
+            self.order.append((datatype_id, len(ancestors)))
+            self.ancestors[datatype_id] = ancestors
+
+            stack.extend(
+                (child_id, (datatype_id,) + ancestors)
+                for child_id in reversed(self.children[datatype_id])
+            )
+
+
 class DataType(models.Model):
     """
     Describes the types of data a DataFile can contain.
@@ -274,10 +494,13 @@ class DataType(models.Model):
     history = JSONField(default=dict, editable=False)
 
     def __str__(self):
-        parents = self.all_parents
+        index = self._get_index()
+        if index:
+            parents = [index.names[parent_id] for parent_id in index.ancestors[self.id]]
+        else:
+            parents = [parent.name for parent in self._walk_parents()]
         if parents:
             parents.reverse()
-            parents = [parent.name for parent in parents if parent]
             parents = ":".join(parents)
             return str("{0}:{1}").format(parents, self.name)
         return self.name
@@ -303,37 +526,52 @@ class DataType(models.Model):
         }
         return super().save(*args, **kwargs)
 
-    @property
-    def history_sorted(self):
-        history_sorted = OrderedDict()
-        items_sorted = sorted(
-            self.history.items(), key=lambda item: arrow.get(item[0]), reverse=True
+    def history_items(self):
+        """
+        Return (datetime, timestamp, entry) for each edit, newest first.
+        """
+        items = [
+            (arrow.get(timestamp).datetime, timestamp, entry)
+            for timestamp, entry in self.history.items()
+        ]
+        items.sort(key=lambda item: item[0], reverse=True)
+
+        return items
+
+    @staticmethod
+    def resolve_history(items):
+        """
+        Turn history_items into an OrderedDict keyed by datetime, loading the
+        parents and editors of all of the entries with one query each.
+        """
+        parents = DataType.objects.in_bulk(
+            {entry["parent"] for _, _, entry in items if entry["parent"]}
         )
-        for item in items_sorted:
-            parent = (
-                DataType.objects.get(id=item[1]["parent"])
-                if item[1]["parent"]
-                else None
-            )
-            try:
-                editor = Member.objects.get(id=item[1]["editor"])
-            except Member.DoesNotExist:
-                editor = None
-            history_sorted[arrow.get(item[0]).datetime] = {
-                "parent": parent,
-                "editor": editor,
-                "hash": hash(item[0]),
+        editors = Member.objects.select_related("user").in_bulk(
+            {entry["editor"] for _, _, entry in items}
+        )
+
+        history_sorted = OrderedDict()
+        for when, timestamp, entry in items:
+            history_sorted[when] = {
+                "parent": parents.get(entry["parent"]),
+                "editor": editors.get(entry["editor"]),
+                "hash": hash(timestamp),
             }
-            history_sorted[arrow.get(item[0]).datetime].update(
+            history_sorted[when].update(
                 {
-                    field: item[1][field]
+                    field: entry[field]
                     for field in ["name", "description", "details", "uploadable"]
-                    if field in item[1]
+                    if field in entry
                 }
             )
 
         return history_sorted
 
+    @property
+    def history_sorted(self):
+        return self.resolve_history(self.history_items())
+
     @property
     def editable(self):
         """
@@ -349,11 +587,76 @@ class DataType(models.Model):
         else:
             return True
 
-    @property
-    def all_parents(self):
+    @classmethod
+    def get_index(cls):
         """
-        Return list of parents, from immediate to most ancestral.
+        Return the DataTypeIndex, building and caching it if needed.
+        """
+        index = cache.get(DATATYPE_INDEX_CACHE_KEY)
+
+        if index is None:
+            index = DataTypeIndex(cls.objects.values_list("id", "name", "parent_id"))
+            cache.set(DATATYPE_INDEX_CACHE_KEY, index, DATATYPE_INDEX_CACHE_TIMEOUT)
+
+        return index
+
+    @classmethod
+    def get_index_and_datatypes(cls):
         """
+        Return the DataTypeIndex and a dict of every DataType by ID. Each
+        DataType keeps the index, so str() needs no further lookups.
+        """
+        index = cls.get_index()
+        datatypes = cls.objects.in_bulk()
+        rows = frozenset(
+            (datatype.id, datatype.name, datatype.parent_id)
+            for datatype in datatypes.values()
+        )
+
+        if index.rows != rows:
+            # The cached index is out of date, rebuild it from what we loaded
+            index = DataTypeIndex(rows)
+            cache.set(DATATYPE_INDEX_CACHE_KEY, index, DATATYPE_INDEX_CACHE_TIMEOUT)
+
+        for datatype in datatypes.values():
+            datatype._index = index
+
+        return index, datatypes
+
+    @classmethod
+    def subtree_ids(cls, datatype_id):
+        """
+        Return a subquery of the IDs of a DataType and all of its descendants,
+        expanded by the database with a recursive CTE, for use with __in.
+        """
+        return RawSQL(
+            """
+            WITH RECURSIVE subtree(id) AS (
+                SELECT id FROM {0} WHERE id = %s
+                UNION
+                SELECT child.id FROM {0} child
+                JOIN subtree ON child.parent_id = subtree.id
+            )
+            SELECT id FROM subtree
+            """.format(cls._meta.db_table),
+            [datatype_id],
+        )
+
+    def _get_index(self):
+        """
+        Return the DataTypeIndex if it's current for this instance, else None.
+        """
+        if not self.id:
+            return None
+
+        index = getattr(self, "_index", None) or self.get_index()
+
+        if self.id not in index.ancestors or index.parents[self.id] != self.parent_id:
+            return None
+
+        return index
+
+    def _walk_parents(self):
         parent = self.parent
         parents = []
         if parent:
@@ -365,6 +668,30 @@ class DataType(models.Model):
 
         return parents
 
+    @property
+    def ancestor_ids(self):
+        """
+        Return list of parent IDs, from immediate to most ancestral.
+        """
+        index = self._get_index()
+        if index:
+            return list(index.ancestors[self.id])
+
+        return [parent.id for parent in self._walk_parents()]
+
+    @property
+    def all_parents(self):
+        """
+        Return list of parents, from immediate to most ancestral.
+        """
+        index = self._get_index()
+        if not index:
+            return self._walk_parents()
+
+        parent_ids = index.ancestors[self.id]
+        parents = DataType.objects.in_bulk(parent_ids)
+        return [parents[parent_id] for parent_id in parent_ids if parent_id in parents]
+
     @classmethod
     def all_as_tree(cls):
         """
@@ -373,30 +700,24 @@ class DataType(models.Model):
         This method is intended to make all ancestry relationships available without
         having to hit the database more than necessary.
         """
+        index, datatypes = cls.get_index_and_datatypes()
 
-        def _children(parent, all_datatypes):
-            children = {}
-            for dt in [dt for dt in all_datatypes if dt.parent == parent]:
-                children[dt] = _children(dt, all_datatypes)
-            return children
+        def _children(parent_id):
+            return {
+                datatypes[child_id]: _children(child_id)
+                for child_id in index.children[parent_id]
+            }
 
-        all_datatypes = list(DataType.objects.all())
-        roots = DataType.objects.filter(parent=None)
-        tree = {dt: _children(dt, all_datatypes) for dt in roots}
-        return tree
+        return {datatypes[root_id]: _children(root_id) for root_id in index.roots}
 
     @classmethod
     def sorted_by_ancestors(cls, queryset=None):
         """
         Sort DataTypes by ancestors array of dicts containing 'datatype' and 'depth'.
         """
+        index, datatypes = cls.get_index_and_datatypes()
 
-        def _flatten(node, depth=0):
-            flattened = []
-            for child in sorted(node.keys(), key=lambda obj: obj.name):
-                flattened.append({"datatype": child, "depth": depth})
-                flattened = flattened + _flatten(node[child], depth=depth + 1)
-            return flattened
-
-        datatypes_tree = cls.all_as_tree()
-        return _flatten(datatypes_tree)
+        return [
+            {"datatype": datatypes[datatype_id], "depth": depth}
+            for datatype_id, depth in index.order
+        ]
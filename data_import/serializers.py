@@ -1,9 +1,10 @@
 from collections import OrderedDict
 
-from django.urls import reverse
+from django.db import models
 from rest_framework import serializers
 
-from common.utils import full_url
+from common.mixins import EagerLoadingSerializerMixin
+from common.utils import reverse_pk
 
 from .models import AWSDataFileAccessLog, DataFile, DataType, NewDataFileAccessLog
 
@@ -22,13 +23,51 @@ def serialize_datafile_to_dict(datafile):
     return serialized_datafile
 
 
-class DataFileSerializer(serializers.Serializer):
+def serialize_datafiles_to_dicts(datafiles):
+    """
+    Serialize many datafiles for storage in logs, keyed by datafile id.
+    """
+    serialized_datafiles = {}
+    for datafile, serialized_datafile in zip(
+        datafiles, DataFileSerializer(datafiles, many=True).data
+    ):
+        serialized_datafile["created"] = datafile.created.isoformat()
+        serialized_datafile["user_id"] = datafile.user_id
+        serialized_datafiles[datafile.id] = serialized_datafile
+    return serialized_datafiles
+
+
+class DataFileListSerializer(serializers.ListSerializer):
+    """
+    Issue download keys for every data file on the page in a single query.
+    """
+
+    def to_representation(self, data):
+        """
+        Generate keys for all data files up front and store them in the context
+        so the child serializer can look up its key rather than create one.
+        """
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        datafiles = list(iterable)
+
+        self.context["datafile_keys"] = DataFile.generate_keys(
+            datafiles, self.context.get("request", None)
+        )
+
+        return super().to_representation(datafiles)
+
+
+class DataFileSerializer(EagerLoadingSerializerMixin, serializers.Serializer):
     """
     Serialize a data file.
     """
 
+    select_related_fields = ("parent_project_data_file",)
+    prefetch_related_fields = ("parent_project_data_file__datatypes",)
+
     class Meta:  # noqa: D101
         model = DataFile
+        list_serializer_class = DataFileListSerializer
 
     def to_representation(self, instance):
         """
@@ -37,12 +76,13 @@ class DataFileSerializer(serializers.Serializer):
         keys are created.
         """
         request = self.context.get("request", None)
+        key = self.context.get("datafile_keys", {}).get(instance.id, None)
         ret = OrderedDict()
         ret["id"] = instance.id
         ret["basename"] = instance.basename
         ret["created"] = instance.created
         ret["datatypes"] = self.get_file_datatypes(instance)
-        ret["download_url"] = instance.download_url(request)
+        ret["download_url"] = instance.download_url(request, key=key)
         ret["metadata"] = instance.metadata
         ret["source"] = instance.source
         ret["source_project"] = self.get_source_project(instance)
@@ -54,16 +94,15 @@ class DataFileSerializer(serializers.Serializer):
         Get links to DataType API endpoints for file DataTypes
         """
         return [
-            full_url(reverse("api:datatype", kwargs={"pk": dt.id}))
+            reverse_pk("api:datatype", dt.id, full=True)
             for dt in obj.parent_project_data_file.datatypes.all()
         ]
 
     def get_source_project(self, obj):
-        return full_url(
-            reverse(
-                "api:project",
-                kwargs={"pk": obj.parent_project_data_file.direct_sharing_project.id},
-            )
+        return reverse_pk(
+            "api:project",
+            obj.parent_project_data_file.direct_sharing_project_id,
+            full=True,
         )
 
 
@@ -110,11 +149,13 @@ class AWSDataFileAccessLogSerializer(serializers.ModelSerializer):
         ]
 
 
-class DataTypeSerializer(serializers.ModelSerializer):
+class DataTypeSerializer(EagerLoadingSerializerMixin, serializers.ModelSerializer):
     """
     Serialize DataTypes
     """
 
+    prefetch_related_fields = ("children", "source_projects")
+
     class Meta:  # noqa: D101
         model = DataType
 
@@ -136,6 +177,6 @@ class DataTypeSerializer(serializers.ModelSerializer):
         Get approved projects that are registered as potential sources.
         """
         return [
-            reverse("api:project", kwargs={"pk": project.id})
+            reverse_pk("api:project", project.id)
             for project in obj.source_projects.all()
         ]
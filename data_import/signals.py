@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import DataType, forget_datatype_index
+
+
+@receiver(post_save, sender=DataType)
+@receiver(post_delete, sender=DataType)
+def datatype_index_cb(sender, instance, **kwargs):
+    """
+    Rebuild the DataTypeIndex after any DataType change, including fixtures.
+    """
+    forget_datatype_index()
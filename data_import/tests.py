@@ -0,0 +1,306 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from mock import patch
+
+from common.testing import get_or_create_user
+from open_humans.models import Member
+from private_sharing.models import DataRequestProject, ProjectDataFile
+
+from .access_log_buffer import AccessLogBuffer
+from .models import (
+    DataFile,
+    DataFileKey,
+    DataType,
+    DataTypeIndex,
+    NewDataFileAccessLog,
+    SignedDataFileKey,
+    get_datafile_key,
+)
+from .serializers import DataFileSerializer
+
+
+@override_settings(SSLIFY_DISABLE=True, SIGNED_DATAFILE_KEYS=False)
+class DataFileKeyTests(TestCase):
+    """
+    Tests for issuing download keys.
+    """
+
+    fixtures = ["open_humans/fixtures/test-data.json"]
+
+    def setUp(self):
+        self.user = get_or_create_user("key_user")
+        self.data_files = [
+            ProjectDataFile.objects.create(
+                user=self.user,
+                file="member-files/keys/{}.txt".format(i),
+                direct_sharing_project=DataRequestProject.objects.get(pk=1),
+                completed=True,
+            )
+            for i in range(3)
+        ]
+
+    def test_generate_keys_in_bulk(self):
+        with self.assertNumQueries(1):
+            keys = DataFile.generate_keys(self.data_files, None)
+
+        self.assertEqual(set(keys), {data_file.id for data_file in self.data_files})
+        self.assertEqual(
+            set(DataFileKey.objects.values_list("datafile_id", "key")),
+            {(datafile_id, str(key)) for datafile_id, key in keys.items()},
+        )
+
+    def test_serializer_issues_one_key_per_file(self):
+        data = DataFileSerializer(
+            self.data_files, many=True, context={"request": None}
+        ).data
+
+        keys = dict(DataFileKey.objects.values_list("datafile_id", "key"))
+        self.assertEqual(len(keys), len(self.data_files))
+
+        for item in data:
+            self.assertTrue(
+                item["download_url"].endswith("?key={}".format(keys[item["id"]]))
+            )
+
+
+@override_settings(SSLIFY_DISABLE=True, SIGNED_DATAFILE_KEYS=True)
+class SignedDataFileKeyTests(TestCase):
+    """
+    Tests for signed download keys and the legacy key fallback.
+    """
+
+    fixtures = ["open_humans/fixtures/test-data.json"]
+
+    def setUp(self):
+        self.data_file = ProjectDataFile.objects.create(
+            user=get_or_create_user("signed_key_user"),
+            file="member-files/keys/signed.txt",
+            direct_sharing_project=DataRequestProject.objects.get(pk=1),
+            completed=True,
+        )
+
+    def download(self, key):
+        return self.client.get(
+            reverse("data-management:datafile-download", args=[self.data_file.id]),
+            {"key": key},
+        )
+
+    def test_signed_key(self):
+        with self.assertNumQueries(0):
+            key = DataFile.generate_keys([self.data_file], None)[self.data_file.id]
+
+        key_object = SignedDataFileKey.from_key(key)
+        self.assertEqual(key_object.datafile_id, self.data_file.id)
+        self.assertFalse(key_object.expired)
+        self.assertFalse(DataFileKey.objects.exists())
+
+        self.assertEqual(self.download(key).status_code, 302)
+
+    def test_tampered_key(self):
+        key = SignedDataFileKey.create(datafile_id=self.data_file.id).key
+        value, signature = key.rsplit(":", 1)
+        tampered = "{0}:{1}".format(value, signature[::-1])
+
+        self.assertIsNone(SignedDataFileKey.from_key(tampered))
+        self.assertEqual(self.download(tampered).status_code, 403)
+
+    def test_key_for_another_file(self):
+        key = SignedDataFileKey.create(datafile_id=self.data_file.id + 1).key
+
+        self.assertIsNone(get_datafile_key(key, self.data_file.id))
+        self.assertEqual(self.download(key).status_code, 403)
+
+    def test_expired_key(self):
+        with patch.object(SignedDataFileKey, "lifetime", timedelta(seconds=-1)):
+            key = SignedDataFileKey.create(datafile_id=self.data_file.id).key
+
+        self.assertTrue(SignedDataFileKey.from_key(key).expired)
+        self.assertEqual(self.download(key).status_code, 403)
+
+    def test_legacy_key(self):
+        key_object = DataFileKey.objects.create(datafile_id=self.data_file.id)
+
+        self.assertEqual(self.download(str(key_object.key)).status_code, 302)
+
+        DataFileKey.objects.filter(key=key_object.key).update(
+            created=timezone.now() - timedelta(hours=2)
+        )
+        self.assertEqual(self.download(str(key_object.key)).status_code, 403)
+
+
+class AccessLogBufferTests(TestCase):
+    """
+    Tests for buffering datafile access logs.
+    """
+
+    fixtures = ["open_humans/fixtures/test-data.json"]
+
+    def test_flush_keeps_access_time(self):
+        # The flusher thread waits for a full batch or the interval, so only
+        # the explicit flush below writes anything
+        buffer = AccessLogBuffer(batch_size=10, max_size=100, flush_interval=3600)
+        data_file = ProjectDataFile.objects.get(pk=1)
+        accessed = timezone.now() - timedelta(minutes=5)
+
+        with patch("django.utils.timezone.now", return_value=accessed):
+            for ip_address in ["10.0.0.1", "10.0.0.2"]:
+                buffer.add(
+                    {
+                        "user_id": None,
+                        "ip_address": ip_address,
+                        "data_file_id": data_file.id,
+                        "data_file_key": {},
+                        "aws_url": "https://example.com/file",
+                    }
+                )
+
+        self.assertFalse(NewDataFileAccessLog.objects.exists())
+
+        with self.assertNumQueries(4):
+            buffer.flush()
+
+        logs = NewDataFileAccessLog.objects.order_by("ip_address")
+        self.assertEqual([log.ip_address for log in logs], ["10.0.0.1", "10.0.0.2"])
+        for log in logs:
+            self.assertEqual(log.date, accessed)
+            self.assertEqual(log.data_file_id, data_file.id)
+            self.assertEqual(log.serialized_data_file["id"], data_file.id)
+
+
+class DataTypeIndexTests(TestCase):
+    """
+    Tests for the cached DataType hierarchy.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+        self.editor, _ = Member.objects.get_or_create(
+            user=get_or_create_user("datatype_editor")
+        )
+
+        self.genome = self.create_datatype("Genome")
+        self.exome = self.create_datatype("Exome", self.genome)
+        self.array = self.create_datatype("Array", self.genome)
+        self.chip = self.create_datatype("Chip", self.array)
+        self.activity = self.create_datatype("Activity")
+
+    def create_datatype(self, name, parent=None):
+        datatype = DataType(name=name, parent=parent, description=name)
+        datatype.editor = self.editor
+        datatype.save()
+
+        return datatype
+
+    def test_index(self):
+        index = DataTypeIndex(
+            [(1, "b", None), (2, "a", None), (3, "c", 1), (4, "d", 3)]
+        )
+
+        self.assertEqual(index.roots, [2, 1])
+        self.assertEqual(index.children[1], [3])
+        self.assertEqual(index.ancestors[4], (3, 1))
+        self.assertEqual(index.order, [(2, 0), (1, 0), (3, 1), (4, 2)])
+
+    def test_str(self):
+        self.assertEqual(str(self.chip), "Genome:Array:Chip")
+        self.assertEqual(str(self.genome), "Genome")
+
+        chip = DataType.objects.get(id=self.chip.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(str(chip), "Genome:Array:Chip")
+
+    def test_sorted_by_ancestors(self):
+        self.assertEqual(
+            [
+                (item["datatype"].name, item["depth"])
+                for item in DataType.sorted_by_ancestors()
+            ],
+            [
+                ("Activity", 0),
+                ("Genome", 0),
+                ("Array", 1),
+                ("Chip", 2),
+                ("Exome", 1),
+            ],
+        )
+
+    def test_out_of_date_index_is_rebuilt(self):
+        DataType.get_index()
+
+        # A rename that skipped forget_datatype_index(), e.g. racing a rebuild
+        DataType.objects.filter(id=self.array.id).update(name="Microarray")
+
+        index, datatypes = DataType.get_index_and_datatypes()
+
+        self.assertEqual(index.names[self.array.id], "Microarray")
+        self.assertEqual(str(datatypes[self.chip.id]), "Genome:Microarray:Chip")
+        self.assertEqual(DataType.get_index().names[self.array.id], "Microarray")
+
+
+@override_settings(SSLIFY_DISABLE=True)
+class DataTypeHistoryTests(TestCase):
+    """
+    Tests for showing the edit history of a DataType.
+    """
+
+    def setUp(self):
+        self.editor, _ = Member.objects.get_or_create(
+            user=get_or_create_user("history_editor")
+        )
+        self.other_editor, _ = Member.objects.get_or_create(
+            user=get_or_create_user("other_history_editor")
+        )
+
+        self.parent = DataType(name="Parent", description="Parent")
+        self.parent.editor = self.editor
+        self.parent.save()
+
+        self.datatype = DataType(name="Child", parent=self.parent, description="Child")
+        self.datatype.editor = self.other_editor
+        self.datatype.save()
+
+    def test_resolve_history(self):
+        self.datatype.parent = None
+        self.datatype.description = "Moved"
+        self.datatype.editor = self.editor
+        self.datatype.save()
+
+        # Earlier entries refer to a parent and an editor that are now gone
+        self.parent.delete()
+        self.other_editor.user.delete()
+
+        with self.assertNumQueries(2):
+            history = DataType.resolve_history(self.datatype.history_items())
+
+        entries = list(history.values())
+
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[0]["description"], "Moved")
+        self.assertIsNone(entries[0]["parent"])
+        self.assertEqual(entries[0]["editor"], self.editor)
+        self.assertEqual(entries[1]["description"], "Child")
+        self.assertIsNone(entries[1]["parent"])
+        self.assertIsNone(entries[1]["editor"])
+        self.assertEqual(list(history), sorted(history, reverse=True))
+
+    def test_detail_shows_recent_history(self):
+        entry = next(iter(self.datatype.history.values()))
+        history = {
+            (timezone.now() - timedelta(minutes=minutes)).isoformat(): entry
+            for minutes in range(30)
+        }
+        DataType.objects.filter(id=self.datatype.id).update(history=history)
+
+        response = self.client.get(
+            reverse("data-management:datatypes-detail", args=[self.datatype.id])
+        )
+
+        self.assertEqual(len(response.context["history"]), 25)
+        self.assertTrue(response.context["history_paginated"])
@@ -5,6 +5,7 @@ from .views import (
     DataFileDownloadView,
     DataTypesCreateView,
     DataTypesDetailView,
+    DataTypesHistoryView,
     DataTypesListView,
     DataTypesUpdateView,
     NewDataFileAccessLogView,
@@ -32,6 +33,11 @@ urlpatterns = [
         DataTypesDetailView.as_view(),
         name="datatypes-detail",
     ),
+    re_path(
+        r"^datatypes/(?P<pk>[\w-]+)/history$",
+        DataTypesHistoryView.as_view(),
+        name="datatypes-history",
+    ),
     re_path(r"^datatypes/", DataTypesListView.as_view(), name="datatypes-list"),
     # Custom API endpoints for OHLOG_PROJECT_ID
     path(
@@ -1,6 +1,7 @@
 import logging
 
 from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator
 from django.http import HttpResponseForbidden, HttpResponseRedirect
 from django.urls import reverse
 from django.views.generic import CreateView, DetailView, TemplateView, UpdateView, View
@@ -12,21 +13,21 @@ from waffle import get_waffle_flag_model
 
 from common.mixins import NeverCacheMixin, PrivateMixin
 
+from .access_log_buffer import access_log_buffer
 from .filters import AccessLogFilter
 from .forms import DataTypeForm
 from .models import (
     AWSDataFileAccessLog,
     DataFile,
-    DataFileKey,
     DataType,
     NewDataFileAccessLog,
+    get_datafile_key,
 )
 from .permissions import LogAPIAccessAllowed
 from common.mixins import NeverCacheMixin
 from data_import.serializers import (
     AWSDataFileAccessLogSerializer,
     NewDataFileAccessLogSerializer,
-    serialize_datafile_to_dict,
 )
 from private_sharing.api_authentication import CustomOAuth2Authentication
 from private_sharing.api_permissions import HasValidProjectToken
@@ -61,30 +62,34 @@ class DataFileDownloadView(View):
 
         ip_address, _ = get_client_ip(request)
 
-        access_log = NewDataFileAccessLog(
-            user=user, ip_address=ip_address, data_file=self.data_file
+        # The log is written later, in a batch, by the buffer's flusher.
+        access_log_buffer.add(
+            {
+                "user_id": user.id if user else None,
+                "ip_address": ip_address,
+                "data_file_id": self.data_file.id,
+                "data_file_key": {
+                    "created": key_object.created.isoformat(),
+                    "key": str(key_object.key),
+                    "datafile_id": key_object.datafile_id,
+                    "key_creation_ip_address": key_object.ip_address,
+                    "access_token": key_object.access_token,
+                    "project_id": key_object.project_id,
+                },
+                "aws_url": url,
+            }
         )
-        access_log.data_file_key = {
-            "created": key_object.created.isoformat(),
-            "key": key_object.key,
-            "datafile_id": key_object.datafile_id,
-            "key_creation_ip_address": key_object.ip_address,
-            "access_token": key_object.access_token,
-            "project_id": key_object.project_id,
-        }
-
-        access_log.aws_url = url
-
-        access_log.serialized_data_file = serialize_datafile_to_dict(self.data_file)
-        access_log.save()
 
         return HttpResponseRedirect(url)
 
     # pylint: disable=attribute-defined-outside-init
     def get(self, request, *args, **kwargs):
-        data_file_qs = DataFile.objects.filter(pk=self.kwargs.get("pk"))
-        if data_file_qs.exists():
-            self.data_file = data_file_qs.get()
+        self.data_file = (
+            DataFile.objects.filter(pk=self.kwargs.get("pk"))
+            .select_related("parent_project_data_file", "user")
+            .first()
+        )
+        if self.data_file:
             unavailable = (
                 hasattr(self.data_file, "parent_project_data_file")
                 and self.data_file.parent_project_data_file.completed is False
@@ -96,14 +101,9 @@ class DataFileDownloadView(View):
 
         query_key = request.GET.get("key", None)
         if query_key:
-            key_qs = DataFileKey.objects.filter(datafile_id=self.data_file.id)
-            key_qs = key_qs.filter(key=query_key)
-            if key_qs.exists():
-                # exists() is only a method for querysets
-                key_object = key_qs.get()
-                # Now we need the actual object
-                if not key_object.expired:
-                    return self.get_and_log(request, key_object=key_object)
+            key_object = get_datafile_key(query_key, datafile_id=self.data_file.id)
+            if key_object and not key_object.expired:
+                return self.get_and_log(request, key_object=key_object)
         return HttpResponseForbidden(
             "<h1>You are not authorized to view this file.</h1>"
         )
@@ -183,6 +183,44 @@ class DataTypesDetailView(NeverCacheMixin, DetailView):
     model = DataType
     template_name = "data_import/datatypes-detail.html"
 
+    def get_context_data(self, *args, **kwargs):
+        context = super().get_context_data(*args, **kwargs)
+        # Only the most recent edits, the rest are on the history pages
+        items = self.object.history_items()
+        context.update(
+            {
+                "history": DataType.resolve_history(
+                    items[: DataTypesHistoryView.paginate_by]
+                ),
+                "history_paginated": len(items) > DataTypesHistoryView.paginate_by,
+            }
+        )
+        return context
+
+
+class DataTypesHistoryView(NeverCacheMixin, DetailView):
+    """
+    The edit history of a DataType, page by page.
+    """
+
+    model = DataType
+    paginate_by = 25
+    template_name = "data_import/datatypes-history.html"
+
+    def get_context_data(self, *args, **kwargs):
+        context = super().get_context_data(*args, **kwargs)
+        paginator = Paginator(self.object.history_items(), self.paginate_by)
+        page_obj = paginator.get_page(self.request.GET.get("page"))
+        context.update(
+            {
+                "history": DataType.resolve_history(page_obj.object_list),
+                "is_paginated": page_obj.has_other_pages(),
+                "page_obj": page_obj,
+                "paginator": paginator,
+            }
+        )
+        return context
+
 
 class FormEditorMixin(object):
     """
@@ -1,13 +1,15 @@
 from distutils.util import strtobool
 
 from django.contrib.auth import get_user_model
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework.exceptions import APIException
 from rest_framework.filters import SearchFilter
 from rest_framework.generics import ListAPIView, RetrieveAPIView
 
-from common.mixins import NeverCacheMixin
+from common.mixins import EagerLoadingMixin, NeverCacheMixin
+from common.ndjson import NDJSONStreamingMixin
 from data_import.models import DataType
 from data_import.serializers import DataTypeSerializer
 from public_data.serializers import (
@@ -29,6 +31,7 @@ from .filters import (
     LegacyPublicDataFileFilter,
 )
 from .models import Member
+from .pagination import OptionalCursorPagination
 from .serializers import (
     DataUsersBySourceSerializer,
     MemberDataSourcesSerializer,
@@ -40,7 +43,7 @@ from .serializers import (
 UserModel = get_user_model()
 
 
-class PublicDataFileAPIView(NeverCacheMixin, RetrieveAPIView):
+class PublicDataFileAPIView(NeverCacheMixin, EagerLoadingMixin, RetrieveAPIView):
     """
     Return public DataFile information.
     """
@@ -51,12 +54,14 @@ class PublicDataFileAPIView(NeverCacheMixin, RetrieveAPIView):
         """
         Exclude projects where all public sharing is disabled
         """
-        return ProjectDataFile.objects.public().exclude(
-            direct_sharing_project__no_public_data=True
+        return ProjectDataFile.objects.public().filter(
+            public_index__no_public_data=False
         )
 
 
-class PublicDataFileListAPIView(NeverCacheMixin, ListAPIView):
+class PublicDataFileListAPIView(
+    NeverCacheMixin, EagerLoadingMixin, NDJSONStreamingMixin, ListAPIView
+):
     """
     Return list of public DataFiles and associated information.
 
@@ -66,6 +71,7 @@ class PublicDataFileListAPIView(NeverCacheMixin, ListAPIView):
     - username
     """
 
+    pagination_class = OptionalCursorPagination
     serializer_class = PublicDataFileSerializer
     filter_backends = (DjangoFilterBackend,)
     filter_class = PublicDataFileFilter
@@ -74,8 +80,8 @@ class PublicDataFileListAPIView(NeverCacheMixin, ListAPIView):
         """
         Exclude projects where all public sharing is disabled
         """
-        return ProjectDataFile.objects.public().exclude(
-            direct_sharing_project__no_public_data=True
+        return ProjectDataFile.objects.public().filter(
+            public_index__no_public_data=False
         )
 
 
@@ -93,7 +99,7 @@ class PublicDataTypeAPIView(NeverCacheMixin, RetrieveAPIView):
         return DataType.objects.all()
 
 
-class PublicDataTypeDataFilesAPIView(NeverCacheMixin, ListAPIView):
+class PublicDataTypeDataFilesAPIView(NeverCacheMixin, EagerLoadingMixin, ListAPIView):
     """
     Return a list of publicly available DataFiles for a DataType.
 
@@ -104,6 +110,7 @@ class PublicDataTypeDataFilesAPIView(NeverCacheMixin, ListAPIView):
     - include_children
     """
 
+    pagination_class = OptionalCursorPagination
     serializer_class = PublicDataFileSerializer
     filter_backends = (DjangoFilterBackend,)
     filter_class = PublicDataFileFilter
@@ -112,27 +119,26 @@ class PublicDataTypeDataFilesAPIView(NeverCacheMixin, ListAPIView):
         """
         Get the queryset.
         """
-
-        def _all_children(dt, children=[]):
-            for child in dt.children.all():
-                children = children + [child.id] + _all_children(child)
-            return children
-
         datatype = DataType.objects.get(id=self.kwargs["pk"])
         datatypes = [datatype.id]
 
         if strtobool(self.request.GET.get("include_children", "False")):
-            datatypes = datatypes + _all_children(datatype)
+            datatypes = DataType.subtree_ids(datatype.id)
+
+        # A file with several matching datatypes should still be listed once
+        file_datatypes = ProjectDataFile.datatypes.through.objects.filter(
+            projectdatafile=OuterRef("pk"), datatype__in=datatypes
+        )
 
         qs = (
             ProjectDataFile.objects.public()
-            .exclude(direct_sharing_project__no_public_data=True)
-            .filter(datatypes__in=datatypes)
+            .filter(public_index__no_public_data=False)
+            .filter(Exists(file_datatypes))
         )
         return qs
 
 
-class PublicDataTypeListAPIView(NeverCacheMixin, ListAPIView):
+class PublicDataTypeListAPIView(NeverCacheMixin, EagerLoadingMixin, ListAPIView):
     """
     Return list of DataTypes and source projects that have registered them.
 
@@ -164,7 +170,7 @@ class PublicMemberAPIView(NeverCacheMixin, RetrieveAPIView):
         )
 
 
-class PublicMemberDataFilesAPIView(NeverCacheMixin, ListAPIView):
+class PublicMemberDataFilesAPIView(NeverCacheMixin, EagerLoadingMixin, ListAPIView):
     """
     Return list of DataFiles a member has publicly shared.
 
@@ -194,7 +200,7 @@ class PublicMemberDataFilesAPIView(NeverCacheMixin, ListAPIView):
         visible_projs = [drpm.project for drpm in drpms]
         return (
             ProjectDataFile.objects.public()
-            .exclude(direct_sharing_project__no_public_data=True)
+            .filter(public_index__no_public_data=False)
             .filter(direct_sharing_project__in=visible_projs)
             .filter(user=member.user)
         )
@@ -224,7 +230,9 @@ class PublicMemberProjectsAPIView(NeverCacheMixin, ListAPIView):
         return qs
 
 
-class PublicMemberListAPIView(NeverCacheMixin, ListAPIView):
+class PublicMemberListAPIView(
+    NeverCacheMixin, EagerLoadingMixin, NDJSONStreamingMixin, ListAPIView
+):
     """
     Return a list of all active members.
 
@@ -260,7 +268,7 @@ class PublicProjectAPIView(NeverCacheMixin, RetrieveAPIView):
         return DataRequestProject.objects.filter(approved=True)
 
 
-class PublicProjectDataFilesAPIView(NeverCacheMixin, ListAPIView):
+class PublicProjectDataFilesAPIView(NeverCacheMixin, EagerLoadingMixin, ListAPIView):
     """
     Return publicly available project DataFiles.
 
@@ -283,7 +291,7 @@ class PublicProjectDataFilesAPIView(NeverCacheMixin, ListAPIView):
         )
         return (
             ProjectDataFile.objects.public()
-            .exclude(direct_sharing_project__no_public_data=True)
+            .filter(public_index__no_public_data=False)
             .filter(direct_sharing_project=project)
         )
 
@@ -313,7 +321,9 @@ class PublicProjectMembersAPIView(NeverCacheMixin, ListAPIView):
         return qs
 
 
-class PublicProjectListAPIView(NeverCacheMixin, ListAPIView):
+class PublicProjectListAPIView(
+    NeverCacheMixin, EagerLoadingMixin, NDJSONStreamingMixin, ListAPIView
+):
     """
     Return list of all approved projects.
 
@@ -342,11 +352,12 @@ class PublicProjectListAPIView(NeverCacheMixin, ListAPIView):
 #####################################################################
 
 
-class PublicDataListAPIView(NeverCacheMixin, ListAPIView):
+class PublicDataListAPIView(NeverCacheMixin, EagerLoadingMixin, ListAPIView):
     """
     Return the list of public data files.
     """
 
+    pagination_class = OptionalCursorPagination
     serializer_class = LegacyPublicDataFileSerializer
 
     filter_backends = (DjangoFilterBackend,)
@@ -356,9 +367,7 @@ class PublicDataListAPIView(NeverCacheMixin, ListAPIView):
         """
         Exclude projects where all public sharing is disabled
         """
-        qs = ProjectDataFile.objects.public().exclude(
-            direct_sharing_project__no_public_data=True
-        )
+        qs = ProjectDataFile.objects.public().filter(public_index__no_public_data=False)
         return qs
 
 
@@ -0,0 +1,96 @@
+"""
+Cached badge data for member profiles and the member list.
+"""
+
+from django.core.cache import cache
+from django.templatetags.static import static
+from django.urls import reverse
+
+from private_sharing.models import DataRequestProjectMember
+from public_data.models import Participant
+
+MEMBER_BADGES_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def member_badges_cache_key(member_id):
+    """
+    Return the cache key for a member's badge data.
+    """
+    return "member-badges:{0}".format(member_id)
+
+
+def project_badge(project):
+    """
+    Return the data needed to render a project's badge.
+    """
+    try:
+        badge_url = project.badge_image.url
+    except ValueError:
+        badge_url = static("images/default-badge.png")
+
+    return {
+        "name": project.name,
+        "static_url": badge_url,
+        "href": reverse("activity", kwargs={"slug": project.slug}),
+    }
+
+
+def public_data_badge():
+    """
+    Return the data needed to render the public data sharing badge.
+    """
+    return {
+        "name": "Public Data Sharing",
+        "static_url": static("images/public-data-sharing-badge.png"),
+        "href": reverse("public-data:home"),
+    }
+
+
+def get_member_badges(member_ids):
+    """
+    Return a dict of member ID to that member's badge data, loading the
+    members that aren't cached with one query for all of them.
+    """
+    keys = {member_badges_cache_key(member_id): member_id for member_id in member_ids}
+    badges = {keys[key]: value for key, value in cache.get_many(keys).items()}
+
+    missing = [member_id for member_id in keys.values() if member_id not in badges]
+
+    if not missing:
+        return badges
+
+    for member_id in missing:
+        badges[member_id] = []
+
+    project_members = DataRequestProjectMember.objects.select_related("project").filter(
+        visible=True,
+        project__approved=True,
+        member_id__in=missing,
+        authorized=True,
+        revoked=False,
+    )
+
+    for project_member in project_members:
+        badges[project_member.member_id].append(project_badge(project_member.project))
+
+    for member_id in Participant.objects.filter(
+        member_id__in=missing, enrolled=True
+    ).values_list("member_id", flat=True):
+        badges[member_id].append(public_data_badge())
+
+    cache.set_many(
+        {
+            member_badges_cache_key(member_id): badges[member_id]
+            for member_id in missing
+        },
+        MEMBER_BADGES_CACHE_TIMEOUT,
+    )
+
+    return badges
+
+
+def forget_member_badges(member_ids):
+    """
+    Drop the cached badge data of the given members.
+    """
+    cache.delete_many([member_badges_cache_key(member_id) for member_id in member_ids])
@@ -3,6 +3,7 @@ import arrow
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from open_humans.storage import abort_multipart_uploads
 from private_sharing.models import ProjectDataFile
 
 
@@ -12,7 +13,8 @@ class Command(BaseCommand):
 
     A ProjectDataFile is incomplete when its `complete` attribute is set to
     False and more time has elapsed than the number of hours in
-    INCOMPLETE_FILE_EXPIRATION_HOURS.
+    INCOMPLETE_FILE_EXPIRATION_HOURS. Any multipart upload to an incomplete
+    file is aborted too, or S3 would keep its parts.
     """
 
     help = "Expunge incomplete project data files"
@@ -25,8 +27,14 @@ class Command(BaseCommand):
         )
 
         # remove incomplete files older than the expiration time
-        expunged_files = ProjectDataFile.all_objects.filter(
+        data_files = ProjectDataFile.all_objects.filter(
             created__lt=expired_time.datetime, completed=False
-        ).delete()
+        )
+
+        aborted_uploads = abort_multipart_uploads(
+            data_files.values_list("file", flat=True)
+        )
+        expunged_files = data_files.delete()
 
+        self.stdout.write("Aborted {} multipart uploads".format(aborted_uploads))
         self.stdout.write("Removed {} data files".format(expunged_files))
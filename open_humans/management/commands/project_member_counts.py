@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from private_sharing.models import DataRequestProject
+
+
+class Command(BaseCommand):
+    """
+    Reconcile the stored project membership counters.
+    """
+
+    help = (
+        "Recount the authorized, joined and public members of every project and "
+        "fix any stored counters that have drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-p",
+            "--project",
+            dest="project_ids",
+            action="append",
+            type=int,
+            help="limit to the given project ID (may be repeated)",
+        )
+
+    def handle(self, *args, **options):
+        projects = DataRequestProject.objects.order_by("id")
+
+        if options["project_ids"]:
+            projects = projects.filter(id__in=options["project_ids"])
+
+        changed = DataRequestProject.update_member_counts(
+            projects.values_list("id", flat=True)
+        )
+
+        self.stdout.write("{0} project(s) out of date".format(changed))
@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand
+
+from private_sharing.models import (
+    DataRequestProject,
+    ProjectDataFile,
+    PublicDataFileIndex,
+)
+
+
+def index_row(row):
+    """
+    Return the comparable contents of a PublicDataFileIndex row.
+    """
+    return (
+        row.data_file_id,
+        row.user_id,
+        row.project_id,
+        row.membership_visible,
+        row.no_public_data,
+    )
+
+
+class Command(BaseCommand):
+    """
+    Rebuild or verify the PublicDataFileIndex.
+    """
+
+    help = (
+        "Rebuild the public data file index from PublicDataAccess, one project "
+        "at a time. With --verify, report differences without changing anything."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="only report projects whose index rows are out of date",
+        )
+
+        parser.add_argument(
+            "-p",
+            "--project",
+            dest="project_ids",
+            action="append",
+            type=int,
+            help="limit to the given project ID (may be repeated)",
+        )
+
+    def handle(self, *args, **options):
+        projects = DataRequestProject.objects.order_by("id")
+
+        if options["project_ids"]:
+            projects = projects.filter(id__in=options["project_ids"])
+
+        stale = 0
+
+        for project_id in projects.values_list("id", flat=True):
+            if not options["verify"]:
+                PublicDataFileIndex.refresh(direct_sharing_project=project_id)
+
+                continue
+
+            expected = set(
+                index_row(row)
+                for row in PublicDataFileIndex.expected_rows(
+                    ProjectDataFile.all_objects.filter(
+                        direct_sharing_project=project_id
+                    )
+                )
+            )
+            actual = set(
+                index_row(row)
+                for row in PublicDataFileIndex.objects.filter(project_id=project_id)
+            )
+
+            if expected != actual:
+                stale += 1
+
+                self.stdout.write(
+                    "Project {0}: {1} missing or changed, {2} extra".format(
+                        project_id, len(expected - actual), len(actual - expected)
+                    )
+                )
+
+        if options["verify"]:
+            self.stdout.write("{0} project(s) out of date".format(stale))
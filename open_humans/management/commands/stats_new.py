@@ -1,78 +1,168 @@
 # -*- coding: utf-8 -*-
 
-import arrow
+import csv
+
+from datetime import timedelta
 
-from django.contrib.auth import get_user_model
-from django.core.management.base import BaseCommand
-from django.db.models import Count
+import arrow
 
-from termcolor import colored
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import (
+    Count,
+    DateTimeField,
+    Exists,
+    ExpressionWrapper,
+    F,
+    OuterRef,
+)
+from django.db.models.functions import TruncDate
 
 from data_import.models import DataFile
-from open_humans.models import Member
+from open_humans.models import DailyStats, Member
 from private_sharing.models import DataRequestProject, DataRequestProjectMember
 
-UserModel = get_user_model()
+STATS_FIELDS = [
+    "members",
+    "members_with_data",
+    "data_connections",
+    "project_connections",
+    "projects_drafted",
+    "projects_approved",
+]
+
+
+def stats_querysets():
+    """
+    Return the queryset behind each statistic and the field holding the time
+    each object was created.
+    """
+    members = Member.objects.filter(user__is_active=True)
+    project_connections = (
+        DataRequestProjectMember.objects.exclude(project__approved=False)
+        .exclude(joined=False)
+        .filter(member__user__is_active=True)
+        .exclude(authorized=False)
+    )
+    projects = DataRequestProject.objects.all()
+
+    return {
+        "members": (members, "user__date_joined"),
+        "members_with_data": (
+            members.filter(Exists(DataFile.objects.filter(user=OuterRef("user")))),
+            "user__date_joined",
+        ),
+        "data_connections": (
+            project_connections.exclude(project__returned_data_description=""),
+            "created",
+        ),
+        "project_connections": (project_connections, "created"),
+        "projects_drafted": (projects, "created"),
+        "projects_approved": (projects.filter(approved=True), "created"),
+    }
+
+
+def daily_counts(queryset, field, dates):
+    """
+    Count the objects created at or before the start of each date, with one
+    query for the first date and one grouped query for the rest.
+    """
+    start = arrow.get(dates[0]).datetime
+    end = arrow.get(dates[-1]).datetime
+
+    total = queryset.filter(**{field + "__lte": start}).count()
+
+    # Objects created during a day are first counted at the start of the next
+    added = dict(
+        queryset.filter(**{field + "__gt": start, field + "__lte": end})
+        .annotate(
+            day=TruncDate(
+                ExpressionWrapper(
+                    F(field) - timedelta(microseconds=1), output_field=DateTimeField()
+                )
+            )
+        )
+        .order_by()
+        .values("day")
+        .annotate(count=Count("pk"))
+        .values_list("day", "count")
+    )
+
+    counts = [total]
+    for date in dates[1:]:
+        total += added.get(date - timedelta(days=1), 0)
+        counts.append(total)
+
+    return counts
 
 
 class Command(BaseCommand):
-    help = "Statistics on the site"
+    help = "Daily statistics on the site"
     args = ""
 
     def add_arguments(self, parser):
         parser.add_argument("--start-date", type=str, help="stats as of this date")
-        parser.add_argument("--end-date", type=str, help="stats up to this date")
+        parser.add_argument(
+            "--end-date", type=str, help="stats up to this date (default: today)"
+        )
+        parser.add_argument(
+            "--format",
+            choices=["csv", "tsv"],
+            default="tsv",
+            help="output format (default: tsv)",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "only compute the days after the last stored day, and store "
+                "them; --start-date is used if nothing is stored yet"
+            ),
+        )
 
     def handle(self, *args, **options):
-        start_cutoff = arrow.get(options["start_date"])
-        end_cutoff = arrow.get(options["end_date"])
+        start_date = None
+        if options["start_date"]:
+            start_date = arrow.get(options["start_date"]).date()
+        end_date = arrow.get(options["end_date"] or arrow.utcnow()).date()
 
-        for date in arrow.Arrow.range("day", start_cutoff, end_cutoff):
-            cutoff = date.datetime
-            members = Member.objects.filter(user__date_joined__lte=cutoff).filter(
-                user__is_active=True
-            )
-            members_with_data = members.annotate(
-                datafiles_count=Count("user__datafiles")
-            ).filter(datafiles_count__gte=1)
-            projects_made = DataRequestProject.objects.filter(created__lte=cutoff)
-            projects_approved = projects_made.filter(approved=True)
-
-            data_connections = (
-                DataRequestProjectMember.objects.exclude(project__approved=False)
-                .exclude(joined=False)
-                .filter(member__user__is_active=True)
-                .exclude(authorized=False)
-                .exclude(project__returned_data_description="")
-                .filter(created__lte=cutoff)
-            )
+        if options["incremental"]:
+            last_stats = DailyStats.objects.last()
+            if last_stats:
+                start_date = last_stats.date + timedelta(days=1)
 
-            proj_connections = (
-                DataRequestProjectMember.objects.exclude(project__approved=False)
-                .exclude(joined=False)
-                .filter(member__user__is_active=True)
-                .exclude(authorized=False)
-                .filter(created__lte=cutoff)
-            )
+        if not start_date:
+            raise CommandError("--start-date is required")
 
-            """
-            print("Members: {}".format(members.count()))
-            print("Members with data: {}".format(
-                members_with_data.count()))
-            print("Data connections: {}".format(len(data_connections)))
-            print("Project connections: {}".format(proj_connections.count()))
-            print("Projects drafted: {}".format(projects_made.count()))
-            print("Projects approved: {}".format(projects_approved.count()))
-            """
-
-            print(
-                "{}\t{}\t{}\t{}\t{}\t{}\t{}".format(
-                    date.format("YYYY-MM-DD"),
-                    members.count(),
-                    members_with_data.count(),
-                    len(data_connections),
-                    proj_connections.count(),
-                    projects_made.count(),
-                    projects_approved.count(),
-                )
+        dates = [
+            start_date + timedelta(days=days)
+            for days in range((end_date - start_date).days + 1)
+        ]
+
+        writer = csv.writer(
+            self.stdout,
+            delimiter="," if options["format"] == "csv" else "\t",
+            lineterminator="\n",
+        )
+        writer.writerow(["date"] + STATS_FIELDS)
+
+        if not dates:
+            return
+
+        querysets = stats_querysets()
+        counts = {
+            name: daily_counts(queryset, field, dates)
+            for name, (queryset, field) in querysets.items()
+        }
+
+        stats = [
+            DailyStats(date=date, **{name: counts[name][i] for name in STATS_FIELDS})
+            for i, date in enumerate(dates)
+        ]
+
+        if options["incremental"]:
+            DailyStats.objects.bulk_create(stats)
+
+        for row in stats:
+            writer.writerow(
+                [row.date.isoformat()] + [getattr(row, name) for name in STATS_FIELDS]
             )
@@ -1,12 +1,17 @@
 import json
 import itertools
 
+from allauth.account.models import EmailAddress
+
 from django.core.management.base import BaseCommand
+from django.db.models.functions import Collate
 
 from common.utils import get_source_labels
 from open_humans.models import Member
-from private_sharing.models import ProjectDataFile
-from public_data.models import is_public
+from private_sharing.models import ProjectDataFile, id_label_to_project
+from public_data.models import PublicDataAccess
+
+CHUNK_SIZE = 1000
 
 
 def flatten(l):
@@ -16,6 +21,39 @@ def flatten(l):
     return list(itertools.chain.from_iterable(l))
 
 
+def chunked(iterable, size):
+    """
+    Yield lists of up to size items from iterable.
+    """
+    iterator = iter(iterable)
+
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+
+        yield chunk
+
+
+def write_json_object(f, items):
+    """
+    Write (key, value) pairs as one JSON object, as json.dump(..., indent=2,
+    sort_keys=True) would, without holding all of them in memory. The items
+    must already be sorted by key.
+    """
+    f.write("{")
+
+    empty = True
+    for key, value in items:
+        f.write("\n  " if empty else ",\n  ")
+        f.write(json.dumps(key))
+        f.write(": ")
+        f.write(json.dumps(value, sort_keys=True, indent=2).replace("\n", "\n  "))
+        empty = False
+
+    f.write("}" if empty else "\n}")
+
+
 class Command(BaseCommand):
     """
     Return list of users matching a particular flag.
@@ -25,51 +63,98 @@ class Command(BaseCommand):
         parser.add_argument("outputfile")
 
     @staticmethod
-    def get_member_data(member):
-        member_data = {}
+    def get_source_projects(sources):
+        """
+        Map each source label to the ID of its project, if it has one.
+        """
+        source_projects = {}
 
-        for source in get_source_labels():
-            userdata = getattr(member.user, source)
-            is_connected = bool(userdata.is_connected)
+        for source in sources:
+            project = id_label_to_project(source)
+            source_projects[source] = project.id if project else None
 
-            has_files, source_is_public = (False, False)
+        return source_projects
 
-            # Check for files.
-            has_files = (
-                ProjectDataFile.objects.filter(user=member.user, source=source).count()
-                > 0
+    @staticmethod
+    def get_chunk_data(members, sources, source_projects):
+        """
+        Look up files, public sharing and email verification for a chunk of
+        members with one query each.
+        """
+        user_ids = [member.user_id for member in members]
+
+        has_files = set(
+            ProjectDataFile.objects.filter(user_id__in=user_ids, source__in=sources)
+            .values_list("user_id", "source")
+            .distinct()
+        )
+
+        public = set(
+            PublicDataAccess.objects.filter(
+                participant__member__in=members,
+                project_membership__project__in=[
+                    project_id for project_id in source_projects.values() if project_id
+                ],
+                is_public=True,
+            ).values_list("participant__member_id", "project_membership__project_id")
+        )
+
+        email_verified = dict(
+            EmailAddress.objects.filter(user_id__in=user_ids, primary=True).values_list(
+                "user_id", "verified"
             )
+        )
 
-            # Check public sharing.
-            if is_connected:
-                source_is_public = is_public(member, source)
+        return has_files, public, email_verified
 
-            member_data[source] = {
-                "is_connected": is_connected,
-                "has_files": has_files,
-                "is_public": source_is_public,
-            }
+    def get_members_data(self):
+        """
+        Yield (username, data) pairs for every member, sorted by username.
+        """
+        sources = get_source_labels()
+        source_projects = self.get_source_projects(sources)
+
+        related = ["user__{0}".format(source) for source in sources]
+
+        # Sort usernames by byte order, as json.dump(..., sort_keys=True) would
+        members = (
+            Member.objects.exclude(user__username="api-administrator")
+            .select_related("user", "public_data_participant", *related)
+            .order_by(Collate("user__username", "C"))
+        )
+
+        for chunk in chunked(members.iterator(chunk_size=CHUNK_SIZE), CHUNK_SIZE):
+            has_files, public, email_verified = self.get_chunk_data(
+                chunk, sources, source_projects
+            )
 
-        member_data["date_joined"] = member.user.date_joined.strftime("%Y%m%dT%H%M%SZ")
+            for member in chunk:
+                member_data = {}
 
-        if member.primary_email:
-            member_data["email_verified"] = member.primary_email.verified
-        else:
-            member_data["email_verified"] = False
+                for source in sources:
+                    userdata = getattr(member.user, source)
+                    is_connected = bool(userdata.is_connected)
 
-        member_data["public_data_participant"] = member.public_data_participant.enrolled
+                    member_data[source] = {
+                        "is_connected": is_connected,
+                        "has_files": (member.user_id, source) in has_files,
+                        # Check public sharing.
+                        "is_public": is_connected
+                        and (member.id, source_projects[source]) in public,
+                    }
 
-        return member_data
+                member_data["date_joined"] = member.user.date_joined.strftime(
+                    "%Y%m%dT%H%M%SZ"
+                )
+                member_data["email_verified"] = email_verified.get(
+                    member.user_id, False
+                )
 
-    def get_members_data(self):
-        members = Member.objects.all().exclude(user__username="api-administrator")
+                participant = member.public_data_participant
+                member_data["public_data_participant"] = participant.enrolled
 
-        return {
-            member.user.username: self.get_member_data(member) for member in members
-        }
+                yield member.user.username, member_data
 
     def handle(self, *args, **options):
-        data = self.get_members_data()
-
         with open(options["outputfile"], "w") as f:
-            json.dump(data, f, sort_keys=True, indent=2)
+            write_json_object(f, self.get_members_data())
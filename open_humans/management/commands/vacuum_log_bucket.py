@@ -1,154 +1,306 @@
+import re
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 from urllib.parse import urlparse, parse_qs
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.http import HttpRequest
 
 import boto3
-from pyparsing import ZeroOrMore, Regex
 
-from data_import.models import DataFile, AWSDataFileAccessLog, NewDataFileAccessLog
-from data_import.serializers import serialize_datafile_to_dict
+from data_import.models import (
+    AWSDataFileAccessLog,
+    AWSLogObjectCheckpoint,
+    DataFile,
+    NewDataFileAccessLog,
+)
+from data_import.serializers import DataFileSerializer, serialize_datafiles_to_dicts
 
 from waffle import get_waffle_flag_model
 
 AWS_LOG_KEY_BLACKLIST = ["favicon.ico"]
 
+# Bracketed, quoted or space-separated fields, see:
+# https://stackoverflow.com/questions/27303977/split-string-at-double-quotes-and-box-brackets
+AWS_LOG_ENTRY_RE = re.compile(r'\[[^]]*\]|"[^"]*"|[^ ]+')
+
+AWS_LOG_FIELDS = [
+    "bucket_owner",
+    "bucket",
+    "time",
+    "remote_ip",
+    "requester",
+    "request_id",
+    "operation",
+    "bucket_key",
+    "request_uri",
+    "status",
+    "error_code",
+    "bytes_sent",
+    "object_size",
+    "total_time",
+    "turn_around_time",
+    "referrer",
+    "user_agent",
+    "version_id",
+    "host_id",
+    "signature_version",
+    "cipher_suite",
+    "auth_type",
+    "host_header",
+]
+
+AWS_LOG_FIELD_TYPES = {
+    field_name: AWSDataFileAccessLog._meta.get_field(field_name).get_internal_type()
+    for field_name in AWS_LOG_FIELDS
+}
+
 User = get_user_model()
 FlagModel = get_waffle_flag_model()
 
 
+def parse_log_entry(log_entry):
+    """
+    Parse one line of an S3 server access log into an unsaved
+    AWSDataFileAccessLog, or return None for internal S3 operations.
+    """
+    log = AWS_LOG_ENTRY_RE.findall(log_entry)
+
+    if log[4] == "AmazonS3":
+        # Internal S3 operation, can be skipped
+        return None
+
+    aws_log_entry = AWSDataFileAccessLog()
+
+    for index, field_name in enumerate(AWS_LOG_FIELDS):
+        field_type = AWS_LOG_FIELD_TYPES[field_name]
+        if "IntegerField" in field_type:
+            log_item = log[index]
+            if (log_item == "-") or (log_item == '"-"'):
+                log_item = 0
+            log[index] = int(log_item)
+        if field_type == "DateTimeField":
+            log[index] = datetime.strptime(log[index], "[%d/%b/%Y:%H:%M:%S %z]")
+        if index == 17:
+            # Sometimes, aws inserts a stray '-' here, klugey workaround
+            if (log[17] == "-") and (len(log[18]) < 32):
+                # The actual Host ID is always quite long
+                log.pop(17)
+
+        setattr(aws_log_entry, field_name, log[index])
+
+    return aws_log_entry
+
+
+def read_log_object(client, key):
+    """
+    Download and parse a log object, returning (AWSDataFileAccessLog, oh_key)
+    pairs for the entries we want to keep. Runs in the thread pool.
+    """
+    body = client.get_object(Bucket=settings.LOG_BUCKET, Key=key)["Body"].read()
+
+    entries = []
+
+    for log_entry in body.decode("utf-8").split("\n"):
+        if not log_entry:
+            continue
+
+        aws_log_entry = parse_log_entry(log_entry)
+        if not aws_log_entry:
+            continue
+
+        url = aws_log_entry.request_uri.split(" ")[1]
+
+        # Filter out things we don't care to log
+        if settings.AWS_STORAGE_BUCKET_NAME in url:
+            continue
+        if "GET" not in str(aws_log_entry.operation):
+            continue
+        if any(blacklist_item in url for blacklist_item in AWS_LOG_KEY_BLACKLIST):
+            continue
+
+        # Split out the key from the url; parse_qs returns a dict with lists as
+        # values
+        oh_key = parse_qs(urlparse(url).query).get("x-oh-key", [""])[0]
+        if oh_key == "None":
+            oh_key = None
+
+        entries.append((aws_log_entry, oh_key))
+
+    return entries
+
+
 class Command(BaseCommand):
     """
     A management command vaccuming up file access logs and putting them in the database.
     """
 
-    help = "Populates database with file access logs"
+    help = (
+        "Populates database with file access logs. Log objects are downloaded "
+        "in parallel and deleted from the bucket once their entries are saved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-w",
+            "--workers",
+            dest="workers",
+            type=int,
+            default=8,
+            help="number of log objects to download at once (default: 8)",
+        )
 
     def handle(self, *args, **options):
         self.stdout.write("Retreiving file access logs")
-        s3 = boto3.resource("s3")
-        bucket = s3.Bucket(settings.LOG_BUCKET)
-        for item in bucket.objects.all():
-            log_objects = item.get()["Body"].read().decode("utf-8").split("\n")
-            for log_entry in log_objects:
-                if not log_entry:
-                    continue
-
-                # This here solution brought to you by Stack Overflow:
-                # https://stackoverflow.com/questions/27303977/split-string-at-double-quotes-and-box-brackets
-                parser = ZeroOrMore(
-                    Regex(r"\[[^]]*\]") | Regex(r'"[^"]*"') | Regex(r"[^ ]+")
-                )
-                log = list(parser.parseString(log_entry))
-
-                if log[4] == "AmazonS3":
-                    # Internal S3 operation, can be skipped
-                    continue
-
-                aws_log_entry = AWSDataFileAccessLog()
-                fields = [
-                    "bucket_owner",
-                    "bucket",
-                    "time",
-                    "remote_ip",
-                    "requester",
-                    "request_id",
-                    "operation",
-                    "bucket_key",
-                    "request_uri",
-                    "status",
-                    "error_code",
-                    "bytes_sent",
-                    "object_size",
-                    "total_time",
-                    "turn_around_time",
-                    "referrer",
-                    "user_agent",
-                    "version_id",
-                    "host_id",
-                    "signature_version",
-                    "cipher_suite",
-                    "auth_type",
-                    "host_header",
-                ]
-                for index, field_name in enumerate(fields):
-                    field = aws_log_entry._meta.get_field(field_name)
-                    if "IntegerField" in field.get_internal_type():
-                        log_item = log[index]
-                        if (log_item == "-") or (log_item == '"-"'):
-                            log_item = 0
-                        log[index] = int(log_item)
-                    if field.get_internal_type() == "DateTimeField":
-                        log[index] = datetime.strptime(
-                            log[index], "[%d/%b/%Y:%H:%M:%S %z]"
-                        )
-                    if index == 17:
-                        # Sometimes, aws inserts a stray '-' here, klugey workaround
-                        if (log[17] == "-") and (len(log[18]) < 32):
-                            # The actual Host ID is always quite long
-                            log.pop(17)
-
-                    setattr(aws_log_entry, field_name, log[index])
-
-                url = aws_log_entry.request_uri.split(" ")[1]
-                # Split out the key from the url
-                parsed_url = urlparse(url)
-                # parse_qs returns a dict with lists as values
-                oh_key = parse_qs(parsed_url.query).get("x-oh-key", [""])[0]
-
-                if oh_key == "None":
-                    oh_key = None
-                if oh_key:
-                    oh_data_file_access_logs = NewDataFileAccessLog.objects.filter(
-                        data_file_key__key=oh_key
+
+        self.flag = FlagModel.get("datafile-access-logging")
+        self.flag_request = HttpRequest()
+        self.flag_active = {}
+
+        client = boto3.client("s3")
+        paginator = client.get_paginator("list_objects_v2")
+        saved = 0
+
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            for page in paginator.paginate(Bucket=settings.LOG_BUCKET):
+                keys = [item["Key"] for item in page.get("Contents", [])]
+
+                # Objects whose entries were saved by a run that failed before
+                # deleting them
+                ingested = set(
+                    AWSLogObjectCheckpoint.objects.filter(key__in=keys).values_list(
+                        "key", flat=True
                     )
-                else:
-                    oh_data_file_access_logs = None
-                data_file = DataFile.objects.filter(file=aws_log_entry.bucket_key)
-                if data_file:
-                    if data_file.count() == 1:
-                        aws_log_entry.serialized_data_file = serialize_datafile_to_dict(
-                            data_file.get()
-                        )
-
-                    elif oh_data_file_access_logs:
-                        aws_log_entry.serialized_data_file = serialize_datafile_to_dict(
-                            oh_data_file_access_logs.get().data_file
-                        )
-                    else:
-                        aws_log_entry.serialized_data_file = None
-
-                # Get target datafile user, if possible.
-                datafile_user = AnonymousUser()
-                if data_file:
-                    datafile_user = data_file.user
-                elif oh_data_file_access_logs:
-                    user_id = oh_data_file_access_logs.get().serialized_data_file[
-                        "user_id"
-                    ]
-                    datafile_user = User.objects.get(id=user_id)
-
-                # Abort if the feature is inactive.
-                flag = FlagModel.get("datafile-access-logging")
-                if not flag.is_active(request=request, subject=datafile_user):
-                    continue
-
-                # Filter out things we don't care to log
-                if settings.AWS_STORAGE_BUCKET_NAME in url:
-                    continue
-                if "GET" not in str(aws_log_entry.operation):
-                    continue
-                if any(
-                    blacklist_item in url for blacklist_item in AWS_LOG_KEY_BLACKLIST
+                )
+                for key in ingested:
+                    self.delete_log_object(client, key)
+                keys = [key for key in keys if key not in ingested]
+
+                for key, entries in zip(
+                    keys, executor.map(partial(read_log_object, client), keys)
                 ):
-                    continue
-                aws_log_entry.save()
+                    saved += self.save_entries(key, entries)
+
+                    self.delete_log_object(client, key)
+
+        self.stdout.write("Saved {0} file access logs".format(saved))
+
+    @staticmethod
+    def delete_log_object(client, key):
+        client.delete_object(Bucket=settings.LOG_BUCKET, Key=key)
+        AWSLogObjectCheckpoint.objects.filter(key=key).delete()
+
+    def is_flag_active(self, user):
+        """
+        Check the feature flag for the owner of a file, once per owner.
+        """
+        if user.id not in self.flag_active:
+            self.flag_active[user.id] = self.flag.is_active(
+                request=self.flag_request, subject=user
+            )
+
+        return self.flag_active[user.id]
+
+    def save_entries(self, key, entries):
+        """
+        Save the entries of one log object, looking up the data files and Open
+        Humans access logs they refer to with a few queries for all of them.
+
+        The object's checkpoint is saved in the same transaction, so its entries
+        are never saved twice.
+        """
+        data_file_ids = defaultdict(list)
+        for data_file_id, bucket_key in DataFile.objects.filter(
+            file__in={aws_log_entry.bucket_key for aws_log_entry, _ in entries}
+        ).values_list("id", "file"):
+            data_file_ids[bucket_key].append(data_file_id)
+
+        oh_logs = defaultdict(list)
+        oh_keys = {oh_key for _, oh_key in entries if oh_key}
+        if oh_keys:
+            for oh_log in NewDataFileAccessLog.objects.filter(
+                data_file_key__key__in=oh_keys
+            ):
+                oh_logs[oh_log.data_file_key["key"]].append(oh_log)
+
+        # Pick the data file each entry refers to
+        resolved = []
+        for aws_log_entry, oh_key in entries:
+            matches = data_file_ids.get(aws_log_entry.bucket_key, [])
+            entry_oh_logs = oh_logs.get(oh_key, [])
+
+            data_file_id = None
+            if len(matches) == 1:
+                data_file_id = matches[0]
+            elif matches and entry_oh_logs:
+                data_file_id = entry_oh_logs[0].data_file_id
+
+            resolved.append((aws_log_entry, matches, entry_oh_logs, data_file_id))
+
+        data_files = {
+            data_file.id: data_file
+            for data_file in DataFileSerializer.setup_eager_loading(
+                DataFile.objects.filter(
+                    id__in={data_file_id for _, _, _, data_file_id in resolved}
+                )
+            )
+        }
+        serialized_data_files = serialize_datafiles_to_dicts(list(data_files.values()))
+
+        user_ids = {data_file.user_id for data_file in data_files.values()}
+        for aws_log_entry, matches, entry_oh_logs, data_file_id in resolved:
+            if not matches and entry_oh_logs:
+                user_ids.add(entry_oh_logs[0].serialized_data_file["user_id"])
+        users = User.objects.in_bulk(user_ids)
+
+        rows = []
+        row_oh_logs = []
+        for aws_log_entry, matches, entry_oh_logs, data_file_id in resolved:
+            if matches:
+                aws_log_entry.serialized_data_file = serialized_data_files.get(
+                    data_file_id, None
+                )
+
+            # Get target datafile user, if possible.
+            datafile_user = AnonymousUser()
+            if data_file_id in data_files:
+                datafile_user = users[data_files[data_file_id].user_id]
+            elif not matches and entry_oh_logs:
+                datafile_user = users.get(
+                    entry_oh_logs[0].serialized_data_file["user_id"], datafile_user
+                )
+
+            # Skip if the feature is inactive.
+            if not self.is_flag_active(datafile_user):
+                continue
+
+            rows.append(aws_log_entry)
+            row_oh_logs.append(entry_oh_logs)
+
+        Through = AWSDataFileAccessLog.oh_data_file_access_log.through
+
+        with transaction.atomic():
+            AWSDataFileAccessLog.objects.bulk_create(rows)
+
+            # Associate with any potential access logs from the Open Humans end.
+            Through.objects.bulk_create(
+                [
+                    Through(
+                        awsdatafileaccesslog_id=row.id,
+                        newdatafileaccesslog_id=oh_log.id,
+                    )
+                    for row, entry_oh_logs in zip(rows, row_oh_logs)
+                    for oh_log in entry_oh_logs
+                ]
+            )
 
-                # Associate with any potential access logs from the Open Humans end.
-                if oh_data_file_access_logs:
-                    aws_log_entry.oh_data_file_access_log.set(oh_data_file_access_logs)
+            AWSLogObjectCheckpoint.objects.create(key=key)
 
-            item.delete()
+        return len(rows)
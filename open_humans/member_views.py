@@ -9,6 +9,7 @@ from django.contrib.auth import get_user_model
 from django.db.models import Count, Q
 from django.http import Http404, HttpResponseRedirect
 from django.urls import reverse, reverse_lazy
+from django.utils.functional import SimpleLazyObject
 from django.utils.safestring import mark_safe
 from django.views.generic.base import RedirectView, TemplateView, View
 from django.views.generic.detail import DetailView, SingleObjectMixin
@@ -28,6 +29,7 @@ from private_sharing.models import (
     id_label_to_project,
 )
 
+from .badges import get_member_badges
 from .forms import (
     EmailUserForm,
     MemberChangeNameForm,
@@ -117,7 +119,17 @@ class MemberListView(ListView):
         """
         context = super().get_context_data(**kwargs)
         projects = DataRequestProject.objects.filter(approved=True, active=True)
-        context.update({"projects": projects, "filter": self.request.GET.get("filter")})
+        members = context["members"]
+        context.update(
+            {
+                "projects": projects,
+                "filter": self.request.GET.get("filter"),
+                # Only loaded if the cached member list needs rendering
+                "member_badges": SimpleLazyObject(
+                    lambda: get_member_badges([member.id for member in members])
+                ),
+            }
+        )
 
         return context
 
@@ -1,9 +1,13 @@
 import logging
+import re
+import uuid
 
+from collections import Counter
 from urllib.parse import urljoin
 
 from django.conf import settings
-from django.http import HttpResponseRedirect
+from django.core.cache import cache
+from django.http import HttpResponseForbidden, HttpResponseRedirect
 
 from waffle import get_waffle_flag_model
 from waffle.middleware import WaffleMiddleware
@@ -15,6 +19,36 @@ logger = logging.getLogger(__name__)
 
 WaffleFlag = get_waffle_flag_model()
 
+TESTING_FLAGS_VERSION_KEY = "open-humans:waffle-testing-flags-version"
+
+# This process's copy of the testing flag names and the version it was read at
+_testing_flags = {"version": None, "names": ()}
+
+
+def forget_testing_flags():
+    """
+    Start a new version of the testing flags, so every process reloads them.
+    """
+    cache.set(TESTING_FLAGS_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def get_testing_flag_names():
+    """
+    Return the names of waffle flags that are in testing mode.
+
+    Names are kept per process and only reloaded when the version in the shared
+    cache changes.
+    """
+    version = cache.get_or_set(TESTING_FLAGS_VERSION_KEY, uuid.uuid4().hex, None)
+
+    if _testing_flags["version"] != version:
+        _testing_flags["names"] = tuple(
+            WaffleFlag.objects.filter(testing=True).values_list("name", flat=True)
+        )
+        _testing_flags["version"] = version
+
+    return _testing_flags["names"]
+
 
 class HttpResponseTemporaryRedirect(HttpResponseRedirect):
     """
@@ -37,6 +71,57 @@ def get_production_redirect(request):
     return HttpResponseTemporaryRedirect(redirect_url)
 
 
+def compile_user_agent_blocklist(patterns):
+    """
+    Compile substrings into a single regex that matches any of them.
+
+    Longer strings come first so a match reports the most specific one.
+    """
+    patterns = sorted(set(patterns), key=len, reverse=True)
+
+    if not patterns:
+        return None
+
+    return re.compile("|".join(re.escape(pattern) for pattern in patterns))
+
+
+class BlockedUserAgentMiddleware(object):
+    """
+    Refuse requests from the user agents in BLOCKED_USER_AGENTS.
+
+    This runs before the session, authentication and waffle middleware so that
+    blocked requests cost a single regex search. The number of blocked requests
+    for each pattern is kept in blocked_counts and logged periodically.
+    """
+
+    log_every = 1000
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.blocklist = compile_user_agent_blocklist(settings.BLOCKED_USER_AGENTS)
+        self.blocked_counts = Counter()
+        self.blocked_total = 0
+
+    def __call__(self, request):
+        if self.blocklist:
+            match = self.blocklist.search(request.META.get("HTTP_USER_AGENT", ""))
+
+            if match:
+                self.blocked_counts[match.group(0)] += 1
+
+                self.blocked_total += 1
+
+                if self.blocked_total % self.log_every == 0:
+                    logger.info(
+                        "Blocked user agent counts: %s",
+                        dict(self.blocked_counts.most_common()),
+                    )
+
+                return HttpResponseForbidden()
+
+        return self.get_response(request)
+
+
 class QueryStringAccessTokenToBearerMiddleware(object):
     """
     django-oauth-toolkit wants access tokens specified using the
@@ -111,13 +196,20 @@ class CustomWaffleMiddleware(WaffleMiddleware):
         self.get_response = get_response
 
     def __call__(self, request):
-        for flag in WaffleFlag.objects.filter(testing=True):
-            tc = get_waffle_setting("TEST_COOKIE") % flag.name
+        test_cookie = get_waffle_setting("TEST_COOKIE")
+
+        # Most requests don't set any testing flags; skip looking them up.
+        prefix = test_cookie % ""
+        if not any(key.startswith(prefix) for key in request.GET):
+            return self.process_response(request, self.get_response(request))
+
+        for name in get_testing_flag_names():
+            tc = test_cookie % name
             if tc in request.GET:
                 on = request.GET[tc] == "1"
                 if not hasattr(request, "waffle_tests"):
                     request.waffle_tests = {}
-                request.waffle_tests[flag.name] = on
+                request.waffle_tests[name] = on
         return self.process_response(request, self.get_response(request))
 
 
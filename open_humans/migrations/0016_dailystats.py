@@ -0,0 +1,37 @@
+# Generated by Django 3.2 on 2026-10-18 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("open_humans", "0015_featureflag"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyStats",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(unique=True)),
+                ("members", models.PositiveIntegerField()),
+                ("members_with_data", models.PositiveIntegerField()),
+                ("data_connections", models.PositiveIntegerField()),
+                ("project_connections", models.PositiveIntegerField()),
+                ("projects_drafted", models.PositiveIntegerField()),
+                ("projects_approved", models.PositiveIntegerField()),
+            ],
+            options={
+                "ordering": ["date"],
+            },
+        ),
+    ]
@@ -1,17 +1,20 @@
 import random
 import re
+import time
 
 from collections import OrderedDict
 
 import arrow
 from allauth.account.models import EmailAddress as AccountEmailAddress
 from bs4 import BeautifulSoup
+import feedparser
 
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser, UserManager
 from django.contrib.auth.validators import ASCIIUsernameValidator
 from django.contrib.postgres.fields import JSONField
+from django.core.cache import cache
 from django.db import models
 from django.db.models import Q
 from django.utils.deconstruct import deconstructible
@@ -153,6 +156,11 @@ class User(AbstractUser):
 
     objects = OpenHumansUserManager()
 
+    def __init__(self, *args, **kwargs):
+        # Adds self.old_is_active so that we can detect when the field changes
+        super().__init__(*args, **kwargs)
+        self.old_is_active = self.is_active
+
     def log(self, event_type, data):
         """
         Log an event to this user.
@@ -272,6 +280,15 @@ class BlogPost(models.Model):
     Store data about blogposts, to be displayed on the site.
     """
 
+    FEED_URL = "https://blog.openhumans.org/feed/"
+    FEED_TIMEOUT = 10
+    RECENT_COUNT = 3
+    RECENT_CACHE_KEY = "blogposts:recent"
+    REFRESH_QUEUED_KEY = "blogposts:refresh-queued"
+    # After this long the cached posts are still shown, but refreshed in the
+    # background
+    RECENT_FRESH_SECONDS = 60 * 10
+
     rss_id = models.CharField(max_length=120, unique=True)
     title = models.CharField(max_length=120, blank=True)
     summary_long = models.TextField(blank=True)
@@ -283,7 +300,7 @@ class BlogPost(models.Model):
     def create(cls, rss_feed_entry):
         post = cls(rss_id=rss_feed_entry["id"])
         post.summary_long = rss_feed_entry["summary"]
-        req = requests.get(rss_feed_entry["id"])
+        req = requests.get(rss_feed_entry["id"], timeout=cls.FEED_TIMEOUT)
         soup = BeautifulSoup(req.text, features="html.parser")
         post.title = soup.find(attrs={"property": "og:title"})["content"][0:120]
         post.summary_short = soup.find(attrs={"property": "og:description"})["content"]
@@ -296,6 +313,43 @@ class BlogPost(models.Model):
         post.save()
         return post
 
+    @classmethod
+    def fetch_recent(cls):
+        """
+        Read the blog's feed, store any new posts, and cache the most recent.
+        """
+        response = requests.get(cls.FEED_URL, timeout=cls.FEED_TIMEOUT)
+        response.raise_for_status()
+
+        blogfeed = feedparser.parse(response.content)
+        posts = []
+        for item in blogfeed["entries"][0 : cls.RECENT_COUNT]:
+            try:
+                post = cls.objects.get(rss_id=item["id"])
+            except cls.DoesNotExist:
+                post = cls.create(rss_feed_entry=item)
+            posts.append(post)
+
+        cache.set(
+            cls.RECENT_CACHE_KEY,
+            {"posts": posts, "fresh_until": time.time() + cls.RECENT_FRESH_SECONDS},
+            timeout=None,
+        )
+        return posts
+
+    @classmethod
+    def get_recent(cls):
+        """
+        Return the most recent posts and whether they're due for a refresh,
+        without contacting the blog.
+        """
+        cached = cache.get(cls.RECENT_CACHE_KEY)
+        if cached is None:
+            posts = list(cls.objects.order_by("-published")[0 : cls.RECENT_COUNT])
+            return posts, True
+
+        return cached["posts"], cached["fresh_until"] < time.time()
+
     @property
     def published_day(self):
         return arrow.get(self.published).format("ddd, MMM D YYYY")
@@ -323,3 +377,23 @@ class GrantProject(models.Model):
 
     def __str__(self):
         return str(self.name)
+
+
+class DailyStats(models.Model):
+    """
+    Site statistics as of the start of a day, stored by the stats_new command.
+    """
+
+    date = models.DateField(unique=True)
+    members = models.PositiveIntegerField()
+    members_with_data = models.PositiveIntegerField()
+    data_connections = models.PositiveIntegerField()
+    project_connections = models.PositiveIntegerField()
+    projects_drafted = models.PositiveIntegerField()
+    projects_approved = models.PositiveIntegerField()
+
+    class Meta:  # noqa: D101
+        ordering = ["date"]
+
+    def __str__(self):
+        return str(self.date)
@@ -0,0 +1,95 @@
+"""
+Listings of the Open Humans Exploratory notebooks that use each project as a
+data source.
+
+The listings are fetched by the refresh_project_notebooks task and only read from
+the cache while handling a request.
+"""
+
+import logging
+import time
+
+from django.core.cache import cache
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+NOTEBOOKS_URL = "https://exploratory.openhumans.org/notebook_by_source/"
+NOTEBOOKS_TIMEOUT = 5
+
+# Keep listings for a day, so they survive the service being down for a while
+NOTEBOOKS_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Stop a refresh after this many failed requests in a row, then skip refreshes
+# until the circuit closes again
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_OPEN_SECONDS = 60 * 15
+CIRCUIT_OPEN_KEY = "notebooks:circuit-open-until"
+
+
+def notebooks_cache_key(project):
+    return "notebooks:{0}".format(project.id)
+
+
+def get_notebooks(project):
+    """
+    Return the cached notebooks for a project, or None if there aren't any.
+    """
+    return cache.get(notebooks_cache_key(project))
+
+
+def fetch_notebooks(project):
+    """
+    Get the notebooks using a project as a source from Exploratory.
+    """
+    response = requests.get(
+        NOTEBOOKS_URL, params={"source": project.name}, timeout=NOTEBOOKS_TIMEOUT
+    )
+    response.raise_for_status()
+
+    notebooks = response.json()["notebooks"]
+    for notebook in notebooks:
+        if notebook["name"].endswith(".ipynb"):
+            notebook["name"] = notebook["name"][:-6]
+    return notebooks
+
+
+def refresh_notebooks(projects):
+    """
+    Fetch and cache the notebooks for each project.
+
+    Returns the number of projects refreshed.
+    """
+    if cache.get(CIRCUIT_OPEN_KEY, 0) > time.time():
+        logger.info("Skipping notebook refresh; Exploratory is unavailable")
+        return 0
+
+    refreshed = 0
+    failures = 0
+
+    for project in projects:
+        try:
+            notebooks = fetch_notebooks(project)
+        except (requests.RequestException, KeyError, TypeError, ValueError) as error:
+            logger.warning('Unable to get notebooks for "%s": %s', project.name, error)
+
+            failures += 1
+            if failures >= CIRCUIT_FAILURE_THRESHOLD:
+                cache.set(
+                    CIRCUIT_OPEN_KEY,
+                    time.time() + CIRCUIT_OPEN_SECONDS,
+                    timeout=CIRCUIT_OPEN_SECONDS,
+                )
+                logger.warning("Stopping notebook refresh after %s failures", failures)
+                break
+
+            continue
+
+        failures = 0
+        refreshed += 1
+        cache.set(
+            notebooks_cache_key(project), notebooks, timeout=NOTEBOOKS_CACHE_TIMEOUT
+        )
+
+    return refreshed
@@ -0,0 +1,50 @@
+from django.conf import settings
+
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Cursor pagination ordered by primary key.
+
+    Each page is an indexed range scan from the previous page's last id, and no
+    COUNT query is run.
+    """
+
+    ordering = "id"
+    page_size = settings.REST_FRAMEWORK["PAGE_SIZE"]
+    page_size_query_param = "limit"
+    max_page_size = 1000
+
+
+class OptionalCursorPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination by default; cursor pagination when the request
+    asks for it with `pagination=cursor` or follows a `cursor` link.
+    """
+
+    cursor_pagination_class = IdCursorPagination
+    mode_query_param = "pagination"
+
+    def __init__(self):
+        self.cursor_paginator = self.cursor_pagination_class()
+        self.use_cursor = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or self.cursor_paginator.cursor_query_param in request.query_params
+        )
+        if self.use_cursor:
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.use_cursor:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.use_cursor:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
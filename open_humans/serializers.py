@@ -1,14 +1,17 @@
 from collections import OrderedDict
 
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
 from django.urls import reverse
 
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 
-from common.utils import full_url
+from common.mixins import EagerLoadingSerializerMixin
+from common.utils import full_url, reverse_pk
 from data_import.models import DataFile
+from data_import.serializers import DataFileListSerializer
 from private_sharing.models import (
     DataRequestProject,
     DataRequestProjectMember,
@@ -22,6 +25,19 @@ from .models import Member
 User = get_user_model()
 
 
+def public_membership_visible(data_file):
+    """
+    Return whether the membership behind a public data file is visible.
+
+    Reads the copy on the file's PublicDataFileIndex row, which is select_related
+    by the public data file serializers.
+    """
+    try:
+        return data_file.public_index.membership_visible
+    except (AttributeError, ObjectDoesNotExist):
+        return project_membership_visible(data_file.user.member, data_file.source)
+
+
 class PublicProjectSerializer(ProjectDataSerializer):
     """
     Serialize publicly available project information.
@@ -30,11 +46,13 @@ class PublicProjectSerializer(ProjectDataSerializer):
     pass
 
 
-class PublicMemberSerializer(serializers.ModelSerializer):
+class PublicMemberSerializer(EagerLoadingSerializerMixin, serializers.ModelSerializer):
     """
     Serialize a member profile.
     """
 
+    select_related_fields = ("user",)
+
     profile_url = serializers.SerializerMethodField()
     username = serializers.CharField(source="user.username")
 
@@ -47,13 +65,19 @@ class PublicMemberSerializer(serializers.ModelSerializer):
         return full_url(reverse("member-detail", kwargs={"slug": obj.user.username}))
 
 
-class PublicDataFileSerializer(serializers.ModelSerializer):
+class PublicDataFileSerializer(
+    EagerLoadingSerializerMixin, serializers.ModelSerializer
+):
     """
     Serialize a public data file.
     """
 
+    select_related_fields = ("user__member", "public_index")
+    prefetch_related_fields = ("datatypes",)
+
     class Meta:  # noqa: D101
         model = DataFile
+        list_serializer_class = DataFileListSerializer
         fields = (
             "id",
             "basename",
@@ -74,14 +98,11 @@ class PublicDataFileSerializer(serializers.ModelSerializer):
         Get links to DataType API endpoints for file DataTypes
         """
         return [
-            full_url(reverse("api:datatype", kwargs={"pk": dt.id}))
-            for dt in obj.datatypes.all()
+            reverse_pk("api:datatype", dt.id, full=True) for dt in obj.datatypes.all()
         ]
 
     def get_source_project(self, obj):
-        return full_url(
-            reverse("api:project", kwargs={"pk": obj.direct_sharing_project.id})
-        )
+        return reverse_pk("api:project", obj.direct_sharing_project_id, full=True)
 
     def to_representation(self, data):
         """
@@ -89,7 +110,7 @@ class PublicDataFileSerializer(serializers.ModelSerializer):
         """
         rep = super().to_representation(data)
 
-        membership_visible = project_membership_visible(data.user.member, data.source)
+        membership_visible = public_membership_visible(data)
 
         # If shared with membership hidden, don't leak info via username filter!
         usernames = self.context["request"].query_params.get("username", [])
@@ -106,7 +127,8 @@ class PublicDataFileSerializer(serializers.ModelSerializer):
             }
 
         # This is actually a method; we need to use it to get the link.
-        rep["download_url"] = data.download_url(self.context["request"])
+        key = self.context.get("datafile_keys", {}).get(data.id, None)
+        rep["download_url"] = data.download_url(self.context["request"], key=key)
 
         return rep
 
@@ -18,7 +18,6 @@ import dj_database_url
 import django_heroku
 
 from env_tools import apply_env
-import re
 
 def to_bool(env, default="false"):
     """
@@ -69,6 +68,19 @@ ALLOW_TOKEN_REFRESH = to_bool("ALLOW_TOKEN_REFRESH")
 # if the uploader hasn't hit the completion endpoint
 INCOMPLETE_FILE_EXPIRATION_HOURS = 6
 
+# Issue stateless, HMAC-signed download keys instead of storing DataFileKeys;
+# legacy keys are still accepted
+SIGNED_DATAFILE_KEYS = to_bool("SIGNED_DATAFILE_KEYS")
+
+# Datafile access logs are buffered in memory and written in batches
+ACCESS_LOG_BATCH_SIZE = int(os.getenv("ACCESS_LOG_BATCH_SIZE", "100"))
+ACCESS_LOG_BUFFER_SIZE = int(os.getenv("ACCESS_LOG_BUFFER_SIZE", "5000"))
+ACCESS_LOG_FLUSH_SECONDS = int(os.getenv("ACCESS_LOG_FLUSH_SECONDS", "5"))
+
+if TESTING:
+    # Write each log as it's added so tests don't depend on the flusher thread
+    ACCESS_LOG_BUFFER_SIZE = 1
+
 if os.getenv("CI_NAME") == "codeship":
     DISABLE_CACHING = True
 
@@ -146,6 +158,16 @@ ALLOWED_HOSTS = ["*"]
 
 CELERY_BROKER_URL = os.getenv("REDIS_URL")
 CELERY_TASK_SERIALIZER = "json"
+CELERY_BEAT_SCHEDULE = {
+    "refresh-blog-posts": {
+        "task": "common.tasks.refresh_blog_posts",
+        "schedule": 60 * 10,
+    },
+    "refresh-project-notebooks": {
+        "task": "common.tasks.refresh_project_notebooks",
+        "schedule": 60 * 30,
+    },
+}
 
 MANAGERS = ()
 ADMINS = ()
@@ -193,6 +215,7 @@ INSTALLED_APPS = (
 MIDDLEWARE = (
     # 'debug_toolbar.middleware.DebugToolbarMiddleware',
     "django.middleware.security.SecurityMiddleware",
+    "open_humans.middleware.BlockedUserAgentMiddleware",
     "open_humans.middleware.RedirectStealthToProductionMiddleware",
     "open_humans.middleware.RedirectStagingToProductionMiddleware",
     "django.middleware.cache.UpdateCacheMiddleware",
@@ -437,6 +460,8 @@ THUMBNAIL_PRESERVE_FORMAT = True
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 AWS_STORAGE_BUCKET_NAME = os.getenv("AWS_S3_STORAGE_BUCKET_NAME")
+# The bucket's region; the SigV4 signatures of pre-signed uploads depend on it
+AWS_S3_REGION_NAME = os.getenv("AWS_S3_REGION_NAME")
 AWS_DEFAULT_ACL = None  # This will become default in django-storages 2.0
 LOG_BUCKET = os.getenv("LOG_BUCKET")
 
@@ -523,27 +548,27 @@ try:
 except ImportError:
     pass
 
-DISALLOWED_USER_AGENTS = [
-    re.compile(r'.*DotBot.*'),
-    re.compile(r'.*AhrefsBot.*'),
-    re.compile(r'.*SemrushBot.*'),
-    re.compile(r'.*Barkrowler.*'),
-    re.compile(r'.*meta-external.*'),
-    re.compile(r'.*facebook-external.*'),
-    re.compile(r'.*facebookexternalhit.*'),
-    re.compile(r'.*GPTBot.*'),
-    re.compile(r'.*AmazonBot.*'),
-    re.compile(r'.*GoogleBot.*'),
-    re.compile(r'.*AmazonBot.*'),
-    re.compile(r'.*bingbot.*'),
-    re.compile(r'.*PetalBot.*'),
-    re.compile(r'.*MJ12bot.*'),
-    re.compile(r'.*YandexBot.*'),
-    re.compile(r'.*AwarioSmartBot.*'),
-    re.compile(r'.*DataForSeoBot.*'),
-    re.compile(r'.*Bytespider.*'),
-    re.compile(r'.*Turnitin.*'),
-    re.compile(r'.*Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36.*')
+# Requests whose User-Agent contains any of these strings are refused with a
+# 403 by open_humans.middleware.BlockedUserAgentMiddleware.
+BLOCKED_USER_AGENTS = [
+    "DotBot",
+    "AhrefsBot",
+    "SemrushBot",
+    "Barkrowler",
+    "meta-external",
+    "facebook-external",
+    "facebookexternalhit",
+    "GPTBot",
+    "AmazonBot",
+    "GoogleBot",
+    "bingbot",
+    "PetalBot",
+    "MJ12bot",
+    "YandexBot",
+    "AwarioSmartBot",
+    "DataForSeoBot",
+    "Bytespider",
+    "Turnitin",
 ]
 
 if ON_HEROKU:
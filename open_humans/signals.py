@@ -7,7 +7,7 @@ from allauth.account.signals import email_confirmed
 
 from django.conf import settings
 from django.core.mail import send_mail
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.template.loader import render_to_string
 from django.urls import reverse
@@ -15,10 +15,22 @@ from django.urls import reverse
 from oauth2_provider.models import AccessToken
 
 from common.utils import full_url, get_source_labels_and_configs
-from private_sharing.models import ActivityFeed
-from private_sharing.utilities import source_to_url_slug
+from private_sharing.models import (
+    MEMBER_COUNT_FIELDS,
+    ActivityFeed,
+    DataRequestProject,
+    DataRequestProjectMember,
+    FeaturedProject,
+    OAuth2DataRequestProject,
+    OnSiteDataRequestProject,
+)
+from private_sharing.utilities import forget_token_credentials, source_to_url_slug
+from public_data.models import Participant
 
-from .models import Member
+from .badges import forget_member_badges
+from .middleware import WaffleFlag, forget_testing_flags
+from .models import BlogPost, Member, User
+from .views import forget_home_page_cache
 
 logger = logging.getLogger(__name__)
 
@@ -151,3 +163,118 @@ def email_confirmed_cb(email_address, **kwargs):
     Send a user a welcome email once they've confirmed their email address.
     """
     send_welcome_email(email_address)
+
+
+@receiver(post_save, sender=WaffleFlag)
+@receiver(post_delete, sender=WaffleFlag)
+def waffle_flag_cb(sender, instance, **kwargs):
+    """
+    Make CustomWaffleMiddleware reload the testing flags.
+    """
+    forget_testing_flags()
+
+
+@receiver(post_save, sender=ActivityFeed)
+@receiver(post_delete, sender=ActivityFeed)
+@receiver(post_save, sender=BlogPost)
+@receiver(post_delete, sender=BlogPost)
+@receiver(post_save, sender=DataRequestProject)
+@receiver(post_save, sender=OAuth2DataRequestProject)
+@receiver(post_save, sender=OnSiteDataRequestProject)
+@receiver(post_save, sender=DataRequestProjectMember)
+@receiver(post_delete, sender=DataRequestProjectMember)
+@receiver(post_save, sender=FeaturedProject)
+@receiver(post_delete, sender=FeaturedProject)
+def home_page_cache_cb(sender, instance, **kwargs):
+    """
+    Clear the cached parts of the home page when something they show changes,
+    e.g. new activity, a featured project or a member's project visibility.
+    """
+    forget_home_page_cache()
+
+
+@receiver(post_delete, sender=AccessToken)
+def access_token_credentials_cb(sender, instance, **kwargs):
+    """
+    Forget the cached credentials of an OAuth2 access token when it's revoked,
+    rotated or otherwise deleted.
+    """
+    forget_token_credentials("oauth2", [instance.token])
+
+
+@receiver(post_save, sender=DataRequestProjectMember)
+@receiver(post_delete, sender=DataRequestProjectMember)
+def project_member_counts_cb(sender, instance, **kwargs):
+    """
+    Recount a project's members when someone joins, authorizes or leaves it.
+    """
+    if kwargs.get("raw"):
+        return
+
+    DataRequestProject.update_member_counts([instance.project_id])
+
+
+@receiver(post_save, sender=DataRequestProject)
+@receiver(post_save, sender=OAuth2DataRequestProject)
+@receiver(post_save, sender=OnSiteDataRequestProject)
+def project_counts_cb(sender, instance, created, raw, update_fields, **kwargs):
+    """
+    Recount a project's members after a save that wrote the counters, in case
+    the instance held values that were out of date.
+    """
+    if raw or created:
+        return
+
+    if update_fields is not None and not set(update_fields) & set(MEMBER_COUNT_FIELDS):
+        return
+
+    DataRequestProject.update_member_counts([instance.id])
+
+
+@receiver(post_save, sender=User)
+def user_member_counts_cb(sender, instance, created, raw, **kwargs):
+    """
+    Recount the members of a user's projects when they're suspended or
+    reactivated.
+    """
+    if raw or created or instance.old_is_active == instance.is_active:
+        return
+
+    instance.old_is_active = instance.is_active
+
+    DataRequestProject.update_member_counts(
+        DataRequestProjectMember.objects.filter(member__user=instance).values_list(
+            "project_id", flat=True
+        )
+    )
+
+
+@receiver(post_save, sender=DataRequestProjectMember)
+@receiver(post_delete, sender=DataRequestProjectMember)
+@receiver(post_save, sender=Participant)
+def member_badges_cb(sender, instance, **kwargs):
+    """
+    Clear a member's cached badges when they join, leave or hide a project or
+    change their public data sharing.
+    """
+    forget_member_badges([instance.member_id])
+
+
+@receiver(post_save, sender=DataRequestProject)
+@receiver(post_save, sender=OAuth2DataRequestProject)
+@receiver(post_save, sender=OnSiteDataRequestProject)
+def project_badges_cb(sender, instance, created, raw, **kwargs):
+    """
+    Clear the cached badges of a project's members when its approval, name or
+    badge image changes.
+    """
+    if raw or created or instance.old_badge_fields == instance.badge_fields:
+        return
+
+    instance.old_badge_fields = instance.badge_fields
+
+    forget_member_badges(
+        DataRequestProjectMember.objects.filter(project_id=instance.id).values_list(
+            "member_id", flat=True
+        )
+    )
@@ -1,7 +1,101 @@
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+from django.conf import settings
 from storages.backends.s3boto3 import S3Boto3Storage
 
 TEN_MINUTES = 60 * 10
 
+# How many S3 HEAD requests get_object_sizes() makes at once
+OBJECT_SIZE_WORKERS = 16
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def get_s3_client():
+    """
+    Return a process-wide S3 client with PrivateStorage's credentials and
+    configuration. Unlike boto3 resources, clients are thread-safe, so one can
+    be shared by every request.
+
+    The client signs with SigV4, which pre-signed uploads need. PrivateStorage's
+    own download URLs keep their existing signing.
+    """
+    global _s3_client
+
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                storage = PrivateStorage(signature_version="s3v4")
+                _s3_client = storage.connection.meta.client
+
+    return _s3_client
+
+
+def get_object_size(key):
+    """
+    Return the size of an object in the storage bucket, or None if it's not
+    there.
+    """
+    try:
+        response = get_s3_client().head_object(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key
+        )
+    except ClientError:
+        return None
+
+    return response["ContentLength"]
+
+
+def get_object_sizes(keys):
+    """
+    Return a dict of key to the size of each object in the storage bucket, or
+    None for objects that aren't there, with a bounded number of concurrent
+    HEAD requests.
+    """
+    keys = list(keys)
+
+    if not keys:
+        return {}
+
+    with ThreadPoolExecutor(
+        max_workers=min(OBJECT_SIZE_WORKERS, len(keys))
+    ) as executor:
+        return dict(zip(keys, executor.map(get_object_size, keys)))
+
+
+def abort_multipart_uploads(keys):
+    """
+    Abort the unfinished multipart uploads to the given keys in the storage
+    bucket, so S3 stops storing their parts. Returns how many were aborted.
+    """
+    keys = set(keys)
+
+    if not keys:
+        return 0
+
+    client = get_s3_client()
+    aborted = 0
+
+    for page in client.get_paginator("list_multipart_uploads").paginate(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME
+    ):
+        for upload in page.get("Uploads", []):
+            if upload["Key"] not in keys:
+                continue
+
+            client.abort_multipart_upload(
+                Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+                Key=upload["Key"],
+                UploadId=upload["UploadId"],
+            )
+            aborted += 1
+
+    return aborted
+
 
 # pylint: disable=abstract-method
 class PrivateStorage(S3Boto3Storage):
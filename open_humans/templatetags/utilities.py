@@ -7,20 +7,18 @@ import markdown as markdown_library
 
 from django import template
 from django.conf import settings
-from django.templatetags.static import static
 from django.urls import reverse, NoReverseMatch
 from django.template.defaultfilters import stringfilter
 from django.template.loader_tags import do_include
 from django.utils.safestring import mark_safe
 
 from common.utils import full_url as full_url_method
+from open_humans.badges import get_member_badges, project_badge, public_data_badge
 from private_sharing.models import (
-    DataRequestProjectMember,
     app_label_to_verbose_name_including_dynamic,
     project_membership_visible,
 )
 from private_sharing.utilities import source_to_url_slug as source_to_url_slug_method
-from public_data.models import Participant
 
 logger = logging.getLogger(__name__)
 
@@ -291,30 +289,35 @@ class VisibleNode(template.Node):
             return ""
 
 
-@register.simple_tag()
-def render_user_badges(member, badge_class="mini-badge"):
+def badge_html(badge_data, badge_class):
+    """
+    Return HTML for a badge from its name, image URL and link.
+    """
+    return """<a href="{href}" class="{badge_class}">
+            <img class="{badge_class}"
+              src="{static_url}" alt="{name}" title="{name}">
+           </a>""".format(badge_class=badge_class, **badge_data)
+
+
+@register.simple_tag(takes_context=True)
+def render_user_badges(context, member, badge_class="mini-badge"):
     """
     Returns the html to render all of a member's badges.
+
+    List views can batch the lookup by providing "member_badges", a dict of member
+    ID to badge data from get_member_badges.
     """
-    projects = DataRequestProjectMember.objects.select_related("project").filter(
-        visible=True,
-        project__approved=True,
-        member=member,
-        authorized=True,
-        revoked=False,
-    )
-    html = ""
-    for project in projects:
-        html += make_badge(project.project, badge_class=badge_class)
+    member_badges = context.get("member_badges") or {}
 
-    try:
-        participant = Participant.objects.get(member_id=member.id)
-        if participant.enrolled:
-            html += make_badge("public_data", badge_class=badge_class)
-    except Participant.DoesNotExist:
-        pass
+    if member.id not in member_badges:
+        member_badges = get_member_badges([member.id])
 
-    return mark_safe(html)
+    return mark_safe(
+        "".join(
+            badge_html(badge_data, badge_class)
+            for badge_data in member_badges.get(member.id, [])
+        )
+    )
 
 
 @register.simple_tag()
@@ -323,32 +326,11 @@ def make_badge(project, badge_class="oh-badge"):
     Return HTML for a badge.
     """
     if project == "public_data":
-        badge_data = {
-            "name": "Public Data Sharing",
-            "static_url": static("images/public-data-sharing-badge.png"),
-            "badge_class": badge_class,
-            "href": reverse("public-data:home"),
-        }
+        badge_data = public_data_badge()
     else:
-        try:
-            badge_url = project.badge_image.url
-        except ValueError:
-            badge_url = static("images/default-badge.png")
-        badge_data = {
-            "name": project.name,
-            "badge_class": badge_class,
-            "static_url": badge_url,
-            "href": reverse("activity", kwargs={"slug": project.slug}),
-        }
+        badge_data = project_badge(project)
 
-    return mark_safe(
-        """<a href="{href}" class="{badge_class}">
-            <img class="{badge_class}"
-              src="{static_url}" alt="{name}" title="{name}">
-           </a>""".format(
-            **badge_data
-        )
-    )
+    return mark_safe(badge_html(badge_data, badge_class))
 
 
 @register.simple_tag()
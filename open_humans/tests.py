@@ -1,4 +1,9 @@
+from datetime import timedelta
 from io import StringIO
+import json
+import tempfile
+import time
+from types import SimpleNamespace
 import unittest
 
 from allauth.account.models import EmailAddress, EmailConfirmation
@@ -6,20 +11,39 @@ from allauth.account.models import EmailAddress, EmailConfirmation
 from django.conf import settings
 from django.contrib import auth
 from django.core import mail, management
-from django.db import IntegrityError
+from django.core.cache import cache
+from django.db import IntegrityError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.test.utils import override_settings
 from django.urls import reverse
 from django.utils import timezone
 
 from rest_framework.test import APITestCase
 
-from mock import patch
+from mock import Mock, patch
+import requests
 
+from common.tasks import refresh_blog_posts
+from data_import.models import AWSDataFileAccessLog, AWSLogObjectCheckpoint, DataType
 from common.testing import BrowserTestCase, get_or_create_user, SmokeTestCase
-from private_sharing.models import DataRequestProject
-
-from .models import Member
+from private_sharing.models import (
+    DataRequestProject,
+    DataRequestProjectMember,
+    ProjectDataFile,
+)
+
+from .badges import get_member_badges
+from .management.commands.vacuum_log_bucket import parse_log_entry
+from .middleware import WaffleFlag, forget_testing_flags, get_testing_flag_names
+from .models import BlogPost, DailyStats, Member
+from .notebooks import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_OPEN_KEY,
+    get_notebooks,
+    refresh_notebooks,
+)
+from .templatetags.utilities import render_user_badges
 
 UserModel = auth.get_user_model()
 
@@ -229,6 +253,59 @@ class CommandTests(TestCase):
         management.call_command("stats", "--days=365", stdout=self.output)
 
 
+class StatsNewTests(TestCase):
+    """
+    Tests for the stats_new command.
+    """
+
+    fixtures = ["open_humans/fixtures/test-data.json"]
+
+    def test_incremental_stats(self):
+        today = timezone.now().date()
+        start = today - timedelta(days=3)
+
+        output = StringIO()
+        management.call_command(
+            "stats_new",
+            "--incremental",
+            "--start-date={}".format(start.isoformat()),
+            "--format=csv",
+            stdout=output,
+        )
+
+        rows = output.getvalue().splitlines()
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[-1].split(",")[:2], [today.isoformat(), "3"])
+        self.assertEqual(DailyStats.objects.count(), 4)
+
+        output = StringIO()
+        management.call_command("stats_new", "--incremental", stdout=output)
+
+        self.assertEqual(len(output.getvalue().splitlines()), 1)
+        self.assertEqual(DailyStats.objects.count(), 4)
+
+
+class UserConnectionsJsonTests(TestCase):
+    """
+    Tests for the user_connections_json command.
+    """
+
+    fixtures = ["open_humans/fixtures/test-data.json"]
+
+    def test_user_connections_json(self):
+        with tempfile.NamedTemporaryFile(mode="r", suffix=".json") as f:
+            management.call_command("user_connections_json", f.name)
+            data = json.load(f)
+
+        usernames = list(
+            Member.objects.exclude(user__username="api-administrator").values_list(
+                "user__username", flat=True
+            )
+        )
+        self.assertEqual(list(data), sorted(usernames))
+        self.assertTrue(data["bacon"]["public_data_participant"])
+
+
 class WsgiTests(TestCase):
     """
     Tests for our WSGI application.
@@ -365,3 +442,558 @@ class HidePublicMembershipTestCase(APITestCase):
             if item["source"] == "direct-sharing-1":
                 result = item
         assert result["usernames"] == ["bacon"]
+
+
+class MemberBadgeTests(TestCase):
+    """
+    Tests for the batched member badge loader.
+    """
+
+    fixtures = ["open_humans/fixtures/test-data.json"]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_get_member_badges(self):
+        member_ids = list(Member.objects.values_list("id", flat=True))
+
+        with self.assertNumQueries(2):
+            badges = get_member_badges(member_ids)
+
+        self.assertEqual(
+            [badge["name"] for badge in badges[1]],
+            ["Favorite Trance Tracks", "Public Data Sharing"],
+        )
+        self.assertEqual(badges[2], [])
+
+    def test_hidden_membership_has_no_badge(self):
+        project_member = DataRequestProjectMember.objects.get(member_id=1, project_id=2)
+        project_member.set_visibility(visible_status=False)
+
+        self.assertEqual(
+            [badge["name"] for badge in get_member_badges([1])[1]],
+            ["Public Data Sharing"],
+        )
+
+    def test_render_badges_of_member_missing_from_context(self):
+        member = Member.objects.get(id=1)
+        context = {"member_badges": get_member_badges([2])}
+
+        html = render_user_badges(context, member)
+
+        self.assertIn("Favorite Trance Tracks", html)
+        self.assertIn("Public Data Sharing", html)
+
+    def test_deferred_project_load(self):
+        get_member_badges([1])
+        project = DataRequestProject.objects.only("id").get(pk=2)
+
+        self.assertIsNone(project.old_badge_fields)
+
+        project.name = "Renamed"
+        project.save()
+
+        self.assertEqual(
+            [badge["name"] for badge in get_member_badges([1])[1]],
+            ["Renamed", "Public Data Sharing"],
+        )
+
+
+@override_settings(SSLIFY_DISABLE=True)
+class PublicApiQueryCountTests(APITestCase):
+    """
+    Make sure the public API list endpoints don't make a query per result.
+    """
+
+    fixtures = ["open_humans/fixtures/test-data.json"]
+
+    urls = [
+        "/api/public/datafiles/",
+        "/api/public/datafiles/?pagination=cursor",
+        "/api/public/datatype/1/datafiles/",
+        "/api/public/datatype/1/datafiles/?include_children=true",
+        "/api/public/datatypes/",
+        "/api/public/member/bacon/datafiles/",
+        "/api/public/members/",
+        "/api/public/project/2/datafiles/",
+        "/api/public-data/",
+    ]
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_results(self):
+        before = {url: self.count_queries(url) for url in self.urls}
+
+        user = UserModel.objects.get(username="bacon")
+
+        for i in range(5):
+            data_file = ProjectDataFile(
+                direct_sharing_project_id=2,
+                user=user,
+                completed=True,
+                file="member-files/query-count/{}.json".format(i),
+            )
+            data_file.save()
+            data_file.datatypes.add(1)
+
+            Member.objects.create(
+                user=get_or_create_user("query_count_{}".format(data_file.id))
+            )
+
+        for url in self.urls:
+            self.assertEqual(self.count_queries(url), before[url], url)
+
+
+@override_settings(SSLIFY_DISABLE=True)
+class PublicApiDataTypeFilesTests(APITestCase):
+    """
+    Tests for listing the public files of a DataType and its descendants.
+    """
+
+    fixtures = ["open_humans/fixtures/test-data.json"]
+
+    def setUp(self):
+        user = UserModel.objects.get(username="bacon")
+
+        child = DataType(name="Child", parent_id=1, description="Child")
+        child.editor = user.member
+        child.save()
+
+        self.both = ProjectDataFile.objects.create(
+            direct_sharing_project_id=2,
+            user=user,
+            completed=True,
+            file="member-files/datatypes/both.json",
+        )
+        self.both.datatypes.add(1, child)
+
+        self.child_only = ProjectDataFile.objects.create(
+            direct_sharing_project_id=2,
+            user=user,
+            completed=True,
+            file="member-files/datatypes/child.json",
+        )
+        self.child_only.datatypes.add(child)
+
+    def get_ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        return [row["id"] for row in response.data["results"]]
+
+    def test_file_with_several_datatypes_is_listed_once(self):
+        ids = self.get_ids("/api/public/datatype/1/datafiles/?include_children=true")
+
+        self.assertEqual(ids.count(self.both.id), 1)
+        self.assertIn(self.child_only.id, ids)
+
+    def test_children_are_excluded_by_default(self):
+        ids = self.get_ids("/api/public/datatype/1/datafiles/")
+
+        self.assertEqual(ids.count(self.both.id), 1)
+        self.assertNotIn(self.child_only.id, ids)
+
+
+@override_settings(SSLIFY_DISABLE=True)
+class PublicApiNDJSONTests(APITestCase):
+    """
+    Tests for streaming public API lists as newline-delimited JSON.
+    """
+
+    fixtures = ["open_humans/fixtures/test-data.json"]
+
+    def test_datafiles_ndjson(self):
+        response = self.client.get("/api/public/datafiles/?format=ndjson")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).decode().splitlines()
+        ]
+        paginated = self.client.get("/api/public/datafiles/").data
+
+        self.assertEqual(len(rows), paginated["count"])
+        self.assertEqual(
+            sorted(row["id"] for row in rows),
+            sorted(row["id"] for row in paginated["results"]),
+        )
+
+
+@override_settings(SSLIFY_DISABLE=True)
+class PublicApiCursorPaginationTests(APITestCase):
+    """
+    Tests for cursor pagination of the public API lists.
+    """
+
+    fixtures = ["open_humans/fixtures/test-data.json"]
+
+    def setUp(self):
+        user = UserModel.objects.get(username="bacon")
+
+        for i in range(3):
+            ProjectDataFile.objects.create(
+                direct_sharing_project_id=2,
+                user=user,
+                completed=True,
+                file="member-files/cursor/{}.json".format(i),
+            )
+
+        self.expected_ids = sorted(
+            row["id"]
+            for row in self.client.get("/api/public/datafiles/?limit=100").data[
+                "results"
+            ]
+        )
+
+    def test_cursor_pages_cover_every_file_in_id_order(self):
+        url = "/api/public/datafiles/?pagination=cursor&limit=2"
+        ids = []
+
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn("count", response.data)
+            self.assertLessEqual(len(response.data["results"]), 2)
+
+            ids.extend(row["id"] for row in response.data["results"])
+            url = response.data["next"]
+
+        self.assertGreater(len(self.expected_ids), 2)
+        self.assertEqual(ids, self.expected_ids)
+
+    def test_cursor_link_keeps_cursor_pagination(self):
+        next_url = self.client.get(
+            "/api/public/datafiles/?pagination=cursor&limit=1"
+        ).data["next"]
+        next_url = next_url.replace("pagination=cursor", "").replace("&&", "&")
+
+        response = self.client.get(next_url)
+
+        self.assertNotIn("count", response.data)
+        self.assertEqual(
+            [row["id"] for row in response.data["results"]], self.expected_ids[1:2]
+        )
+
+    def test_limit_offset_by_default(self):
+        response = self.client.get("/api/public/datafiles/?limit=1")
+
+        self.assertEqual(response.data["count"], len(self.expected_ids))
+        self.assertIn("offset=1", response.data["next"])
+
+
+class BlockedUserAgentTests(TestCase):
+    """
+    Tests for BlockedUserAgentMiddleware.
+    """
+
+    def test_blocked_user_agent(self):
+        response = self.client.get(
+            "/", HTTP_USER_AGENT="Mozilla/5.0 (compatible; GPTBot/1.1)"
+        )
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_allowed_user_agent(self):
+        response = self.client.get(
+            "/", HTTP_USER_AGENT="Mozilla/5.0 (X11; Linux x86_64) Firefox/120.0"
+        )
+
+        self.assertNotEqual(response.status_code, 403)
+
+    def test_browser_user_agent(self):
+        response = self.client.get(
+            "/",
+            HTTP_USER_AGENT=(
+                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                "(KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36"
+            ),
+        )
+
+        self.assertNotEqual(response.status_code, 403)
+
+
+class TestingFlagCacheTests(TestCase):
+    """
+    Tests for caching the names of waffle flags in testing mode.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+    def test_names_are_cached(self):
+        WaffleFlag.objects.create(name="beta", testing=True)
+        WaffleFlag.objects.create(name="live", testing=False)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_testing_flag_names(), ("beta",))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_testing_flag_names(), ("beta",))
+
+    def test_saving_a_flag_reloads_names(self):
+        flag = WaffleFlag.objects.create(name="beta", testing=True)
+        self.assertEqual(get_testing_flag_names(), ("beta",))
+
+        flag.testing = False
+        flag.save()
+        self.assertEqual(get_testing_flag_names(), ())
+
+        WaffleFlag.objects.create(name="gamma", testing=True)
+        self.assertEqual(get_testing_flag_names(), ("gamma",))
+
+    def test_deleting_a_flag_reloads_names(self):
+        flag = WaffleFlag.objects.create(name="beta", testing=True)
+        self.assertEqual(get_testing_flag_names(), ("beta",))
+
+        flag.delete()
+        self.assertEqual(get_testing_flag_names(), ())
+
+    def test_forget_reloads_names(self):
+        WaffleFlag.objects.create(name="beta", testing=True)
+        get_testing_flag_names()
+
+        # A change made by another process that skipped the signals
+        WaffleFlag.objects.filter(name="beta").update(testing=False)
+        self.assertEqual(get_testing_flag_names(), ("beta",))
+
+        forget_testing_flags()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(get_testing_flag_names(), ())
+
+
+class RefreshBlogPostsTests(TestCase):
+    """
+    Tests for refreshing the home page blog posts in the background.
+    """
+
+    feed = """<?xml version="1.0"?>
+        <rss version="2.0"><channel><title>Open Humans</title>
+        <item><guid>https://blog.openhumans.org/post/</guid>
+        <title>Post</title><description>A long summary</description></item>
+        </channel></rss>"""
+
+    page = """<html><head>
+        <meta property="og:title" content="A post" />
+        <meta property="og:description" content="A short summary" />
+        <meta property="og:image" content="https://example.com/post.png" />
+        <meta property="article:published_time" content="2020-01-02T03:04:05Z" />
+        </head></html>"""
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url, **kwargs):
+        if url == BlogPost.FEED_URL:
+            return Mock(content=self.feed.encode())
+
+        return Mock(text=self.page)
+
+    def test_refresh_stores_and_caches_posts(self):
+        cache.set(BlogPost.REFRESH_QUEUED_KEY, True)
+
+        with patch("open_humans.models.requests.get", side_effect=self.get):
+            refresh_blog_posts()
+
+        post = BlogPost.objects.get()
+        self.assertEqual(post.rss_id, "https://blog.openhumans.org/post/")
+        self.assertEqual(post.title, "A post")
+        self.assertEqual(post.summary_long, "A long summary")
+
+        with self.assertNumQueries(0):
+            posts, stale = BlogPost.get_recent()
+
+        self.assertEqual(posts, [post])
+        self.assertFalse(stale)
+        self.assertIsNone(cache.get(BlogPost.REFRESH_QUEUED_KEY))
+
+    def test_refresh_failure_keeps_stored_posts(self):
+        cache.set(BlogPost.REFRESH_QUEUED_KEY, True)
+
+        with patch(
+            "open_humans.models.requests.get",
+            side_effect=requests.ConnectionError("unreachable"),
+        ):
+            refresh_blog_posts()
+
+        posts, stale = BlogPost.get_recent()
+
+        self.assertEqual(posts, [])
+        self.assertTrue(stale)
+        self.assertIsNone(cache.get(BlogPost.REFRESH_QUEUED_KEY))
+
+
+class NotebookRefreshTests(TestCase):
+    """
+    Tests for refreshing notebook listings and the circuit breaker around them.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+        self.projects = [
+            SimpleNamespace(id=i, name="Project {}".format(i)) for i in range(6)
+        ]
+
+    @staticmethod
+    def listing():
+        return Mock(json=Mock(return_value={"notebooks": [{"name": "a.ipynb"}]}))
+
+    def refresh(self, side_effect):
+        with patch(
+            "open_humans.notebooks.requests.get", side_effect=side_effect
+        ) as get:
+            refreshed = refresh_notebooks(self.projects)
+
+        return refreshed, get.call_count
+
+    def test_refresh_caches_listings(self):
+        refreshed, calls = self.refresh(lambda *args, **kwargs: self.listing())
+
+        self.assertEqual(refreshed, len(self.projects))
+        self.assertEqual(get_notebooks(self.projects[0]), [{"name": "a"}])
+
+    def test_failures_in_a_row_open_the_circuit(self):
+        failure = requests.ConnectionError("unreachable")
+
+        refreshed, calls = self.refresh(failure)
+
+        self.assertEqual(refreshed, 0)
+        self.assertEqual(calls, CIRCUIT_FAILURE_THRESHOLD)
+        self.assertGreater(cache.get(CIRCUIT_OPEN_KEY), time.time())
+
+        # While the circuit is open, refreshes don't contact Exploratory
+        refreshed, calls = self.refresh(failure)
+
+        self.assertEqual((refreshed, calls), (0, 0))
+
+    def test_success_resets_the_failure_count(self):
+        failure = requests.ConnectionError("unreachable")
+
+        refreshed, calls = self.refresh(
+            [failure, failure, self.listing(), failure, failure, self.listing()]
+        )
+
+        self.assertEqual((refreshed, calls), (2, 6))
+        self.assertIsNone(cache.get(CIRCUIT_OPEN_KEY))
+        self.assertIsNone(get_notebooks(self.projects[0]))
+        self.assertEqual(get_notebooks(self.projects[2]), [{"name": "a"}])
+
+    def test_circuit_closes_after_a_while(self):
+        cache.set(CIRCUIT_OPEN_KEY, time.time() - 1)
+
+        refreshed, calls = self.refresh(lambda *args, **kwargs: self.listing())
+
+        self.assertEqual(refreshed, len(self.projects))
+
+
+@override_settings(LOG_BUCKET="test-logs")
+class VacuumLogBucketTests(TestCase):
+    """
+    Tests for parsing and saving S3 server access logs.
+    """
+
+    host_id = "s9lzHYrFp76ZVxRcpX9+5cjAnEH2ROuNkd2BHfIa6UkFVdtjf5mKR3/eTPFvsiP="
+
+    log_entry = (
+        "79a59df900b949e5 oh-data [06/Feb/2019:00:00:38 +0000] 192.0.2.3 "
+        "79a59df900b949e5 3E57427F3EXAMPLE REST.GET.OBJECT member-files/a.json "
+        '"GET /member-files/a.json?x-oh-key=abc HTTP/1.1" 200 - 113 2048 7 - '
+        '"-" "curl/7.64.1" - {0} SigV4 ECDHE-RSA-AES128-GCM-SHA256 '
+        "QueryString oh-data.s3.amazonaws.com TLSv1.2"
+    )
+
+    def setUp(self):
+        WaffleFlag.objects.create(name="datafile-access-logging", everyone=True)
+
+    def test_parse_log_entry(self):
+        entry = parse_log_entry(self.log_entry.format(self.host_id))
+
+        self.assertEqual(entry.bucket, "oh-data")
+        self.assertEqual(entry.time.isoformat(), "2019-02-06T00:00:38+00:00")
+        self.assertEqual(entry.remote_ip, "192.0.2.3")
+        self.assertEqual(entry.operation, "REST.GET.OBJECT")
+        self.assertEqual(entry.bucket_key, "member-files/a.json")
+        self.assertEqual(
+            entry.request_uri, '"GET /member-files/a.json?x-oh-key=abc HTTP/1.1"'
+        )
+        self.assertEqual(entry.status, 200)
+        self.assertEqual(entry.error_code, "-")
+        self.assertEqual(entry.bytes_sent, 113)
+        self.assertEqual(entry.object_size, 2048)
+        self.assertEqual(entry.turn_around_time, 0)
+        self.assertEqual(entry.user_agent, '"curl/7.64.1"')
+        self.assertEqual(entry.host_id, self.host_id)
+        self.assertEqual(entry.host_header, "oh-data.s3.amazonaws.com")
+
+    def test_parse_stray_dash(self):
+        entry = parse_log_entry(self.log_entry.format("- " + self.host_id))
+
+        self.assertEqual(entry.version_id, "-")
+        self.assertEqual(entry.host_id, self.host_id)
+        self.assertEqual(entry.host_header, "oh-data.s3.amazonaws.com")
+
+    def test_parse_internal_operation(self):
+        log_entry = self.log_entry.format(self.host_id).split(" ")
+        log_entry[5] = "AmazonS3"
+
+        self.assertIsNone(parse_log_entry(" ".join(log_entry)))
+
+    def get_client(self, keys):
+        client = Mock()
+        client.get_paginator.return_value.paginate.return_value = [
+            {"Contents": [{"Key": key} for key in keys]}
+        ]
+        client.get_object.return_value = {
+            "Body": Mock(
+                read=Mock(return_value=self.log_entry.format(self.host_id).encode())
+            )
+        }
+
+        return client
+
+    def vacuum(self, client):
+        with patch(
+            "open_humans.management.commands.vacuum_log_bucket.boto3.client",
+            return_value=client,
+        ):
+            management.call_command("vacuum_log_bucket", stdout=StringIO())
+
+    def test_vacuum_saves_and_deletes_log_objects(self):
+        client = self.get_client(["logs/1", "logs/2"])
+
+        self.vacuum(client)
+
+        self.assertEqual(AWSDataFileAccessLog.objects.count(), 2)
+        self.assertEqual(
+            [call[1]["Key"] for call in client.delete_object.call_args_list],
+            ["logs/1", "logs/2"],
+        )
+        self.assertFalse(AWSLogObjectCheckpoint.objects.exists())
+
+    def test_vacuum_skips_saved_log_objects(self):
+        client = self.get_client(["logs/1"])
+        client.delete_object.side_effect = RuntimeError("unavailable")
+
+        with self.assertRaises(RuntimeError):
+            self.vacuum(client)
+
+        self.assertEqual(AWSDataFileAccessLog.objects.count(), 1)
+        self.assertTrue(AWSLogObjectCheckpoint.objects.filter(key="logs/1").exists())
+
+        client = self.get_client(["logs/1"])
+
+        self.vacuum(client)
+
+        client.get_object.assert_not_called()
+        client.delete_object.assert_called_once_with(Bucket="test-logs", Key="logs/1")
+        self.assertEqual(AWSDataFileAccessLog.objects.count(), 1)
+        self.assertFalse(AWSLogObjectCheckpoint.objects.exists())
@@ -1,10 +1,13 @@
+import logging
+
 from distutils.util import strtobool
 
 from django.conf import settings
 from django.contrib import messages as django_messages
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.db.models import Count, F, Q
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import Count, F
 from django.db.models.expressions import RawSQL
 from django.http import Http404, HttpResponseRedirect
 from django.shortcuts import redirect, render
@@ -13,9 +16,9 @@ from django.views.generic.base import TemplateView, View
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import DeleteView, FormView
 
-import feedparser
-import requests
+from kombu.exceptions import KombuError
 
+from common import tasks
 from common.activities import activity_from_data_request_project
 from common.mixins import LargePanelMixin, NeverCacheMixin, PrivateMixin
 from public_data.models import PublicDataAccess, is_public, public_count
@@ -31,27 +34,35 @@ from private_sharing.utilities import source_to_url_slug
 from .forms import ActivityMessageForm
 from .mixins import SourcesContextMixin
 from .models import BlogPost, Member, GrantProject
+from .notebooks import get_notebooks
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
 TEN_MINUTES = 60 * 10
 
+HOME_FEATURED_PROJECTS_CACHE_KEY = "home-featured-projects"
+
+# The {% cache %} fragments in pages/home.html; they're the same for everyone.
+HOME_CACHE_FRAGMENTS = ("home-activity-feed", "home-recent-blogposts")
+
+
+def forget_home_page_cache():
+    """
+    Clear the cached parts of the home page.
+    """
+    cache.delete_many(
+        [HOME_FEATURED_PROJECTS_CACHE_KEY]
+        + [make_template_fragment_key(fragment) for fragment in HOME_CACHE_FRAGMENTS]
+    )
+
 
 def sort_projects_by_membership(projects):
     """
     Takes a queryset of projects and returns a queryset sorted by the number of
     members in a project.
     """
-    projects = projects.annotate(
-        num_members=Count(
-            "project_members",
-            filter=(
-                Q(project_members__joined=True)
-                & Q(project_members__member__user__is_active=True)
-            ),
-        )
-    )
-    projects = projects.order_by("-num_members")
-    return projects
+    return projects.order_by("-joined_member_count")
 
 
 class SourceDataFilesDeleteView(PrivateMixin, DeleteView):
@@ -128,20 +139,23 @@ class HomeView(NeverCacheMixin, SourcesContextMixin, TemplateView):
 
     @staticmethod
     def get_recent_blogposts():
-        blogposts_cachetag = "recent-blogposts"
-        blogposts = cache.get(blogposts_cachetag)
-        if blogposts:
-            return blogposts
-
-        blogfeed = feedparser.parse("https://blog.openhumans.org/feed/")
-        posts = []
-        for item in blogfeed["entries"][0:3]:
+        """
+        Return the cached blog posts, asking for a background refresh if
+        they're stale; the blog's feed is never read during a request.
+        """
+        posts, stale = BlogPost.get_recent()
+
+        # Only one request per minute queues a refresh
+        if (
+            stale
+            and settings.CELERY_BROKER_URL
+            and cache.add(BlogPost.REFRESH_QUEUED_KEY, True, timeout=60)
+        ):
             try:
-                post = BlogPost.objects.get(rss_id=item["id"])
-            except BlogPost.DoesNotExist:
-                post = BlogPost.create(rss_feed_entry=item)
-            posts.append(post)
-        cache.set(blogposts_cachetag, posts, timeout=TEN_MINUTES)
+                tasks.refresh_blog_posts.delay()
+            except KombuError:
+                logger.warning("Unable to queue a blog post refresh")
+
         return posts
 
     @staticmethod
@@ -166,19 +180,27 @@ class HomeView(NeverCacheMixin, SourcesContextMixin, TemplateView):
             member__user__is_active=True
         )
         recent_qs = non_project_qs | project_qs
-        recent = recent_qs.order_by("-timestamp")[0:12]
+        recent = recent_qs.select_related("member__user", "project").order_by(
+            "-timestamp"
+        )[0:12]
         recent_1 = recent[:6]
         recent_2 = recent[6:]
         return (recent_1, recent_2)
 
-    def get_featured_projects(self):
+    @staticmethod
+    def get_cached_featured_projects():
         """
         Get FeaturedProjects in 'activity' data format
 
-        Override description if one is provided.
+        Override description if one is provided. The result is the same for
+        everyone, so it's cached until a featured project changes.
         """
+        highlighted = cache.get(HOME_FEATURED_PROJECTS_CACHE_KEY)
+        if highlighted is not None:
+            return highlighted
+
         featured_qs = FeaturedProject.objects.order_by("id")[0:3]
-        featured_projs = featured_qs.prefetch_related("project")
+        featured_projs = featured_qs.select_related("project")
         highlighted = []
         try:
             for featured in featured_projs:
@@ -187,18 +209,33 @@ class HomeView(NeverCacheMixin, SourcesContextMixin, TemplateView):
                     activity.commentary = featured.description
                 else:
                     activity.commentary = featured.project.description
-                if not self.request.user.is_anonymous:
-                    activity.has_files = (
-                        activity.projectdatafile_set.filter(
-                            user__pk=self.request.user.pk
-                        ).count()
-                        > 0
-                    )
                 highlighted.append(activity)
-            return highlighted
         except (ValueError, TypeError):
             return []
 
+        cache.set(HOME_FEATURED_PROJECTS_CACHE_KEY, highlighted, timeout=TEN_MINUTES)
+        return highlighted
+
+    def get_featured_projects(self):
+        """
+        Get the featured projects, marking those the user has files in.
+        """
+        highlighted = self.get_cached_featured_projects()
+
+        if highlighted and not self.request.user.is_anonymous:
+            with_files = set(
+                ProjectDataFile.objects.filter(
+                    user__pk=self.request.user.pk,
+                    direct_sharing_project__in=[
+                        activity.id for activity in highlighted
+                    ],
+                ).values_list("direct_sharing_project_id", flat=True)
+            )
+            for activity in highlighted:
+                activity.has_files = activity.id in with_files
+
+        return highlighted
+
     def get_context_data(self, *args, **kwargs):
         context = super().get_context_data(*args, **kwargs)
         recent_activity_1, recent_activity_2 = self.get_recent_activity()
@@ -207,7 +244,8 @@ class HomeView(NeverCacheMixin, SourcesContextMixin, TemplateView):
             {
                 "recent_activityfeed_1": recent_activity_1,
                 "recent_activityfeed_2": recent_activity_2,
-                "recent_blogposts": self.get_recent_blogposts(),
+                # Called by the template, only when its fragment isn't cached
+                "recent_blogposts": self.get_recent_blogposts,
                 "featured_projects": self.get_featured_projects(),
                 "no_description": True,
             }
@@ -328,27 +366,21 @@ class ActivityView(NeverCacheMixin, DetailView):
     def get_notebooks(self):
         """
         Get information about notebooks using this project as a source.
-        """
-        resp = requests.get(
-            "https://exploratory.openhumans.org/notebook_by_source/",
-            params={"source": self.project.name},
-        )
-        if not resp.status_code == 200:
-            return None
 
-        notebooks = resp.json()["notebooks"]
-        for notebook in notebooks:
-            if notebook["name"].endswith(".ipynb"):
-                notebook["name"] = notebook["name"][:-6]
-        return notebooks
+        These are fetched in the background by the refresh_project_notebooks
+        task; this only reads the cache.
+        """
+        return get_notebooks(self.project)
 
     def get_recent_members(self):
         """
         Get recent project members.
         """
-        recent_members = self.project.project_members.filter(joined=True).order_by(
-            "-created"
-        )[:5]
+        recent_members = (
+            self.project.project_members.filter(joined=True)
+            .select_related("member__user")
+            .order_by("-created")[:5]
+        )
         return [pm.member for pm in recent_members]
 
     def get_member_data_files(self):
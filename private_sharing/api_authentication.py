@@ -9,6 +9,7 @@ from rest_framework import exceptions
 from rest_framework.authentication import BaseAuthentication, get_authorization_header
 
 from .models import DataRequestProject, OAuth2DataRequestProject
+from .utilities import cache_token_credentials, get_cached_token_credentials
 
 UserModel = get_user_model()
 
@@ -47,8 +48,17 @@ class MasterTokenAuthentication(BaseAuthentication):
 
     @staticmethod
     def authenticate_credentials(key):
+        cached = get_cached_token_credentials("master", key)
+        if cached:
+            user, project, expires = cached
+            if expires and expires < arrow.utcnow().datetime:
+                raise exceptions.AuthenticationFailed("Expired token.")
+            return (user, project)
+
         try:
-            project = DataRequestProject.objects.get(master_access_token=key)
+            project = DataRequestProject.objects.select_related(
+                "coordinator__user"
+            ).get(master_access_token=key)
 
             if (
                 not project.token_expiration_disabled
@@ -64,6 +74,11 @@ class MasterTokenAuthentication(BaseAuthentication):
         if not project or not user:
             raise exceptions.AuthenticationFailed("Invalid token.")
 
+        expires = (
+            None if project.token_expiration_disabled else project.token_expiration_date
+        )
+        cache_token_credentials("master", key, user, project, expires)
+
         return (user, project)
 
     def authenticate_header(self, request):
@@ -86,10 +101,23 @@ class CustomOAuth2Authentication(OAuth2Authentication):
         (user, project) if authentication succeeds, or None otherwise.
         """
         request.oauth2_error = getattr(request, "oauth2_error", {})
-        access_token = None
+        token = None
         try:
             auth = get_authorization_header(request).split()
             token = auth[1].decode()
+        except Exception:
+            pass
+
+        if token:
+            cached = get_cached_token_credentials("oauth2", token)
+            if cached:
+                user, project, expires = cached
+                if expires < arrow.utcnow().datetime:
+                    raise exceptions.AuthenticationFailed("Expired token.")
+                return (user, project)
+
+        access_token = None
+        try:
             access_token = AccessToken.objects.get(token=token)
         except Exception:
             pass
@@ -103,6 +131,10 @@ class CustomOAuth2Authentication(OAuth2Authentication):
             project = OAuth2DataRequestProject.objects.get(
                 application=auth[1].application
             )
+            # The token may have come from the request body rather than the header
+            cache_token_credentials(
+                "oauth2", auth[1].token, auth[0], project, auth[1].expires
+            )
             return (auth[0], project)
 
         return auth
@@ -7,6 +7,7 @@ from . import api_views
 urlpatterns = [
     path("project/", api_views.ProjectDataView.as_view()),
     path("project/members/", api_views.ProjectMemberDataView.as_view()),
+    path("project/members/bulk/", api_views.ProjectMemberBulkDataView.as_view()),
     path(
         "project/exchange-member/",
         api_views.ProjectMemberExchangeView.as_view(),
@@ -24,6 +25,22 @@ urlpatterns = [
         "project/files/upload/complete/",
         api_views.ProjectFileDirectUploadCompletionView.as_view(),
     ),
+    path(
+        "project/files/upload/direct/batch/",
+        api_views.ProjectFileDirectUploadBatchView.as_view(),
+    ),
+    path(
+        "project/files/upload/complete/batch/",
+        api_views.ProjectFileDirectUploadBatchCompletionView.as_view(),
+    ),
+    path(
+        "project/files/upload/multipart/",
+        api_views.ProjectFileMultipartUploadView.as_view(),
+    ),
+    path(
+        "project/files/upload/multipart/complete/",
+        api_views.ProjectFileMultipartUploadCompletionView.as_view(),
+    ),
 ]
 
 urlpatterns = format_suffix_patterns(urlpatterns)
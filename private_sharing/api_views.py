@@ -1,11 +1,12 @@
 import os
+from collections import defaultdict
 
-from boto.s3.connection import S3Connection
 from botocore.exceptions import ClientError as BotoClientError
 
 from django.conf import settings
 from django.contrib.auth import get_user_model, logout
 from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
 from django.db.models.query import QuerySet
 
 from rest_framework import serializers, status
@@ -13,20 +14,26 @@ from rest_framework.generics import ListAPIView, RetrieveAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from common.mixins import NeverCacheMixin
+from common.mixins import EagerLoadingMixin, NeverCacheMixin
+from common.ndjson import ndjson_response
 
 from data_import.models import DataFile
 from data_import.serializers import DataFileSerializer
 from data_import.utils import get_upload_path
+from open_humans.storage import get_object_sizes, get_s3_client
 
 from .api_authentication import CustomOAuth2Authentication, MasterTokenAuthentication
 from .api_filter_backends import ProjectFilterBackend
 from .api_permissions import HasValidProjectToken
 from .forms import (
     DeleteDataFileForm,
+    DirectUploadDataFileBatchCompletionForm,
+    DirectUploadDataFileBatchForm,
     DirectUploadDataFileForm,
     DirectUploadDataFileCompletionForm,
     MessageProjectMembersForm,
+    MultipartUploadDataFileCompletionForm,
+    MultipartUploadDataFileForm,
     RemoveProjectMembersForm,
     UploadDataFileForm,
 )
@@ -35,6 +42,7 @@ from .models import (
     DataRequestProjectMember,
     OAuth2DataRequestProject,
     ProjectDataFile,
+    PublicDataFileIndex,
 )
 from .serializers import ProjectDataSerializer, ProjectMemberDataSerializer
 
@@ -108,7 +116,7 @@ class ProjectDataView(ProjectDetailView):
     serializer_class = ProjectDataSerializer
 
 
-class ProjectMemberExchangeView(NouserNocacheMixin, ListAPIView):
+class ProjectMemberExchangeView(NouserNocacheMixin, EagerLoadingMixin, ListAPIView):
     """
     Return the project member information attached to the OAuth2 access token.
     """
@@ -168,9 +176,6 @@ class ProjectMemberExchangeView(NouserNocacheMixin, ListAPIView):
             DataFile.objects.filter(user=self.obj.member.user)
             .exclude(parent_project_data_file=None)
             .exclude(parent_project_data_file__completed=False)
-            .select_related("parent_project_data_file")
-            .prefetch_related("parent_project_data_file__datatypes")
-            .prefetch_related("parent_project_data_file__direct_sharing_project")
         )
 
         if self.obj.all_sources_shared:
@@ -199,7 +204,7 @@ class ProjectMemberExchangeView(NouserNocacheMixin, ListAPIView):
         return ret
 
 
-class ProjectMemberDataView(ProjectListView):
+class ProjectMemberDataView(EagerLoadingMixin, ProjectListView):
     """
     Return information about the project's members.
     """
@@ -213,6 +218,113 @@ class ProjectMemberDataView(ProjectListView):
         return DataRequestProjectMember.objects.filter_active()
 
 
+class ProjectMemberBulkDataView(ProjectAPIView, APIView):
+    """
+    Stream all of the project's active members, each with every file they've
+    shared with the project, as newline-delimited JSON.
+
+    Members are processed in chunks; each chunk takes a fixed number of queries
+    regardless of how many files its members have.
+    """
+
+    authentication_classes = (MasterTokenAuthentication,)
+    chunk_size = 500
+
+    def get(self, request):
+        return ndjson_response(self.get_rows(request.auth))
+
+    def get_rows(self, project):
+        members = (
+            DataRequestProjectMember.objects.filter_active()
+            .filter(project=project)
+            .select_related("member__user")
+            .prefetch_related("granted_sources")
+            .order_by("id")
+        )
+
+        last_id = 0
+
+        while True:
+            chunk = list(members.filter(id__gt=last_id)[: self.chunk_size])
+
+            if not chunk:
+                return
+
+            yield from self.get_chunk_rows(project, chunk)
+
+            last_id = chunk[-1].id
+
+    def get_chunk_rows(self, project, chunk):
+        """
+        Return the rows for a chunk of project members.
+        """
+        shared_sources = {}
+
+        for project_member in chunk:
+            if project_member.all_sources_shared:
+                shared_sources[project_member.id] = None
+            else:
+                shared_sources[project_member.id] = set(
+                    [source.id_label for source in project_member.granted_sources.all()]
+                    + [project.id_label]
+                )
+
+        files = (
+            DataFile.objects.filter(
+                user_id__in=[project_member.member.user_id for project_member in chunk]
+            )
+            .exclude(parent_project_data_file=None)
+            .exclude(parent_project_data_file__completed=False)
+            .order_by("source", "id")
+        )
+
+        if None not in shared_sources.values():
+            files = files.filter(source__in=set.union(*shared_sources.values()))
+
+        files_by_user = defaultdict(list)
+
+        for data_file in DataFileSerializer.setup_eager_loading(files):
+            files_by_user[data_file.user_id].append(data_file)
+
+        member_files = {}
+
+        for project_member in chunk:
+            sources = shared_sources[project_member.id]
+
+            member_files[project_member.id] = [
+                data_file
+                for data_file in files_by_user[project_member.member.user_id]
+                if sources is None or data_file.source in sources
+            ]
+
+        keys = DataFile.generate_keys(
+            [data_file for files in member_files.values() for data_file in files],
+            self.request,
+        )
+        serializer = DataFileSerializer(
+            context={"request": self.request, "datafile_keys": keys}
+        )
+
+        for project_member in chunk:
+            row = {
+                "created": project_member.created,
+                "project_member_id": project_member.project_member_id,
+                "file_count": len(member_files[project_member.id]),
+                "sources_shared": [
+                    source.id_label for source in project_member.granted_sources.all()
+                ],
+                "data": [
+                    serializer.to_representation(data_file)
+                    for data_file in member_files[project_member.id]
+                ],
+            }
+
+            if project_member.username_shared:
+                row["username"] = project_member.member.user.username
+
+            yield row
+
+
 class ProjectFormBaseView(ProjectAPIView, APIView):
     """
     A base view for uploads to Open Humans and S3 direct uploads.
@@ -322,17 +434,27 @@ class ProjectRemoveMemberView(ProjMemberFormAPIMixin, ProjectAPIView, APIView):
         return Response("success")
 
 
-class ProjectFileDirectUploadView(ProjectFormBaseView):
+def presign_upload(client_method, key, **params):
     """
-    Initiate a direct upload to S3 for a project by pre-signing and returning
-    the URL.
+    Pre-sign an S3 upload request for the given key with the shared client,
+    valid until incomplete files expire.
     """
+    return get_s3_client().generate_presigned_url(
+        client_method,
+        Params=dict(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key, **params),
+        ExpiresIn=settings.INCOMPLETE_FILE_EXPIRATION_HOURS * 60 * 60,
+    )
 
-    form_class = DirectUploadDataFileForm
 
-    def post(self, request):
-        super().post(request)
+class DirectUploadMixin:
+    """
+    A mixin for views initiating direct uploads to S3.
+    """
 
+    def create_data_file(self):
+        """
+        Create the incomplete ProjectDataFile a direct upload will fill.
+        """
         key = get_upload_path(self.project.id_label, self.form.cleaned_data["filename"])
 
         datafile = ProjectDataFile(
@@ -345,18 +467,108 @@ class ProjectFileDirectUploadView(ProjectFormBaseView):
         datafile.save()
         datafile.datatypes.set(self.form.cleaned_data["datatypes"])
 
-        s3 = S3Connection(settings.AWS_ACCESS_KEY_ID, settings.AWS_SECRET_ACCESS_KEY)
+        return datafile
 
-        url = s3.generate_url(
-            expires_in=settings.INCOMPLETE_FILE_EXPIRATION_HOURS * 60 * 60,
-            method="PUT",
-            bucket=settings.AWS_STORAGE_BUCKET_NAME,
-            key=key,
-        )
+
+class ProjectFileDirectUploadView(DirectUploadMixin, ProjectFormBaseView):
+    """
+    Initiate a direct upload to S3 for a project by pre-signing and returning
+    the URL.
+    """
+
+    form_class = DirectUploadDataFileForm
+
+    def post(self, request):
+        super().post(request)
+
+        datafile = self.create_data_file()
+        url = presign_upload("put_object", datafile.file.name)
 
         return Response({"id": datafile.id, "url": url}, status=status.HTTP_201_CREATED)
 
 
+class ProjectFileDirectUploadBatchView(ProjectFormBaseView):
+    """
+    Initiate direct uploads to S3 of many files for a project member at once by
+    pre-signing and returning a URL for each.
+    """
+
+    form_class = DirectUploadDataFileBatchForm
+
+    def post(self, request):
+        super().post(request)
+
+        files = self.form.cleaned_data["files"]
+
+        datafiles = [
+            ProjectDataFile(
+                user=self.project_member.member.user,
+                file=get_upload_path(self.project.id_label, file_data["filename"]),
+                metadata=file_data["metadata"],
+                direct_sharing_project=self.project,
+            )
+            for file_data in files
+        ]
+
+        Through = ProjectDataFile.datatypes.through
+
+        with transaction.atomic():
+            ProjectDataFile.bulk_create(datafiles)
+            Through.objects.bulk_create(
+                [
+                    Through(projectdatafile_id=datafile.id, datatype_id=datatype_id)
+                    for datafile, file_data in zip(datafiles, files)
+                    for datatype_id in {
+                        datatype.id for datatype in file_data["datatypes"]
+                    }
+                ]
+            )
+
+        return Response(
+            {
+                "files": [
+                    {
+                        "id": datafile.id,
+                        "url": presign_upload("put_object", datafile.file.name),
+                    }
+                    for datafile in datafiles
+                ]
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class ProjectFileMultipartUploadView(DirectUploadMixin, ProjectFormBaseView):
+    """
+    Initiate a direct upload to S3 in parts for a project by starting a
+    multipart upload and pre-signing and returning a URL for each part.
+    """
+
+    form_class = MultipartUploadDataFileForm
+
+    def post(self, request):
+        super().post(request)
+
+        datafile = self.create_data_file()
+        key = datafile.file.name
+
+        upload = get_s3_client().create_multipart_upload(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=key
+        )
+
+        urls = [
+            presign_upload(
+                "upload_part", key, UploadId=upload["UploadId"], PartNumber=part_number
+            )
+            for part_number in range(1, self.form.cleaned_data["part_count"] + 1)
+        ]
+
+        return Response(
+            {"id": datafile.id, "upload_id": upload["UploadId"], "urls": urls},
+            status=status.HTTP_201_CREATED,
+        )
+
+
 class ProjectFileDirectUploadCompletionView(ProjectFormBaseView):
     """
     Complete a direct upload for a project.
@@ -389,6 +601,117 @@ class ProjectFileDirectUploadCompletionView(ProjectFormBaseView):
             )
 
 
+class ProjectFileDirectUploadBatchCompletionView(ProjectFormBaseView):
+    """
+    Complete many direct uploads for a project member at once, checking that
+    each file is present in S3.
+    """
+
+    form_class = DirectUploadDataFileBatchCompletionForm
+
+    def post(self, request):
+        super().post(request)
+
+        file_ids = self.form.cleaned_data["file_ids"]
+
+        keys = dict(
+            ProjectDataFile.all_objects.filter(
+                id__in=file_ids,
+                direct_sharing_project=self.project,
+                user=self.project_member.member.user,
+            ).values_list("id", "file")
+        )
+        sizes = get_object_sizes(keys.values())
+
+        results = []
+        completed = []
+        for file_id in file_ids:
+            if file_id not in keys:
+                results.append({"id": file_id, "detail": "file does not exist"})
+            elif sizes[keys[file_id]] is None:
+                results.append({"id": file_id, "detail": "file not present"})
+            else:
+                results.append(
+                    {"id": file_id, "status": "ok", "size": sizes[keys[file_id]]}
+                )
+                completed.append(file_id)
+
+        if completed:
+            ProjectDataFile.all_objects.filter(id__in=completed).update(completed=True)
+            PublicDataFileIndex.refresh(id__in=completed)
+
+        return Response({"files": results}, status=status.HTTP_200_OK)
+
+
+class ProjectFileMultipartUploadCompletionView(ProjectFormBaseView):
+    """
+    Complete a direct upload in parts for a project by assembling the parts
+    that were uploaded.
+    """
+
+    form_class = MultipartUploadDataFileCompletionForm
+
+    def post(self, request):
+        super().post(request)
+
+        try:
+            data_file = ProjectDataFile.all_objects.get(
+                pk=self.form.cleaned_data["file_id"],
+                direct_sharing_project=self.project,
+                user=self.project_member.member.user,
+            )
+        except ProjectDataFile.DoesNotExist:
+            return Response(
+                {"detail": "file does not exist"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        client = get_s3_client()
+        upload = {
+            "Bucket": settings.AWS_STORAGE_BUCKET_NAME,
+            "Key": data_file.file.name,
+            "UploadId": self.form.cleaned_data["upload_id"],
+        }
+
+        parts = self.form.cleaned_data["parts"]
+
+        try:
+            uploaded = {
+                part["PartNumber"]: part
+                for page in client.get_paginator("list_parts").paginate(**upload)
+                for part in page.get("Parts", [])
+            }
+
+            # Don't assemble a file with parts that are missing or were replaced
+            missing = [
+                part["PartNumber"]
+                for part in parts
+                if uploaded.get(part["PartNumber"], {}).get("ETag", "").strip('"')
+                != part["ETag"].strip('"')
+            ]
+            if missing:
+                return Response(
+                    {"detail": "parts not uploaded", "parts": missing},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            client.complete_multipart_upload(MultipartUpload={"Parts": parts}, **upload)
+        except BotoClientError:
+            return Response(
+                {"detail": "file not present"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        data_file.completed = True
+        data_file.save()
+
+        return Response(
+            {
+                "status": "ok",
+                "size": sum(uploaded[part["PartNumber"]]["Size"] for part in parts),
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
 class ProjectFileUploadView(ProjectFormBaseView):
     """
     A form for uploading ProjectDataFiles to Open Humans.
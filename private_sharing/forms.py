@@ -16,6 +16,9 @@ from .models import (
     OnSiteDataRequestProject,
 )
 
+# The most files a project can upload for a member in one request
+DIRECT_UPLOAD_BATCH_SIZE = 1000
+
 
 def project_contain_no_url(value): 
   """
@@ -384,27 +387,43 @@ class UploadDataFileBaseForm(forms.Form):
 
     def __init__(self, *args, **kwargs):
         self.project = kwargs.pop("project")
+        # Shared by the forms of a batch so that each datatype is looked up once
+        self.datatype_cache = kwargs.pop("datatype_cache", {})
         super().__init__(*args, **kwargs)
 
+    def _get_registered_datatypes(self):
+        if "registered" not in self.datatype_cache:
+            self.datatype_cache["registered"] = list(
+                self.project.registered_datatypes.all()
+            )
+        return self.datatype_cache["registered"]
+
+    def _get_datatype(self, item, method):
+        key = (method, int(item) if method == "id" else str(item).lower())
+        if key not in self.datatype_cache:
+            try:
+                if method == "id":
+                    self.datatype_cache[key] = DataType.objects.get(id=key[1])
+                elif method == "name":
+                    self.datatype_cache[key] = DataType.objects.get(name__iexact=item)
+            except DataType.DoesNotExist:
+                self.datatype_cache[key] = None
+        return self.datatype_cache[key]
+
     def _get_datatypes(self, dt_list, method):
         """
         Get DataType objects from IDs or names, report if unmatched and unregistered.
         """
         assert method in ["id", "name"]
         datatypes, unregistered, unmatched = [], [], []
-        registered_datatypes = self.project.registered_datatypes.all()
         for item in dt_list:
-            try:
-                if method == "id":
-                    dt = DataType.objects.get(id=int(item))
-                elif method == "name":
-                    dt = DataType.objects.get(name__iexact=item)
-                if self.project.any_datatypes or dt in registered_datatypes:
-                    datatypes.append(dt)
-                else:
-                    unregistered.append(item)
-            except DataType.DoesNotExist:
+            dt = self._get_datatype(item, method)
+            if not dt:
                 unmatched.append(item)
+            elif self.project.any_datatypes or dt in self._get_registered_datatypes():
+                datatypes.append(dt)
+            else:
+                unregistered.append(item)
         return datatypes, unregistered, unmatched
 
     def clean_datatypes(self):
@@ -414,7 +433,7 @@ class UploadDataFileBaseForm(forms.Form):
         # TODO: When updated to require datatypes - no longer handle missing field.
         if not self.cleaned_data["datatypes"]:
             if self.project.auto_add_datatypes:
-                return self.project.registered_datatypes.all()
+                return self._get_registered_datatypes()
             else:
                 return []
 
@@ -520,6 +539,169 @@ class DirectUploadDataFileCompletionForm(forms.Form):
     project_member_id = forms.CharField(label="Project member ID", required=True)
 
 
+class MultipartUploadDataFileForm(DirectUploadDataFileForm):
+    """
+    A form for validating the direct upload of a file in parts for a project.
+    """
+
+    # S3 allows at most 10,000 parts per upload
+    part_count = forms.IntegerField(
+        label="Part count", required=True, min_value=1, max_value=10000
+    )
+
+
+class JSONListField(forms.Field):
+    """
+    A list, either JSON-formatted in form data or as is in a JSON request body.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.max_length = kwargs.pop("max_length", None)
+        super().__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return []
+
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise forms.ValidationError("could not parse the list")
+
+        if not isinstance(value, list):
+            raise forms.ValidationError("must be an array")
+
+        return value
+
+    def validate(self, value):
+        super().validate(value)
+
+        if self.max_length is not None and len(value) > self.max_length:
+            raise forms.ValidationError(
+                "at most {0} items are allowed".format(self.max_length)
+            )
+
+
+def as_json_string(value):
+    """
+    Return a value for a form field that expects a JSON-formatted string.
+    """
+    if value is None or isinstance(value, str):
+        return value
+
+    return json.dumps(value)
+
+
+class MultipartUploadDataFileCompletionForm(forms.Form):
+    """
+    A form for validating the completion of a direct upload in parts.
+    """
+
+    file_id = forms.IntegerField(required=True, label="File ID")
+
+    upload_id = forms.CharField(label="Upload ID", required=True)
+
+    project_member_id = forms.CharField(label="Project member ID", required=True)
+
+    # The PartNumber and ETag of each part, as returned by S3 for its upload
+    parts = JSONListField(label="Parts", required=True, max_length=10000)
+
+    def clean_parts(self):
+        """
+        Require every part from 1 up to the last one.
+        """
+        try:
+            parts = [
+                {"PartNumber": int(part["PartNumber"]), "ETag": str(part["ETag"])}
+                for part in self.cleaned_data["parts"]
+            ]
+        except (KeyError, TypeError, ValueError):
+            raise forms.ValidationError(
+                'each part must be an object with a "PartNumber" and an "ETag"'
+            )
+
+        parts.sort(key=lambda part: part["PartNumber"])
+
+        if [part["PartNumber"] for part in parts] != list(range(1, len(parts) + 1)):
+            raise forms.ValidationError("parts must be numbered from 1 without gaps")
+
+        return parts
+
+
+class DirectUploadDataFileBatchForm(forms.Form):
+    """
+    A form for validating the direct upload of many files for a project member.
+    """
+
+    project_member_id = forms.CharField(label="Project member ID", required=True)
+
+    files = JSONListField(
+        label="Files", required=True, max_length=DIRECT_UPLOAD_BATCH_SIZE
+    )
+
+    def __init__(self, *args, **kwargs):
+        self.project = kwargs.pop("project")
+        super().__init__(*args, **kwargs)
+
+    def clean_files(self):
+        """
+        Validate each file as DirectUploadDataFileForm would.
+        """
+        datatype_cache = {}
+        files = []
+        errors = []
+
+        for index, item in enumerate(self.cleaned_data["files"]):
+            if not isinstance(item, dict):
+                errors.append("file {0}: must be an object".format(index))
+                continue
+
+            form = DirectUploadDataFileForm(
+                {
+                    "filename": item.get("filename"),
+                    "metadata": as_json_string(item.get("metadata")),
+                    "datatypes": as_json_string(item.get("datatypes")),
+                },
+                project=self.project,
+                datatype_cache=datatype_cache,
+            )
+            del form.fields["project_member_id"]
+
+            if not form.is_valid():
+                for field, messages in form.errors.items():
+                    errors.extend(
+                        "file {0}: {1}: {2}".format(index, field, message)
+                        for message in messages
+                    )
+                continue
+
+            files.append(form.cleaned_data)
+
+        if errors:
+            raise forms.ValidationError(errors)
+
+        return files
+
+
+class DirectUploadDataFileBatchCompletionForm(forms.Form):
+    """
+    A form for validating the completion of a batch of direct uploads.
+    """
+
+    project_member_id = forms.CharField(label="Project member ID", required=True)
+
+    file_ids = JSONListField(
+        label="File IDs", required=True, max_length=DIRECT_UPLOAD_BATCH_SIZE
+    )
+
+    def clean_file_ids(self):
+        try:
+            return [int(file_id) for file_id in self.cleaned_data["file_ids"]]
+        except (TypeError, ValueError):
+            raise forms.ValidationError("file IDs must be integers")
+
+
 class DeleteDataFileForm(forms.Form):
     """
     A form for validating the deletion of files for a project.
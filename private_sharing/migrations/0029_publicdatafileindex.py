@@ -0,0 +1,104 @@
+# Generated by Django 3.2 on 2026-10-18 18:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_public_data_file_index(apps, schema_editor):
+    ProjectDataFile = apps.get_model("private_sharing", "ProjectDataFile")
+    PublicDataFileIndex = apps.get_model("private_sharing", "PublicDataFileIndex")
+
+    prefix = "user__member__public_data_participant__publicdataaccess"
+    values = (
+        ProjectDataFile.objects.filter(
+            completed=True,
+            **{
+                prefix + "__is_public": True,
+                prefix
+                + "__project_membership__project": models.F("direct_sharing_project"),
+            }
+        )
+        .order_by()
+        .values_list(
+            "id",
+            "user_id",
+            "direct_sharing_project_id",
+            prefix + "__project_membership__visible",
+            "direct_sharing_project__no_public_data",
+        )
+    )
+
+    PublicDataFileIndex.objects.bulk_create(
+        [
+            PublicDataFileIndex(
+                data_file_id=data_file_id,
+                user_id=user_id,
+                project_id=project_id,
+                membership_visible=membership_visible,
+                no_public_data=no_public_data,
+            )
+            for (
+                data_file_id,
+                user_id,
+                project_id,
+                membership_visible,
+                no_public_data,
+            ) in values.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("public_data", "0005_auto_20190508_2342"),
+        ("private_sharing", "0028_datarequestproject_jogl_page"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PublicDataFileIndex",
+            fields=[
+                (
+                    "data_file",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="public_index",
+                        serialize=False,
+                        to="private_sharing.projectdatafile",
+                    ),
+                ),
+                ("membership_visible", models.BooleanField(default=True)),
+                ("no_public_data", models.BooleanField(default=False)),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="private_sharing.datarequestproject",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="publicdatafileindex",
+            index=models.Index(
+                fields=["project", "user"], name="public_index_project_user"
+            ),
+        ),
+        migrations.RunPython(
+            populate_public_data_file_index, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2 on 2026-10-18 18:20
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def populate_member_counts(apps, schema_editor):
+    DataRequestProject = apps.get_model("private_sharing", "DataRequestProject")
+    DataRequestProjectMember = apps.get_model(
+        "private_sharing", "DataRequestProjectMember"
+    )
+
+    active = Q(member__user__is_active=True)
+    counts = (
+        DataRequestProjectMember.objects.order_by()
+        .values("project_id")
+        .annotate(
+            authorized_member_count=Count(
+                "id", filter=active & Q(joined=True, authorized=True, revoked=False)
+            ),
+            joined_member_count=Count("id", filter=active & Q(joined=True)),
+            public_member_count=Count("id", filter=Q(publicdataaccess__is_public=True)),
+        )
+    )
+
+    for row in counts:
+        DataRequestProject.objects.filter(id=row.pop("project_id")).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("public_data", "0005_auto_20190508_2342"),
+        ("private_sharing", "0029_publicdatafileindex"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="datarequestproject",
+            name="authorized_member_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="datarequestproject",
+            name="joined_member_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="datarequestproject",
+            name="public_member_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_member_counts, migrations.RunPython.noop),
+    ]
@@ -12,12 +12,13 @@ import arrow
 
 from autoslug import AutoSlugField
 
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.postgres.fields import ArrayField
 from django.core.validators import MinLengthValidator, RegexValidator, URLValidator
 from django.core.exceptions import ValidationError
-from django.db import models, router
-from django.db.models import F
+from django.db import models, router, transaction
+from django.db.models import Count, F, Q
 from django.db.models.deletion import Collector
 from django.urls import reverse
 from django.utils import timezone
@@ -47,6 +48,13 @@ operate (e.g. using Google Forms) where a pre-filled project_member_id field
 allows you to connect those responses to corresponding data in Open Humans."""
 
 
+MEMBER_COUNT_FIELDS = (
+    "authorized_member_count",
+    "joined_member_count",
+    "public_member_count",
+)
+
+
 def now_plus_24_hours():
     """
     Return a datetime 24 hours in the future.
@@ -247,11 +255,26 @@ class DataRequestProject(models.Model):
     no_public_data = models.BooleanField(default=False)
     auto_add_datatypes = models.BooleanField(default=False)
 
+    # Kept current by update_member_counts(), see open_humans.signals
+    authorized_member_count = models.PositiveIntegerField(default=0, editable=False)
+    joined_member_count = models.PositiveIntegerField(default=0, editable=False)
+    public_member_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # The fields read by badge_fields
+    BADGE_FIELDS = ("approved", "name", "slug", "badge_image")
+
     def __init__(self, *args, **kwargs):
         # Adds self.old_approved so that we can detect when the field changes
         super().__init__(*args, **kwargs)
         self.old_approved = self.approved
 
+        # Reading deferred fields here would load each of them with another
+        # query, so deferred instances (e.g. in a cascade delete) skip this
+        if self.get_deferred_fields().isdisjoint(self.BADGE_FIELDS):
+            self.old_badge_fields = self.badge_fields
+        else:
+            self.old_badge_fields = None
+
     def __str__(self):
         return str("{0}").format(self.name)
 
@@ -263,7 +286,20 @@ class DataRequestProject(models.Model):
             self.approval_history.append(
                 (self.approved, datetime.datetime.utcnow().isoformat())
             )
-        return super().save(*args, **kwargs)
+
+        ret = super().save(*args, **kwargs)
+
+        # Covers refresh_token() as well as any change to the project
+        forget_project_token_credentials(self.id)
+
+        return ret
+
+    @property
+    def badge_fields(self):
+        """
+        The fields shown in a project's badge on member profiles.
+        """
+        return (self.approved, self.name, self.slug, self.badge_image.name)
 
     @property
     def project_approval_date(self):
@@ -284,7 +320,7 @@ class DataRequestProject(models.Model):
         self.master_access_token = generate_id()
         self.token_expiration_date = now_plus_24_hours()
 
-        self.save()
+        self.save(update_fields=["master_access_token", "token_expiration_date"])
 
     @property
     def id_label(self):
@@ -304,7 +340,43 @@ class DataRequestProject(models.Model):
 
     @property
     def authorized_members(self):
-        return self.project_members.filter_active().count()
+        return self.authorized_member_count
+
+    @classmethod
+    def update_member_counts(cls, project_ids):
+        """
+        Recount the membership counters of the given projects and return how
+        many of them were out of date.
+        """
+        project_ids = set(project_ids)
+        active = Q(member__user__is_active=True)
+
+        counts = {
+            row.pop("project_id"): row
+            for row in DataRequestProjectMember.objects.filter(
+                project_id__in=project_ids
+            )
+            .order_by()
+            .values("project_id")
+            .annotate(
+                authorized_member_count=Count(
+                    "id",
+                    filter=active & Q(joined=True, authorized=True, revoked=False),
+                ),
+                joined_member_count=Count("id", filter=active & Q(joined=True)),
+                public_member_count=Count(
+                    "id", filter=Q(publicdataaccess__is_public=True)
+                ),
+            )
+        }
+
+        changed = 0
+
+        for project_id in project_ids:
+            row = counts.get(project_id, dict.fromkeys(MEMBER_COUNT_FIELDS, 0))
+            changed += cls.objects.filter(id=project_id).exclude(**row).update(**row)
+
+        return changed
 
     def active_user(self, user):
         try:
@@ -656,6 +728,15 @@ class DataRequestProjectMember(models.Model):
         super().save(*args, **kwargs)
 
 
+PUBLIC_DATA_ACCESS_PREFIX = "user__member__public_data_participant__publicdataaccess"
+
+PUBLIC_DATA_FILE_FILTERS = {
+    PUBLIC_DATA_ACCESS_PREFIX + "__is_public": True,
+    PUBLIC_DATA_ACCESS_PREFIX
+    + "__project_membership__project": F("direct_sharing_project"),
+}
+
+
 class CompletedManager(models.Manager):
     """
     A manager that only returns completed ProjectDataFiles.
@@ -668,15 +749,23 @@ class CompletedManager(models.Manager):
         return self.filter(user=user).exclude(completed=False).order_by("source")
 
     def public(self):
-        prefix = "user__member__public_data_participant__publicdataaccess"
-
-        filters = {
-            prefix + "__is_public": True,
-            prefix + "__project_membership__project": F("direct_sharing_project"),
-        }
+        """
+        Publicly shared files, read from the PublicDataFileIndex.
+        """
+        return (
+            self.filter(public_index__isnull=False)
+            .exclude(completed=False)
+            .order_by("user__username")
+        )
 
+    def public_by_access(self):
+        """
+        Publicly shared files, determined from PublicDataAccess directly.
+        """
         return (
-            self.filter(**filters).exclude(completed=False).order_by("user__username")
+            self.filter(**PUBLIC_DATA_FILE_FILTERS)
+            .exclude(completed=False)
+            .order_by("user__username")
         )
 
 
@@ -707,13 +796,132 @@ class ProjectDataFile(DataFile):
 
         super(ProjectDataFile, self).save(*args, **kwargs)
 
+    @classmethod
+    def bulk_create(cls, data_files):
+        """
+        Insert many new ProjectDataFiles with one query per table.
+
+        QuerySet.bulk_create() doesn't support multi-table inheritance, so the
+        DataFile rows are inserted first and the ProjectDataFile rows are
+        inserted pointing to them. Like bulk_create(), save() isn't called and
+        no signals are sent.
+        """
+        for data_file in data_files:
+            if not data_file.source:
+                data_file.source = data_file.direct_sharing_project.id_label
+
+        with transaction.atomic():
+            parents = DataFile.objects.bulk_create(
+                [
+                    DataFile(
+                        file=data_file.file.name,
+                        metadata=data_file.metadata,
+                        source=data_file.source,
+                        user=data_file.user,
+                    )
+                    for data_file in data_files
+                ]
+            )
+
+            for data_file, parent in zip(data_files, parents):
+                data_file.id = data_file.parent_id = parent.id
+                data_file.created = parent.created
+
+            cls.all_objects._insert(
+                data_files, fields=cls._meta.local_concrete_fields, raw=True
+            )
+
+        for data_file in data_files:
+            data_file._state.adding = False
+            data_file._state.db = cls.all_objects.db
+
+        return data_files
+
     @property
     def is_public(self):
-        return bool(
-            self.user.member.public_data_participant.publicdataaccess_set.filter(
-                project_membership__project=self.direct_sharing_project, is_public=True
+        return PublicDataFileIndex.objects.filter(data_file_id=self.pk).exists()
+
+
+class PublicDataFileIndex(models.Model):
+    """
+    Denormalized index of publicly shared ProjectDataFiles.
+
+    There is a row for every completed file its member has made public through
+    PublicDataAccess, i.e. the files in ProjectDataFile.objects.public_by_access().
+    Rows are kept current by signal handlers in public_data.signals and can be
+    rebuilt or verified with the public_data_file_index command.
+    """
+
+    data_file = models.OneToOneField(
+        ProjectDataFile,
+        primary_key=True,
+        related_name="public_index",
+        on_delete=models.CASCADE,
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name="+", on_delete=models.CASCADE
+    )
+    project = models.ForeignKey(
+        DataRequestProject, related_name="+", on_delete=models.CASCADE
+    )
+    # Copied from the DataRequestProjectMember and DataRequestProject
+    membership_visible = models.BooleanField(default=True)
+    no_public_data = models.BooleanField(default=False)
+
+    class Meta:  # noqa: D101
+        indexes = [
+            models.Index(fields=["project", "user"], name="public_index_project_user")
+        ]
+
+    def __str__(self):
+        return str("{0}:{1}").format(self.project_id, self.data_file_id)
+
+    @staticmethod
+    def expected_rows(data_files):
+        """
+        Return the index rows that should exist for a ProjectDataFile queryset.
+        """
+        values = (
+            data_files.filter(completed=True, **PUBLIC_DATA_FILE_FILTERS)
+            .order_by()
+            .values_list(
+                "id",
+                "user_id",
+                "direct_sharing_project_id",
+                PUBLIC_DATA_ACCESS_PREFIX + "__project_membership__visible",
+                "direct_sharing_project__no_public_data",
             )
         )
+        return [
+            PublicDataFileIndex(
+                data_file_id=data_file_id,
+                user_id=user_id,
+                project_id=project_id,
+                membership_visible=membership_visible,
+                no_public_data=no_public_data,
+            )
+            for (
+                data_file_id,
+                user_id,
+                project_id,
+                membership_visible,
+                no_public_data,
+            ) in values
+        ]
+
+    @classmethod
+    def refresh(cls, **filters):
+        """
+        Rebuild the index rows for the ProjectDataFiles matching `filters`.
+        """
+        data_files = ProjectDataFile.all_objects.filter(**filters)
+
+        with transaction.atomic():
+            cls.objects.filter(data_file__in=data_files).delete()
+            # Another refresh of the same files may have run concurrently.
+            cls.objects.bulk_create(
+                cls.expected_rows(data_files), ignore_conflicts=True
+            )
 
 
 class ActivityFeed(models.Model):
@@ -778,4 +986,4 @@ class FeaturedProject(models.Model):
     description = models.TextField(blank=True)
 
 
-from .utilities import send_withdrawal_email
+from .utilities import forget_project_token_credentials, send_withdrawal_email
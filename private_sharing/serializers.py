@@ -2,18 +2,22 @@ from django.urls import reverse
 
 from rest_framework import serializers
 
-from common.utils import full_url
+from common.mixins import EagerLoadingSerializerMixin
+from common.utils import full_url, reverse_pk
 from data_import.models import DataFile, DataType
 from data_import.serializers import DataFileSerializer
 
 from .models import DataRequestProject, DataRequestProjectMember
 
 
-class ProjectDataSerializer(serializers.ModelSerializer):
+class ProjectDataSerializer(EagerLoadingSerializerMixin, serializers.ModelSerializer):
     """
     Publicly available data about a project.
     """
 
+    select_related_fields = ("oauth2datarequestproject", "onsitedatarequestproject")
+    prefetch_related_fields = ("registered_datatypes", "requested_sources")
+
     authorized_members = serializers.ReadOnlyField()
     id_label = serializers.ReadOnlyField()
     type = serializers.ReadOnlyField()
@@ -52,8 +56,7 @@ class ProjectDataSerializer(serializers.ModelSerializer):
 
     def get_requested_sources(self, obj):
         return [
-            reverse("api:project", kwargs={"pk": proj.id})
-            for proj in obj.requested_sources.all()
+            reverse_pk("api:project", proj.id) for proj in obj.requested_sources.all()
         ]
 
     def get_request_sources_access(self, obj):
@@ -69,16 +72,20 @@ class ProjectDataSerializer(serializers.ModelSerializer):
         Get links to DataType API endpoints for registered DataTypes
         """
         return [
-            reverse("api:datatype", kwargs={"pk": dt.id})
-            for dt in obj.registered_datatypes.all()
+            reverse_pk("api:datatype", dt.id) for dt in obj.registered_datatypes.all()
         ]
 
 
-class ProjectMemberDataSerializer(serializers.ModelSerializer):
+class ProjectMemberDataSerializer(
+    EagerLoadingSerializerMixin, serializers.ModelSerializer
+):
     """
     Serialize data for a project member.
     """
 
+    select_related_fields = ("member__user", "project")
+    prefetch_related_fields = ("granted_sources",)
+
     sources_shared = serializers.SerializerMethodField()
 
     class Meta:  # noqa: D101
@@ -154,13 +161,10 @@ class ProjectMemberDataSerializer(serializers.ModelSerializer):
         the project, including the project itself.
         """
         # Limit to the first ten files
-        files = self.get_qs(obj)[:10]
+        files = DataFileSerializer.setup_eager_loading(self.get_qs(obj))[:10]
 
         request = self.context.get("request", None)
-        return [
-            DataFileSerializer(data_file, context={"request": request}).data
-            for data_file in files
-        ]
+        return DataFileSerializer(files, many=True, context={"request": request}).data
 
     def to_representation(self, obj):
         rep = super().to_representation(obj)
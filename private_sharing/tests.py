@@ -1,21 +1,30 @@
+import json
 import os
 import unittest
 
 from io import StringIO
 from datetime import timedelta
-from urllib.parse import quote
+from urllib.parse import parse_qs, quote, urlparse
+
+import boto3
+from botocore.config import Config
+from botocore.stub import ANY, Stubber
 
 from django.conf import settings
 from django.contrib import auth
+from django.core import management
+from django.core.cache import cache
 from django.test import TestCase
 from django.test.utils import override_settings
 from django.utils import timezone
 
+from mock import patch
 from oauth2_provider.models import AccessToken
 
 from common.testing import BrowserTestCase, get_or_create_user, SmokeTestCase
 from data_import.models import DataType
 from open_humans.models import Member
+from open_humans.storage import PrivateStorage, get_object_size, get_s3_client
 
 from .models import (
     DataRequestProject,
@@ -24,7 +33,13 @@ from .models import (
     OAuth2DataRequestProject,
     ProjectDataFile,
 )
+from .api_views import presign_upload
 from .testing import DirectSharingMixin, DirectSharingTestsMixin
+from .utilities import (
+    _project_token_version_key,
+    cache_token_credentials,
+    get_cached_token_credentials,
+)
 
 UserModel = auth.get_user_model()
 
@@ -380,6 +395,94 @@ class DirectSharingOAuth2Tests(DirectSharingMixin, DirectSharingTestsMixin, Test
 
         self.assertEqual(data_file.file.readlines(), [b"just testing..."])
 
+    def test_direct_upload_batch(self):
+        member = self.update_member(joined=True, authorized=True)
+        datatypes = self.insert_datatypes()
+        self.member1_project.registered_datatypes.clear()
+        self.member1_project.registered_datatypes.add(
+            datatypes.get(name="all your base")
+        )
+        self.member1_project.save()
+
+        metadata = {"description": "Test description...", "tags": ["tag 1"]}
+
+        response = self.client.post(
+            "/api/direct-sharing/project/files/upload/direct/batch/"
+            "?access_token={}".format(self.access_token),
+            data=json.dumps(
+                {
+                    "project_member_id": member.project_member_id,
+                    "files": [
+                        {
+                            "filename": "day-{}.json".format(day),
+                            "metadata": metadata,
+                            "datatypes": ["all your base"],
+                        }
+                        for day in range(3)
+                    ],
+                }
+            ),
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+
+        files = response.json()["files"]
+        self.assertEqual(len(files), 3)
+
+        data_files = ProjectDataFile.all_objects.filter(
+            id__in=[item["id"] for item in files],
+            direct_sharing_project=self.member1_project,
+            user=self.member1.user,
+            completed=False,
+        )
+        self.assertEqual(
+            sorted(data_file.file.name.split("/")[-1] for data_file in data_files),
+            ["day-0.json", "day-1.json", "day-2.json"],
+        )
+
+        for data_file in data_files:
+            self.assertEqual(data_file.metadata, metadata)
+            self.assertEqual(
+                [datatype.name for datatype in data_file.datatypes.all()],
+                ["all your base"],
+            )
+
+        # Only the second file was uploaded, so only it is completed
+        keys = dict(data_files.values_list("id", "file"))
+        sizes = {keys[files[1]["id"]]: 10}
+
+        with patch("open_humans.storage.get_object_size", side_effect=sizes.get):
+            response = self.client.post(
+                "/api/direct-sharing/project/files/upload/complete/batch/"
+                "?access_token={}".format(self.access_token),
+                data=json.dumps(
+                    {
+                        "project_member_id": member.project_member_id,
+                        "file_ids": [files[0]["id"], files[1]["id"], 0],
+                    }
+                ),
+                content_type="application/json",
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["files"],
+            [
+                {"id": files[0]["id"], "detail": "file not present"},
+                {"id": files[1]["id"], "status": "ok", "size": 10},
+                {"id": 0, "detail": "file does not exist"},
+            ],
+        )
+        self.assertEqual(
+            list(
+                ProjectDataFile.all_objects.filter(
+                    id__in=keys, completed=True
+                ).values_list("id", flat=True)
+            ),
+            [files[1]["id"]],
+        )
+
     def test_message_member(self):
         self.update_member(joined=True, authorized=True)
 
@@ -506,6 +609,453 @@ class DirectSharingOAuth2Tests2(DirectSharingMixin, TestCase):
         self.assertEqual(response.json()["detail"], "Expired token.")
 
 
+@override_settings(SSLIFY_DISABLE=True)
+@override_settings(SSLIFY_DISABLE=True, AWS_STORAGE_BUCKET_NAME="test-bucket")
+class DirectUploadS3Tests(DirectSharingMixin, TestCase):
+    """
+    Tests for pre-signed and multipart uploads, with S3 stubbed out.
+    """
+
+    metadata = {"description": "Test description...", "tags": ["tag 1"]}
+
+    @classmethod
+    def setUpClass(cls):
+        super(DirectUploadS3Tests, cls).setUpClass()
+
+        user1 = get_or_create_user("user1")
+        cls.member1, _ = Member.objects.get_or_create(user=user1)
+
+    def setUp(self):
+        self.member1_project = DataRequestProject.objects.get(slug="abc-2")
+        self.project_member = self.update_member(joined=True, authorized=True)
+
+        self.s3_client = boto3.client(
+            "s3",
+            region_name="us-east-1",
+            aws_access_key_id="testing",
+            aws_secret_access_key="testing",
+            config=Config(signature_version="s3v4"),
+        )
+
+        client_patcher = patch("open_humans.storage._s3_client", self.s3_client)
+        client_patcher.start()
+        self.addCleanup(client_patcher.stop)
+
+        self.stubber = Stubber(self.s3_client)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+
+    def post(self, path, data):
+        return self.client.post(
+            "/api/direct-sharing/project/files/upload/{0}?access_token={1}".format(
+                path, self.member1_project.master_access_token
+            ),
+            data=json.dumps(
+                dict(data, project_member_id=self.project_member.project_member_id)
+            ),
+            content_type="application/json",
+        )
+
+    def create_data_file(self, name):
+        return ProjectDataFile.objects.create(
+            user=self.member1.user,
+            file="member-files/multipart/{}".format(name),
+            direct_sharing_project=self.member1_project,
+            completed=False,
+        )
+
+    def test_get_s3_client(self):
+        with patch("open_humans.storage._s3_client", None):
+            client = get_s3_client()
+
+            self.assertIs(get_s3_client(), client)
+
+        self.assertEqual(client.meta.config.signature_version, "s3v4")
+
+    def test_download_url_signing(self):
+        url = urlparse(
+            PrivateStorage(access_key="testing", secret_key="testing").url(
+                "member-files/a.json"
+            )
+        )
+        query = parse_qs(url.query)
+
+        # Only uploads are signed with the shared client's SigV4
+        self.assertTrue(url.path.endswith("/member-files/a.json"))
+        self.assertEqual(query["AWSAccessKeyId"], ["testing"])
+        self.assertIn("Signature", query)
+        self.assertNotIn("X-Amz-Algorithm", query)
+
+    def test_presign_upload(self):
+        url = urlparse(presign_upload("put_object", "member-files/a.json"))
+        query = parse_qs(url.query)
+
+        self.assertTrue(url.path.endswith("/member-files/a.json"))
+        self.assertEqual(query["X-Amz-Algorithm"], ["AWS4-HMAC-SHA256"])
+        self.assertEqual(
+            query["X-Amz-Expires"],
+            [str(settings.INCOMPLETE_FILE_EXPIRATION_HOURS * 60 * 60)],
+        )
+        self.assertIn("X-Amz-Signature", query)
+
+    def test_get_object_size(self):
+        self.stubber.add_response(
+            "head_object",
+            {"ContentLength": 10},
+            {"Bucket": "test-bucket", "Key": "member-files/present.json"},
+        )
+        self.stubber.add_client_error(
+            "head_object", service_error_code="404", http_status_code=404
+        )
+
+        self.assertEqual(get_object_size("member-files/present.json"), 10)
+        self.assertIsNone(get_object_size("member-files/missing.json"))
+
+    def test_direct_upload_url(self):
+        response = self.post(
+            "direct/", {"filename": "a.json", "metadata": json.dumps(self.metadata)}
+        )
+
+        self.assertEqual(response.status_code, 201)
+
+        data_file = ProjectDataFile.all_objects.get(id=response.json()["id"])
+        url = urlparse(response.json()["url"])
+
+        self.assertFalse(data_file.completed)
+        self.assertTrue(url.path.endswith(data_file.file.name))
+        self.assertIn("X-Amz-Signature", parse_qs(url.query))
+
+    def test_multipart_upload(self):
+        self.stubber.add_response(
+            "create_multipart_upload",
+            {"Bucket": "test-bucket", "Key": "key", "UploadId": "upload-1"},
+            {"Bucket": "test-bucket", "Key": ANY},
+        )
+
+        response = self.post(
+            "multipart/",
+            {
+                "filename": "a.json",
+                "metadata": json.dumps(self.metadata),
+                "part_count": 3,
+            },
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["upload_id"], "upload-1")
+
+        urls = [urlparse(url) for url in response.json()["urls"]]
+        self.assertEqual(
+            [parse_qs(url.query)["partNumber"] for url in urls], [["1"], ["2"], ["3"]]
+        )
+        self.assertEqual(parse_qs(urls[0].query)["uploadId"], ["upload-1"])
+
+        data_file = ProjectDataFile.all_objects.get(id=response.json()["id"])
+        self.assertTrue(urls[0].path.endswith(data_file.file.name))
+        self.assertFalse(data_file.completed)
+
+    def stub_list_parts(self, data_file, part_numbers):
+        self.stubber.add_response(
+            "list_parts",
+            {
+                "Parts": [
+                    {
+                        "PartNumber": number,
+                        "ETag": '"etag-{}"'.format(number),
+                        "Size": 5,
+                    }
+                    for number in part_numbers
+                ],
+                "IsTruncated": False,
+            },
+            {"Bucket": "test-bucket", "Key": data_file.file.name, "UploadId": "up"},
+        )
+
+    def complete(self, data_file, part_numbers):
+        return self.post(
+            "multipart/complete/",
+            {
+                "file_id": data_file.id,
+                "upload_id": "up",
+                "parts": [
+                    {"PartNumber": number, "ETag": "etag-{}".format(number)}
+                    for number in part_numbers
+                ],
+            },
+        )
+
+    def test_multipart_completion(self):
+        data_file = self.create_data_file("complete.json")
+        parts = [
+            {"PartNumber": number, "ETag": "etag-{}".format(number)}
+            for number in [1, 2, 3]
+        ]
+
+        self.stub_list_parts(data_file, [1, 2, 3])
+        self.stubber.add_response(
+            "complete_multipart_upload",
+            {},
+            {
+                "Bucket": "test-bucket",
+                "Key": data_file.file.name,
+                "UploadId": "up",
+                "MultipartUpload": {"Parts": parts},
+            },
+        )
+
+        response = self.complete(data_file, [3, 1, 2])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "ok", "size": 15})
+        self.assertTrue(ProjectDataFile.objects.filter(id=data_file.id).exists())
+        self.stubber.assert_no_pending_responses()
+
+    def test_multipart_completion_with_missing_part(self):
+        data_file = self.create_data_file("missing.json")
+
+        self.stub_list_parts(data_file, [1, 3])
+
+        response = self.complete(data_file, [1, 2, 3])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {"detail": "parts not uploaded", "parts": [2]}
+        )
+        self.assertFalse(ProjectDataFile.objects.filter(id=data_file.id).exists())
+        self.stubber.assert_no_pending_responses()
+
+    def test_multipart_completion_with_gap(self):
+        data_file = self.create_data_file("gap.json")
+
+        response = self.complete(data_file, [1, 3])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("parts", response.json())
+
+    def test_expunge_aborts_multipart_uploads(self):
+        data_file = self.create_data_file("abandoned.json")
+        ProjectDataFile.all_objects.filter(id=data_file.id).update(
+            created=timezone.now() - timedelta(days=30)
+        )
+
+        self.stubber.add_response(
+            "list_multipart_uploads",
+            {
+                "Uploads": [
+                    {"Key": data_file.file.name, "UploadId": "abandoned"},
+                    {"Key": "member-files/in-progress.json", "UploadId": "current"},
+                ],
+                "IsTruncated": False,
+            },
+            {"Bucket": "test-bucket"},
+        )
+        self.stubber.add_response(
+            "abort_multipart_upload",
+            {},
+            {
+                "Bucket": "test-bucket",
+                "Key": data_file.file.name,
+                "UploadId": "abandoned",
+            },
+        )
+
+        with patch("open_humans.storage.PrivateStorage.delete"):
+            management.call_command("expunge_project_data_files", stdout=StringIO())
+
+        self.assertFalse(ProjectDataFile.all_objects.filter(id=data_file.id).exists())
+        self.stubber.assert_no_pending_responses()
+
+
+class ProjectTokenCacheTests(DirectSharingMixin, TestCase):
+    """
+    Tests for the cache of resolved project tokens.
+    """
+
+    def test_refresh_token_invalidates_cached_master_token(self):
+        project = DataRequestProject.objects.get(slug="abc-2")
+        old_token = project.master_access_token
+        url = "/api/direct-sharing/project/?access_token={0}"
+
+        self.assertEqual(self.client.get(url.format(old_token)).status_code, 200)
+
+        project.refresh_token()
+
+        self.assertEqual(self.client.get(url.format(old_token)).status_code, 401)
+        self.assertEqual(
+            self.client.get(url.format(project.master_access_token)).status_code, 200
+        )
+
+    @staticmethod
+    def create_oauth2_token(token):
+        project = OAuth2DataRequestProject.objects.get(slug="abc")
+        member, _ = Member.objects.get_or_create(user=get_or_create_user("bacon"))
+        DataRequestProjectMember.objects.create(
+            member=member, project=project, joined=True, authorized=True
+        )
+
+        return AccessToken.objects.create(
+            application=project.application,
+            user=member.user,
+            token=token,
+            expires=timezone.now() + timedelta(days=1),
+            scope="read",
+        )
+
+    def test_oauth2_token_in_request_body(self):
+        access_token = self.create_oauth2_token("token-in-body")
+
+        response = self.client.post(
+            "/api/direct-sharing/project/files/delete/",
+            {"access_token": access_token.token, "all_files": True},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(get_cached_token_credentials("oauth2", access_token.token))
+
+    def test_deleted_oauth2_token_is_forgotten(self):
+        access_token = self.create_oauth2_token("token-to-delete")
+        url = "/api/direct-sharing/project/exchange-member/?access_token={0}".format(
+            access_token.token
+        )
+
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        access_token.delete()
+
+        self.assertIsNone(get_cached_token_credentials("oauth2", access_token.token))
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+    def test_evicted_version_does_not_revive_entries(self):
+        project = DataRequestProject.objects.get(slug="abc-2")
+        cache_token_credentials(
+            "master", "evicted-token", project.coordinator.user, project, None
+        )
+        self.assertIsNotNone(get_cached_token_credentials("master", "evicted-token"))
+
+        project.save()
+        self.assertIsNone(get_cached_token_credentials("master", "evicted-token"))
+
+        cache.delete(_project_token_version_key(project.id))
+        self.assertIsNone(get_cached_token_credentials("master", "evicted-token"))
+
+
+@override_settings(SSLIFY_DISABLE=True)
+class ProjectMemberBulkDataTests(DirectSharingMixin, TestCase):
+    """
+    Tests for the bulk project member export.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(ProjectMemberBulkDataTests, cls).setUpClass()
+
+        user1 = get_or_create_user("user1")
+        cls.member1, _ = Member.objects.get_or_create(user=user1)
+
+    def setUp(self):
+        self.member1_project = DataRequestProject.objects.get(slug="abc-2")
+
+    def test_bulk_export_includes_all_files(self):
+        self.update_member(joined=True, authorized=True)
+
+        for i in range(12):
+            ProjectDataFile(
+                direct_sharing_project=self.member1_project,
+                user=self.member1.user,
+                completed=True,
+                file="member-files/bulk/{}.json".format(i),
+            ).save()
+
+        response = self.client.get(
+            "/api/direct-sharing/project/members/bulk/?access_token={0}".format(
+                self.member1_project.master_access_token
+            )
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).decode().splitlines()
+        ]
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["file_count"], 12)
+        self.assertEqual(len(rows[0]["data"]), 12)
+
+
+@override_settings(SSLIFY_DISABLE=True)
+class ProjectMemberCountTests(DirectSharingMixin, TestCase):
+    """
+    Tests for the stored project membership counters.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(ProjectMemberCountTests, cls).setUpClass()
+
+        user1 = get_or_create_user("user1")
+        cls.member1, _ = Member.objects.get_or_create(user=user1)
+
+    def setUp(self):
+        super(ProjectMemberCountTests, self).setUp()
+
+        self.member1_project = DataRequestProject.objects.get(slug="abc-2")
+
+    def get_counts(self):
+        project = DataRequestProject.objects.get(id=self.member1_project.id)
+
+        return (project.authorized_member_count, project.joined_member_count)
+
+    def test_counts_follow_membership(self):
+        self.assertEqual(self.get_counts(), (0, 0))
+
+        project_member = self.update_member(joined=True, authorized=False)
+        self.assertEqual(self.get_counts(), (0, 1))
+
+        project_member.authorized = True
+        project_member.save()
+        self.assertEqual(self.get_counts(), (1, 1))
+
+        self.member1.user.is_active = False
+        self.member1.user.save()
+        self.assertEqual(self.get_counts(), (0, 0))
+
+        self.member1.user.is_active = True
+        self.member1.user.save()
+        self.assertEqual(self.get_counts(), (1, 1))
+
+        project_member.leave_project()
+        self.assertEqual(self.get_counts(), (0, 0))
+
+    def test_save_keeps_counts(self):
+        self.update_member(joined=True, authorized=True)
+
+        self.member1_project.name = "Renamed"
+        self.member1_project.save()
+
+        self.assertEqual(self.get_counts(), (1, 1))
+
+    def test_refresh_token_keeps_counts(self):
+        self.update_member(joined=True, authorized=True)
+
+        with self.assertNumQueries(2):
+            self.member1_project.refresh_token()
+
+        self.assertEqual(self.get_counts(), (1, 1))
+
+    def test_reconcile_counts(self):
+        self.update_member(joined=True, authorized=True)
+
+        DataRequestProject.objects.update(authorized_member_count=5)
+
+        self.assertEqual(
+            DataRequestProject.update_member_counts([self.member1_project.id]), 1
+        )
+        self.assertEqual(self.get_counts(), (1, 1))
+
+
 class SmokeTests(SmokeTestCase):
     """
     A simple GET test for all of the simple URLs in the site.
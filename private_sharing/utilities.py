@@ -1,7 +1,12 @@
+import hashlib
 import re
+import time
+
+import arrow
 
 from django.apps import apps
 from django.conf import settings
+from django.core.cache import cache
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.urls import reverse_lazy
@@ -9,6 +14,8 @@ from django.urls import reverse_lazy
 from common.utils import full_url, get_source_labels_and_names
 from private_sharing.models import DataRequestProject
 
+API_TOKEN_CACHE_TIMEOUT = 60
+
 
 def get_direct_sharing_sources():
     """
@@ -85,3 +92,85 @@ def send_withdrawal_email(project, erasure_requested):
     )
     email.attach_alternative(html, "text/html")
     email.send()
+
+
+def _token_cache_key(kind, token):
+    """
+    Cache key for an API token; the token itself is never used as a key.
+    """
+    return "api-token-{0}-{1}".format(
+        kind, hashlib.sha256(token.encode("utf-8")).hexdigest()
+    )
+
+
+def _project_token_version_key(project_id):
+    return "api-token-project-version-{0}".format(project_id)
+
+
+def get_project_token_version(project_id):
+    """
+    Return the version of a project's cached token credentials.
+
+    Versions start from the current time in microseconds rather than from 0,
+    so if the version is evicted, entries cached under an older version don't
+    become valid again.
+    """
+    key = _project_token_version_key(project_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_cached_token_credentials(kind, token):
+    """
+    Return the cached (user, project, expires) for a token, or None.
+
+    Entries cached before the project last changed are ignored.
+    """
+    cached = cache.get(_token_cache_key(kind, token))
+    if not cached:
+        return None
+
+    user, project, expires, version = cached
+    if version != get_project_token_version(project.id):
+        return None
+
+    return (user, project, expires)
+
+
+def cache_token_credentials(kind, token, user, project, expires):
+    """
+    Cache a token's resolved credentials until they expire, at most for
+    API_TOKEN_CACHE_TIMEOUT seconds.
+    """
+    timeout = API_TOKEN_CACHE_TIMEOUT
+    if expires:
+        timeout = min(timeout, int((expires - arrow.utcnow().datetime).total_seconds()))
+    if timeout <= 0:
+        return
+
+    cache.set(
+        _token_cache_key(kind, token),
+        (user, project, expires, get_project_token_version(project.id)),
+        timeout=timeout,
+    )
+
+
+def forget_token_credentials(kind, tokens):
+    """
+    Remove cached credentials for specific tokens.
+    """
+    cache.delete_many([_token_cache_key(kind, token) for token in tokens])
+
+
+def forget_project_token_credentials(project_id):
+    """
+    Invalidate every cached token credential for a project.
+    """
+    key = _project_token_version_key(project_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000000), timeout=None)
@@ -29,16 +29,7 @@ def public_count(project):
     """
     Get number of users publicly sharing a project's data.
     """
-    count = (
-        PublicDataAccess.objects.filter(
-            project_membership__project=project,
-            # Filter to only count members with datafiles for this project.
-            is_public=True,
-        )
-        .distinct()
-        .count()
-    )
-    return count
+    return project.public_member_count
 
 
 class Participant(models.Model):
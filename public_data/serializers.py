@@ -2,28 +2,33 @@ from collections import OrderedDict
 
 from rest_framework import serializers
 
+from common.mixins import EagerLoadingSerializerMixin
 from data_import.models import DataFile
+from data_import.serializers import DataFileListSerializer
 from open_humans.models import User
-from private_sharing.models import project_membership_visible
+from open_humans.serializers import public_membership_visible
 
 
-class PublicDataFileSerializer(serializers.ModelSerializer):
+class PublicDataFileSerializer(
+    EagerLoadingSerializerMixin, serializers.ModelSerializer
+):
     """
     Serialize a public data file.
     """
 
+    select_related_fields = ("user__member", "public_index")
+
     metadata = serializers.JSONField()
 
     def to_representation(self, data):
         ret = OrderedDict()
         fields = self.get_fields()
         query_params = dict(self.context.get("request").query_params)
-        source = getattr(data, "source")
         user_t = getattr(data, "user")
         usernames = []
         if "username" in query_params:
             usernames = query_params["username"]
-        visible = project_membership_visible(user_t.member, source)
+        visible = public_membership_visible(data)
         if (user_t.username in usernames) and not visible:
             return ret
         request = self.context.get("request", None)
@@ -41,13 +46,15 @@ class PublicDataFileSerializer(serializers.ModelSerializer):
                     user = {"id": None, "name": None, "username": None}
                 ret["user"] = user
             elif field == "download_url":
-                ret["download_url"] = item(request)
+                key = self.context.get("datafile_keys", {}).get(data.id, None)
+                ret["download_url"] = item(request, key=key)
             else:
                 ret[str(field)] = getattr(data, field)
         return ret
 
     class Meta:  # noqa: D101
         model = DataFile
+        list_serializer_class = DataFileListSerializer
         fields = (
             "id",
             "basename",
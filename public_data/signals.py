@@ -1,7 +1,17 @@
-from django.db.models.signals import post_save
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from .models import Participant
+from private_sharing.models import (
+    DataRequestProject,
+    DataRequestProjectMember,
+    OAuth2DataRequestProject,
+    OnSiteDataRequestProject,
+    ProjectDataFile,
+    PublicDataFileIndex,
+)
+
+from .models import Participant, PublicDataAccess
 
 
 @receiver(post_save, sender=Participant)
@@ -18,3 +28,84 @@ def post_save_cb(sender, instance, created, raw, update_fields, **kwargs):
         for public_data_access in instance.publicdataaccess_set.all():
             public_data_access.is_public = False
             public_data_access.save(update_fields=["is_public"])
+
+
+@receiver(post_save, sender=PublicDataAccess)
+@receiver(post_delete, sender=PublicDataAccess)
+def public_data_access_index_cb(sender, instance, **kwargs):
+    """
+    Rebuild the PublicDataFileIndex rows for a member's files in a project when
+    their public sharing of that project changes.
+    """
+    if kwargs.get("raw"):
+        return
+
+    filters = {"user__member__public_data_participant": instance.participant_id}
+
+    try:
+        filters["direct_sharing_project"] = instance.project_membership.project_id
+    except ObjectDoesNotExist:
+        # The membership is being deleted along with us; refresh all of the
+        # participant's files instead.
+        pass
+
+    PublicDataFileIndex.refresh(**filters)
+
+
+@receiver(post_save, sender=PublicDataAccess)
+@receiver(post_delete, sender=PublicDataAccess)
+def public_data_access_count_cb(sender, instance, **kwargs):
+    """
+    Recount a project's public sharers when a member starts or stops sharing.
+    """
+    if kwargs.get("raw"):
+        return
+
+    try:
+        project_id = instance.project_membership.project_id
+    except ObjectDoesNotExist:
+        # The membership is being deleted along with us and will recount
+        return
+
+    DataRequestProject.update_member_counts([project_id])
+
+
+@receiver(post_save, sender=ProjectDataFile)
+def project_data_file_index_cb(sender, instance, raw, **kwargs):
+    """
+    Add or remove a file from the PublicDataFileIndex, e.g. when it's completed.
+    """
+    if raw:
+        return
+
+    PublicDataFileIndex.refresh(id=instance.id)
+
+
+@receiver(post_save, sender=DataRequestProjectMember)
+def project_member_index_cb(sender, instance, raw, **kwargs):
+    """
+    Copy a membership's visibility to its PublicDataFileIndex rows.
+    """
+    if raw:
+        return
+
+    PublicDataFileIndex.objects.filter(
+        project_id=instance.project_id, user_id=instance.member.user_id
+    ).exclude(membership_visible=instance.visible).update(
+        membership_visible=instance.visible
+    )
+
+
+@receiver(post_save, sender=DataRequestProject)
+@receiver(post_save, sender=OAuth2DataRequestProject)
+@receiver(post_save, sender=OnSiteDataRequestProject)
+def project_index_cb(sender, instance, raw, **kwargs):
+    """
+    Copy a project's no_public_data setting to its PublicDataFileIndex rows.
+    """
+    if raw:
+        return
+
+    PublicDataFileIndex.objects.filter(project_id=instance.id).exclude(
+        no_public_data=instance.no_public_data
+    ).update(no_public_data=instance.no_public_data)
@@ -3,7 +3,11 @@ from django.test import TestCase, TransactionTestCase
 
 from common.testing import SmokeTestCase
 from open_humans.models import Member
-from private_sharing.models import DataRequestProject, DataRequestProjectMember
+from private_sharing.models import (
+    DataRequestProject,
+    DataRequestProjectMember,
+    ProjectDataFile,
+)
 
 from .models import Participant, PublicDataAccess
 
@@ -51,6 +55,32 @@ class PublicDataTestCase(TransactionTestCase):
             user.member.public_data_participant.publicdataaccess_set.all()[0].is_public
         )
 
+    def test_public_data_file_index_follows_sharing(self):
+        user = UserModel.objects.get(username="test-user")
+        data_file = ProjectDataFile(
+            direct_sharing_project_id=1, user=user, completed=True, file=""
+        )
+        data_file.save()
+
+        self.assertEqual(list(ProjectDataFile.objects.public()), [data_file])
+        self.assertTrue(data_file.is_public)
+
+        project = DataRequestProject.objects.get(id=1)
+        project.no_public_data = True
+        project.save()
+
+        self.assertFalse(
+            ProjectDataFile.objects.public()
+            .filter(public_index__no_public_data=False)
+            .exists()
+        )
+
+        user.member.public_data_participant.enrolled = False
+        user.member.public_data_participant.save()
+
+        self.assertFalse(ProjectDataFile.objects.public().exists())
+        self.assertFalse(data_file.is_public)
+
 
 class SmokeTests(SmokeTestCase):
     """